@@ -0,0 +1,492 @@
+from array import array
+
+from rb_tree import _MISSING
+
+# Slot 0 of every array stands in for the sentinel: it is black and its
+# links point back at itself
+_SENTINEL = 0
+_RED = 1
+_BLACK = 0
+
+
+class array_node(object):
+    """
+    A view of one slot of an array_rb_tree, shaped like rb_tree's Node
+
+    ...
+
+    The view only holds the tree and the slot index, so it goes stale once
+    the slot is deleted and may then be reused by a later insert.
+
+    Attributes
+    ----------
+    self.tree: array_rb_tree
+        The tree the slot belongs to
+    self.index: int
+        The slot, where 0 is the sentinel
+    """
+    __slots__ = ('tree', 'index')
+
+    def __init__(self, tree, index):
+        self.tree = tree
+        self.index = index
+
+    def __eq__(self, other):
+        return isinstance(other, array_node) and other.tree is self.tree and other.index == self.index
+
+    def __hash__(self):
+        return hash((id(self.tree), self.index))
+
+    @property
+    def data(self):
+        return None if self.index == _SENTINEL else self.tree._keys[self.index]
+
+    @property
+    def red(self):
+        return self.tree._colors[self.index] == _RED
+
+    @property
+    def color(self):
+        return 'red' if self.tree._colors[self.index] == _RED else 'black'
+
+    @property
+    def left(self):
+        return array_node(self.tree, self.tree._left[self.index])
+
+    @property
+    def right(self):
+        return array_node(self.tree, self.tree._right[self.index])
+
+    @property
+    def parent(self):
+        return array_node(self.tree, self.tree._parent[self.index])
+
+
+class array_rb_tree(object):
+    """
+    A red black tree stored as a struct of arrays instead of linked Node objects.
+
+    ...
+
+    Keys, child and parent links and colors live in preallocated parallel
+    buffers indexed by slot number, with slot 0 as the sentinel. Links are
+    4-byte integers and colors a single byte, so a node with a typed key
+    costs about 21 bytes instead of a full Python object, and the tree holds
+    no objects for the cycle collector to scan. Deleted slots go on a free
+    list threaded through the left links and are reused by later inserts.
+
+    Attributes
+    ----------
+    Preorder: int
+        For traversing tree in preorder
+    Inorder: int
+        For traversing tree in inorder
+    Postorder: int
+        For traversing tree in postorder
+    self.root: int
+        Slot of the root, 0 when the tree is empty
+    self.sentinel: array_node
+        View of the sentinel slot
+
+    Methods
+    -------
+    __len__():
+        Number of nodes in the tree
+    __iter__(), inorder(), preorder(), postorder():
+        Traversals yielding array_node views
+    keys():
+        Yields the keys in order without creating views
+    find_min():
+        Finds node with minimum value in tree
+    find_node(arg1 = data, arg2 = default):
+        Finds node with value specified by data
+    get(arg1 = data, arg2 = default), __contains__(arg1 = data):
+        Lookups that never raise
+    insert(arg1 = data):
+        Insert a node that contains the given data into the tree
+    delete(arg1 = data):
+        Deletes node with given data
+    """
+
+    PREORDER = 1
+    INORDER = 2
+    POSTORDER = 3
+
+    def __init__(self, capacity=16, typecode=None):
+        """
+        Parameters
+        ----------
+        capacity : int
+            Number of nodes to preallocate room for
+        typecode : str, optional
+            array typecode for the keys, such as 'q' or 'd'. Keys are kept
+            in a plain list of objects if it is not given
+        """
+        self._typecode = typecode
+        self._keys = [None] if typecode is None else array(typecode, [0])
+        self._left = array('i', [_SENTINEL])
+        self._right = array('i', [_SENTINEL])
+        self._parent = array('i', [_SENTINEL])
+        self._colors = bytearray([_BLACK])
+        self._top = 1       # first slot never used so far
+        self._free = 0      # head of the free list, 0 if it is empty
+        self._count = 0
+        self.root = _SENTINEL
+        self.sentinel = array_node(self, _SENTINEL)
+        # Slot 0 is the sentinel, so capacity nodes take capacity + 1 slots
+        self.__grow(capacity + 1)
+
+    def __grow(self, capacity):
+        # Extends every buffer in place to hold capacity slots
+        extra = capacity - len(self._left)
+        if extra <= 0:
+            return
+        if self._typecode is None:
+            self._keys.extend([None] * extra)
+        else:
+            self._keys.frombytes(bytes(extra * self._keys.itemsize))
+        links = bytes(extra * self._left.itemsize)
+        self._left.frombytes(links)
+        self._right.frombytes(links)
+        self._parent.frombytes(links)
+        self._colors.extend(bytes(extra))
+
+    def __alloc(self, data, parent):
+        # Takes a slot from the free list, or the next unused one, for a new red node.
+        # The key is stored first, so a key the typed buffer refuses leaves the slot free
+        slot = self._free
+        if slot:
+            self._keys[slot] = data
+            self._free = self._left[slot]
+        else:
+            slot = self._top
+            if slot == len(self._left):
+                self.__grow(2 * slot)
+            self._keys[slot] = data
+            self._top = slot + 1
+        self._left[slot] = _SENTINEL
+        self._right[slot] = _SENTINEL
+        self._parent[slot] = parent
+        self._colors[slot] = _RED
+        return slot
+
+    def __release(self, slot):
+        # Puts a slot on the free list and drops its key
+        self._keys[slot] = None if self._typecode is None else 0
+        self._left[slot] = self._free
+        self._free = slot
+
+    def __len__(self):
+        return self._count
+
+    def __iter__(self):
+        return self.inorder()
+
+    def inorder(self):
+        return self.__traverse(self.root, array_rb_tree.INORDER)
+
+    def preorder(self):
+        return self.__traverse(self.root, array_rb_tree.PREORDER)
+
+    def postorder(self):
+        return self.__traverse(self.root, array_rb_tree.POSTORDER)
+
+    def keys(self):
+        keys = self._keys
+        for slot in self.__slots(self.root, array_rb_tree.INORDER):
+            yield keys[slot]
+
+    def __traverse(self, slot, traversal_type):
+        for slot in self.__slots(slot, traversal_type):
+            yield array_node(self, slot)
+
+    def __slots(self, slot, traversal_type):
+        # Walks the subtree rooted at slot with an explicit stack, yielding slot numbers
+        left = self._left
+        right = self._right
+        stack = []
+        if traversal_type == self.INORDER:
+            while True:
+                while slot:
+                    stack.append(slot)
+                    slot = left[slot]
+                if not stack:
+                    return
+                slot = stack.pop()
+                yield slot
+                slot = right[slot]
+        elif traversal_type == self.PREORDER:
+            if slot:
+                stack.append(slot)
+            while stack:
+                slot = stack.pop()
+                yield slot
+                if right[slot]:
+                    stack.append(right[slot])
+                if left[slot]:
+                    stack.append(left[slot])
+        else:
+            last = _SENTINEL
+            while stack or slot:
+                if slot:
+                    stack.append(slot)
+                    slot = left[slot]
+                else:
+                    top = stack[-1]
+                    if right[top] and right[top] != last:
+                        slot = right[top]
+                    else:
+                        last = stack.pop()
+                        yield last
+
+    def find_min(self):
+        left = self._left
+        slot = self.root
+        while left[slot]:
+            slot = left[slot]
+        return array_node(self, slot)
+
+    def find_node(self, data, default=_MISSING):
+        slot = self.__get(data)
+        if slot:
+            return array_node(self, slot)
+        if default is not _MISSING:
+            return default
+        if not self.root:
+            raise KeyError('Error, tree has no root')
+        raise KeyError('Error, data not found')
+
+    def get(self, data, default=None):
+        slot = self.__get(data)
+        return array_node(self, slot) if slot else default
+
+    def __contains__(self, data):
+        return self.__get(data) != _SENTINEL
+
+    def __get(self, data):
+        # Returns the slot holding data, or 0 if there is none
+        keys = self._keys
+        left = self._left
+        right = self._right
+        slot = self.root
+        while slot:
+            key = keys[slot]
+            if key == data:
+                return slot
+            slot = left[slot] if data < key else right[slot]
+        return _SENTINEL
+
+    def insert(self, data):
+        keys = self._keys
+        left = self._left
+        right = self._right
+        parent = _SENTINEL
+        slot = self.root
+        go_left = False
+        while slot:
+            parent = slot
+            go_left = data < keys[slot]
+            slot = left[slot] if go_left else right[slot]
+        slot = self.__alloc(data, parent)
+        if not parent:
+            self.root = slot
+        elif go_left:
+            left[parent] = slot
+        else:
+            right[parent] = slot
+        self._count += 1
+        self.__insert_fixup(slot)
+
+    def __left_rotate(self, x):
+        left = self._left
+        right = self._right
+        parent = self._parent
+        y = right[x]
+        right[x] = left[y]
+        if left[y]:
+            parent[left[y]] = x
+        x_parent = parent[x]
+        parent[y] = x_parent
+        if not x_parent:
+            self.root = y
+        elif x == left[x_parent]:
+            left[x_parent] = y
+        else:
+            right[x_parent] = y
+        left[y] = x
+        parent[x] = y
+
+    def __right_rotate(self, x):
+        left = self._left
+        right = self._right
+        parent = self._parent
+        y = left[x]
+        left[x] = right[y]
+        if right[y]:
+            parent[right[y]] = x
+        x_parent = parent[x]
+        parent[y] = x_parent
+        if not x_parent:
+            self.root = y
+        elif x == left[x_parent]:
+            left[x_parent] = y
+        else:
+            right[x_parent] = y
+        right[y] = x
+        parent[x] = y
+
+    def __insert_fixup(self, z):
+        # Same case analysis as rb_tree's __rb_insert_fixup, on slot numbers
+        left = self._left
+        right = self._right
+        parent = self._parent
+        colors = self._colors
+        while colors[parent[z]] == _RED:
+            p = parent[z]
+            g = parent[p]
+            if p == left[g]:
+                y = right[g]
+                if colors[y] == _RED:
+                    colors[p] = _BLACK
+                    colors[y] = _BLACK
+                    colors[g] = _RED
+                    z = g
+                else:
+                    if z == right[p]:
+                        z = p
+                        self.__left_rotate(z)
+                        p = parent[z]
+                        g = parent[p]
+                    colors[p] = _BLACK
+                    colors[g] = _RED
+                    self.__right_rotate(g)
+            else:
+                y = left[g]
+                if colors[y] == _RED:
+                    colors[p] = _BLACK
+                    colors[y] = _BLACK
+                    colors[g] = _RED
+                    z = g
+                else:
+                    if z == left[p]:
+                        z = p
+                        self.__right_rotate(z)
+                        p = parent[z]
+                        g = parent[p]
+                    colors[p] = _BLACK
+                    colors[g] = _RED
+                    self.__left_rotate(g)
+        colors[self.root] = _BLACK
+
+    def __replace(self, original, replacer):
+        # Puts replacer where original hangs in the tree
+        parent = self._parent
+        original_parent = parent[original]
+        if not original_parent:
+            self.root = replacer
+        elif original == self._left[original_parent]:
+            self._left[original_parent] = replacer
+        else:
+            self._right[original_parent] = replacer
+        if replacer:
+            parent[replacer] = original_parent
+
+    def delete(self, data):
+        """
+        Deletes node with given data
+
+        Raises
+        ------
+        KeyError
+            If node with given data does not exist in the tree
+        """
+        node = self.__get(data)
+        if not node:
+            raise KeyError('Error, data not found')
+        left = self._left
+        right = self._right
+        parent = self._parent
+        colors = self._colors
+        original_red = colors[node] == _RED
+        if not left[node]:
+            x = right[node]
+            x_parent = parent[node]
+            self.__replace(node, x)
+        elif not right[node]:
+            x = left[node]
+            x_parent = parent[node]
+            self.__replace(node, x)
+        else:
+            successor = right[node]
+            while left[successor]:
+                successor = left[successor]
+            original_red = colors[successor] == _RED
+            x = right[successor]
+            if parent[successor] == node:
+                x_parent = successor
+            else:
+                x_parent = parent[successor]
+                self.__replace(successor, x)
+                right[successor] = right[node]
+                parent[right[successor]] = successor
+            self.__replace(node, successor)
+            left[successor] = left[node]
+            parent[left[successor]] = successor
+            colors[successor] = colors[node]
+        self.__release(node)
+        self._count -= 1
+        if not original_red:
+            self.__delete_fixup(x, x_parent)
+
+    def __delete_fixup(self, x, x_parent):
+        # Same case analysis as rb_tree's __rb_delete_fixup, on slot numbers
+        left = self._left
+        right = self._right
+        parent = self._parent
+        colors = self._colors
+        while x != self.root and colors[x] == _BLACK:
+            if x == left[x_parent]:
+                w = right[x_parent]
+                if colors[w] == _RED:
+                    colors[w] = _BLACK
+                    colors[x_parent] = _RED
+                    self.__left_rotate(x_parent)
+                    w = right[x_parent]
+                if colors[left[w]] == _BLACK and colors[right[w]] == _BLACK:
+                    colors[w] = _RED
+                    x = x_parent
+                    x_parent = parent[x]
+                else:
+                    if colors[right[w]] == _BLACK:
+                        colors[left[w]] = _BLACK
+                        colors[w] = _RED
+                        self.__right_rotate(w)
+                        w = right[x_parent]
+                    colors[w] = colors[x_parent]
+                    colors[x_parent] = _BLACK
+                    colors[right[w]] = _BLACK
+                    self.__left_rotate(x_parent)
+                    x = self.root
+            else:
+                w = left[x_parent]
+                if colors[w] == _RED:
+                    colors[w] = _BLACK
+                    colors[x_parent] = _RED
+                    self.__right_rotate(x_parent)
+                    w = left[x_parent]
+                if colors[right[w]] == _BLACK and colors[left[w]] == _BLACK:
+                    colors[w] = _RED
+                    x = x_parent
+                    x_parent = parent[x]
+                else:
+                    if colors[left[w]] == _BLACK:
+                        colors[right[w]] = _BLACK
+                        colors[w] = _RED
+                        self.__left_rotate(w)
+                        w = left[x_parent]
+                    colors[w] = colors[x_parent]
+                    colors[x_parent] = _BLACK
+                    colors[left[w]] = _BLACK
+                    self.__right_rotate(x_parent)
+                    x = self.root
+        colors[x] = _BLACK
@@ -0,0 +1,631 @@
+"""
+Micro-benchmarks for rb_tree.
+
+Run with ``python bench_rb_tree.py [n]``. Every benchmark only uses the public
+surface of rb_tree so the numbers can be compared across revisions.
+"""
+import asyncio
+import copy
+import gc
+import heapq
+import operator
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from operator import itemgetter
+
+from array_rb_tree import array_rb_tree
+from rb_async import async_rb_tree
+from rb_concurrent import concurrent_rb_tree
+from rb_durable import durable_rb_tree, FSYNC_ALWAYS, FSYNC_GROUP, FSYNC_NEVER
+from rb_interval import interval_rb_tree
+from rb_persistent import persistent_rb_tree
+from rb_sharded import sharded_rb_tree
+from rb_tree import monoid, rb_tree
+
+
+def timed(label, func, *args):
+    # Runs func once and prints how long it took
+    start = time.perf_counter()
+    result = func(*args)
+    elapsed = time.perf_counter() - start
+    print("{:<40} {:>10.3f} s".format(label, elapsed))
+    return result
+
+
+def bench_memory(n):
+    # Bytes allocated per node while building a tree of n random keys
+    keys = list(range(n))
+    random.shuffle(keys)
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    tree = rb_tree()
+    for key in keys:
+        tree.insert(key)
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    print("{:<40} {:>10.1f} B".format("bytes per node", (after - before) / n))
+    return tree
+
+
+def bench_insert_delete(n):
+    keys = list(range(n))
+    random.shuffle(keys)
+    tree = rb_tree()
+
+    def insert_all():
+        for key in keys:
+            tree.insert(key)
+
+    def delete_all():
+        for key in keys:
+            tree.delete(key)
+
+    timed("insert {} random keys".format(n), insert_all)
+    random.shuffle(keys)
+    timed("delete {} random keys".format(n), delete_all)
+
+
+def bench_lookup_and_iteration(n):
+    keys = list(range(n))
+    random.shuffle(keys)
+    tree = rb_tree()
+    for key in keys:
+        tree.insert(key)
+
+    def lookup_all():
+        for key in keys:
+            tree.find_node(key)
+
+    def iterate(traversal):
+        for _ in traversal():
+            pass
+
+    timed("find_node {} keys".format(n), lookup_all)
+    timed("inorder over {} keys".format(n), iterate, tree.inorder)
+    timed("preorder over {} keys".format(n), iterate, tree.preorder)
+    timed("postorder over {} keys".format(n), iterate, tree.postorder)
+
+
+def bench_misses(n):
+    # A cache-check workload where nine out of ten probes miss
+    tree = rb_tree()
+    for key in range(0, 20 * n, 20):
+        tree.insert(key)
+    probes = [random.randrange(20 * n) // 2 * 2 + (random.random() < 0.9) for _ in range(n)]
+
+    def probe_contains():
+        hits = 0
+        for key in probes:
+            if key in tree:
+                hits += 1
+        return hits
+
+    def probe_find_node():
+        hits = 0
+        for key in probes:
+            try:
+                tree.find_node(key)
+                hits += 1
+            except KeyError:
+                pass
+        return hits
+
+    timed("in, {} mostly-miss probes".format(n), probe_contains)
+    timed("find_node, {} mostly-miss probes".format(n), probe_find_node)
+
+
+def bench_range(n):
+    # 1000 narrow range scans, each covering about 100 keys
+    tree = rb_tree()
+    keys = list(range(n))
+    random.shuffle(keys)
+    for key in keys:
+        tree.insert(key)
+    starts = [random.randrange(n) for _ in range(1000)]
+
+    def scan_irange():
+        for lo in starts:
+            for _ in tree.irange(lo, lo + 100):
+                pass
+
+    def scan_filter():
+        for lo in starts[:10]:
+            [node for node in tree.inorder() if lo <= node.data < lo + 100]
+
+    timed("irange, 1000 scans of 100 keys", scan_irange)
+    timed("inorder filter, 10 scans of 100 keys", scan_filter)
+
+
+def bench_bulk_load(n):
+    keys = list(range(n))
+
+    def insert_sorted():
+        tree = rb_tree()
+        for key in keys:
+            tree.insert(key)
+
+    timed("insert {} sorted keys".format(n), insert_sorted)
+    timed("from_sorted {} keys".format(n), rb_tree.from_sorted, keys)
+
+
+def bench_batches(n):
+    # Micro-batches of 10k keys into a tree of n keys, both scattered at
+    # random and appended past the current maximum like timestamps
+    base = list(range(0, 2 * n, 2))
+    scattered = [[random.randrange(2 * n) for _ in range(10000)] for _ in range(5)]
+    appended = [list(range(2 * n + i * 10000, 2 * n + (i + 1) * 10000)) for i in range(5)]
+
+    def insert_loop(tree, batches):
+        for batch in batches:
+            for key in batch:
+                tree.insert(key)
+
+    def insert_batches(tree, batches):
+        for batch in batches:
+            tree.insert_many(batch)
+
+    for label, batches in (("scattered", scattered), ("appended", appended)):
+        for name, func in (("insert loop", insert_loop), ("insert_many", insert_batches)):
+            tree = rb_tree.from_sorted(base)
+            # Promote the freshly built nodes so collections do not skew the timing
+            gc.collect()
+            timed("{}, 5 x 10k {} into {}".format(name, label, n), func, tree, batches)
+
+
+def bench_set_algebra(n):
+    # Combining a tree of n keys with one of n / 100 keys
+    small = random.sample(range(2 * n), n // 100)
+
+    def reinsert():
+        tree = rb_tree.from_sorted(range(0, 2 * n, 2))
+        for key in small:
+            if key not in tree:
+                tree.insert(key)
+
+    def union():
+        tree = rb_tree.from_sorted(range(0, 2 * n, 2))
+        tree.union(small)
+
+    def difference():
+        tree = rb_tree.from_sorted(range(0, 2 * n, 2))
+        tree.difference(small)
+
+    def bulk():
+        rb_tree.from_sorted(range(0, 2 * n, 2))
+
+    timed("from_sorted alone, {} keys".format(n), bulk)
+    timed("insert loop union with {}".format(n // 100), reinsert)
+    timed("union with {}".format(n // 100), union)
+    timed("difference with {}".format(n // 100), difference)
+
+
+def bench_array_engine(n):
+    # Memory, insert time and full collection time of both engines
+    keys = list(range(n))
+    random.shuffle(keys)
+    for label, make in (("rb_tree", rb_tree), ("array_rb_tree 'q'", lambda: array_rb_tree(n, 'q'))):
+        gc.collect()
+        tracemalloc.start()
+        before = tracemalloc.get_traced_memory()[0]
+        start = time.perf_counter()
+        tree = make()
+        for key in keys:
+            tree.insert(key)
+        elapsed = time.perf_counter() - start
+        after = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        print("{:<40} {:>10.1f} B".format(label + " bytes per node", (after - before) / n))
+        print("{:<40} {:>10.3f} s".format(label + " insert", elapsed))
+        timed(label + " gc.collect()", gc.collect)
+        del tree
+
+
+def bench_snapshot(n):
+    # One million membership and rank probes, per key on the tree and
+    # batched on a frozen snapshot
+    tree = rb_tree.from_sorted(range(0, 2 * n, 2))
+    probes = [random.randrange(2 * n) for _ in range(1000000)]
+    snapshot = timed("freeze {} keys".format(n), tree.freeze)
+
+    def probe_tree():
+        return [key in tree for key in probes], [tree.rank(key) for key in probes]
+
+    def probe_snapshot():
+        return snapshot.contains_many(probes), snapshot.rank_many(probes)
+
+    timed("in + rank, 1M probes on rb_tree", probe_tree)
+    timed("contains_many + rank_many, 1M probes", probe_snapshot)
+
+
+def bench_save_load(n):
+    # Restarting from a saved tree against replaying every insert
+    keys = list(range(n))
+    random.shuffle(keys)
+    tree = rb_tree.from_sorted(range(n), range(n))
+    handle, path = tempfile.mkstemp()
+    os.close(handle)
+
+    def replay():
+        replayed = rb_tree()
+        for key in keys:
+            replayed.insert(key, key)
+
+    try:
+        timed("save {} keys and values".format(n), tree.save, path)
+        timed("replay {} inserts".format(n), replay)
+        timed("load {} keys, mmap".format(n), rb_tree.load, path)
+        snapshot = timed("load {} keys, read".format(n), rb_tree.load, path, False)
+        timed("thaw {} keys".format(n), snapshot.thaw)
+    finally:
+        os.remove(path)
+
+
+def recover(directory):
+    durable_rb_tree(directory).close()
+
+
+def bench_durable(n):
+    # Logged inserts under each fsync policy, then recovery from the log.
+    # Forcing every insert to disk is slow, so that policy gets fewer keys
+    keys = list(range(n))
+    random.shuffle(keys)
+    for policy, count in ((FSYNC_ALWAYS, min(n, 2000)), (FSYNC_GROUP, n), (FSYNC_NEVER, n)):
+        with tempfile.TemporaryDirectory() as directory:
+            tree = durable_rb_tree(directory, policy, checkpoint_every=n + 1)
+
+            def insert_all():
+                for key in keys[:count]:
+                    tree.insert(key)
+                tree.close()
+
+            timed("durable insert {}, fsync {}".format(count, policy), insert_all)
+            if policy == FSYNC_NEVER:
+                timed("recover {} logged inserts".format(count), recover, directory)
+                tree = durable_rb_tree(directory)
+                timed("checkpoint {} keys".format(count), tree.checkpoint)
+                tree.close()
+                timed("recover from checkpoint", recover, directory)
+
+
+def bench_concurrent(n):
+    # Lookups spread over 1, 2, 4 and 8 reader threads, alone and next to a
+    # writer. Reads only scale on a free-threaded build of CPython
+    tree = concurrent_rb_tree(rb_tree.from_sorted(range(0, 2 * n, 2)))
+    probes = [random.randrange(2 * n) for _ in range(200000)]
+    gil = getattr(sys, "_is_gil_enabled", lambda: True)()
+    print("GIL {}".format("enabled" if gil else "disabled"))
+
+    def read(part):
+        for key in part:
+            key in tree
+
+    def write(stop):
+        # A batch of 50 inserts every millisecond
+        key = 2 * n + 1
+        while not stop.wait(0.001):
+            tree.insert_many(range(key, key + 100, 2))
+            key += 100
+
+    for writing in (False, True):
+        for count in (1, 2, 4, 8):
+            stop = threading.Event()
+            threads = [threading.Thread(target=read, args=(probes[i::count],)) for i in range(count)]
+            writer = threading.Thread(target=write, args=(stop,))
+
+            def run():
+                if writing:
+                    writer.start()
+                for thread in threads:
+                    thread.start()
+                for thread in threads:
+                    thread.join()
+                stop.set()
+                if writing:
+                    writer.join()
+
+            label = "200k lookups, {} readers{}".format(count, ", 1 writer" if writing else "")
+            timed(label, run)
+
+
+def bench_persistent(n):
+    # Keeping every version across inserts into a tree of n keys: a
+    # deepcopy of rb_tree per version against a persistent insert
+    tree = rb_tree.from_sorted(range(0, 2 * n, 2))
+    persistent = persistent_rb_tree.from_sorted(range(0, 2 * n, 2))
+    keys = [random.randrange(n) * 2 + 1 for _ in range(10)]
+
+    def deepcopy_versions():
+        versions = [tree]
+        for key in keys:
+            version = copy.deepcopy(versions[-1])
+            version.insert(key)
+            versions.append(version)
+
+    def persistent_versions():
+        versions = [persistent]
+        for _ in range(1000):
+            for key in keys:
+                versions.append(versions[-1].insert(key))
+
+    timed("deepcopy + insert, 10 versions", deepcopy_versions)
+    timed("persistent insert, 10000 versions", persistent_versions)
+
+
+def bench_sharded(n):
+    # Batched inserts and lookups of n keys over 1, 2 and 4 shards, next to
+    # one rb_tree in this process. Shards only scale with free cores
+    keys = list(range(n))
+    random.shuffle(keys)
+    print("{} cores".format(os.cpu_count()))
+    tree = rb_tree()
+    timed("rb_tree insert_many {}".format(n), tree.insert_many, keys)
+    timed("rb_tree get {}".format(n), lambda: [tree.get(key) for key in keys])
+    for shards in (1, 2, 4):
+        with sharded_rb_tree(shards) as sharded:
+            sharded.insert_many(keys[:n // 10])
+            timed("{} shards insert_many {}".format(shards, n), sharded.insert_many, keys[n // 10:])
+            timed("{} shards get_many {}".format(shards, n), sharded.get_many, keys)
+
+
+def bench_async(n):
+    # How late a coroutine that wakes every millisecond runs while another
+    # one scans or bulk loads n keys, blocking and through async_rb_tree
+    tree = async_rb_tree(rb_tree.from_sorted(range(n)))
+
+    async def blocking_scan():
+        for _ in tree.tree.inorder():
+            pass
+
+    async def async_scan():
+        async for _ in tree:
+            pass
+
+    async def blocking_load():
+        rb_tree.from_sorted(range(n))
+
+    async def async_load():
+        await tree.load_sorted(range(n))
+
+    async def measure(work):
+        lags = []
+
+        async def ticker():
+            loop = asyncio.get_running_loop()
+            while True:
+                start = loop.time()
+                await asyncio.sleep(0.001)
+                lags.append(loop.time() - start - 0.001)
+
+        task = asyncio.ensure_future(ticker())
+        await asyncio.sleep(0.01)
+        await work()
+        # Let the ticker record the wake-up that work delayed
+        await asyncio.sleep(0.01)
+        task.cancel()
+        lags.sort()
+        return lags[int(len(lags) * 0.99)] * 1000, lags[-1] * 1000
+
+    for label, work in (("inorder", blocking_scan), ("async for", async_scan),
+                        ("from_sorted", blocking_load), ("load_sorted", async_load)):
+        p99, worst = asyncio.run(measure(work))
+        print("{:<40} {:>7.1f} ms p99 {:>7.1f} ms max".format("{} {}, tick lag".format(label, n), p99, worst))
+
+
+class _by_age(object):
+    # What ordering records took before key=: a wrapper with a Python __lt__
+    __slots__ = ('record',)
+
+    def __init__(self, record):
+        self.record = record
+
+    def __lt__(self, other):
+        return self.record[1] < other.record[1]
+
+    def __eq__(self, other):
+        return self.record[1] == other.record[1]
+
+
+def bench_key(n):
+    # Inserting and looking up n records by one field
+    records = [("name{}".format(i), i) for i in range(n)]
+    random.shuffle(records)
+
+    def wrapped():
+        tree = rb_tree()
+        for record in records:
+            tree.insert(_by_age(record))
+        for record in records:
+            tree.find_node(_by_age(record))
+
+    def keyed():
+        tree = rb_tree(key=itemgetter(1))
+        for record in records:
+            tree.insert(record)
+        for record in records:
+            tree.find_key(record[1])
+
+    def reversed_keyed():
+        tree = rb_tree(key=itemgetter(1), reverse=True)
+        for record in records:
+            tree.insert(record)
+        for record in records:
+            tree.find_key(record[1])
+
+    timed("__lt__ wrapper, {} records".format(n), wrapped)
+    timed("key=itemgetter(1), {} records".format(n), keyed)
+    timed("key= and reverse=True, {} records".format(n), reversed_keyed)
+
+
+def height(tree):
+    # Number of nodes on the longest path down from the root
+    level = [tree.root] if tree.root is not tree.sentinel else []
+    levels = 0
+    while level:
+        levels += 1
+        level = [child for node in level for child in (node.left, node.right) if child is not tree.sentinel]
+    return levels
+
+
+def bench_duplicates(n):
+    # Inserting n timestamps repeated about 100 times each, with a node per
+    # insert and with one counted node per timestamp
+    stamps = [random.randrange(max(n // 100, 1)) for _ in range(n)]
+
+    def build(duplicates):
+        tree = rb_tree(duplicates=duplicates)
+        for stamp in stamps:
+            tree.insert(stamp)
+        return tree
+
+    for label, duplicates in [("ALLOW", rb_tree.ALLOW), ("COUNT", rb_tree.COUNT)]:
+        tree = timed("insert {} duplicates, {}".format(n, label), build, duplicates)
+        print("{:<40} {:>10} nodes, height {}".format("  " + label, sum(1 for _ in tree), height(tree)))
+        timed("delete {} duplicates, {}".format(n, label), tree.delete_many, stamps[:n // 10])
+
+
+def bench_interval(n):
+    # 100 overlap queries over n short intervals, by a scan of the whole
+    # tree and by the interval tree
+    intervals = []
+    for _ in range(n):
+        start = random.randrange(n)
+        intervals.append((start, start + random.randrange(100)))
+    queries = [random.randrange(n) for _ in range(100)]
+    tree = interval_rb_tree()
+    timed("interval insert_many {}".format(n), tree.insert_many, intervals)
+
+    def scanned():
+        for point in queries:
+            [node for node in tree.inorder() if node.data[0] <= point + 10 and point <= node.data[1]]
+
+    def queried():
+        for point in queries:
+            list(tree.overlapping(point, point + 10))
+
+    timed("100 overlaps, inorder scan", scanned)
+    timed("100 overlaps, overlapping", queried)
+
+
+def bench_aggregate(n):
+    # 100 range sums over n values, by a loop over irange and by reduce_range
+    tree = rb_tree.from_sorted(range(n), [random.random() for _ in range(n)], monoid=monoid(operator.add, 0.0))
+    ranges = [sorted(random.randrange(n) for _ in range(2)) for _ in range(100)]
+
+    def looped():
+        for lo, hi in ranges:
+            sum(node.value for node in tree.irange(lo, hi))
+
+    def reduced():
+        for lo, hi in ranges:
+            tree.reduce_range(lo, hi)
+
+    timed("100 range sums, irange loop", looped)
+    timed("100 range sums, reduce_range", reduced)
+    keys = list(range(n))
+    random.shuffle(keys)
+
+    def inserted():
+        summed = rb_tree(monoid=monoid(operator.add, 0))
+        for key in keys:
+            summed.insert(key, key)
+
+    timed("insert {} with a monoid".format(n), inserted)
+
+
+def bench_priority_queue(n):
+    # n pushes then n pops of the smallest, with heapq and with rb_tree
+    keys = [random.random() for _ in range(n)]
+
+    def heap():
+        queue = []
+        for key in keys:
+            heapq.heappush(queue, key)
+        while queue:
+            heapq.heappop(queue)
+
+    def tree():
+        queue = rb_tree()
+        for key in keys:
+            queue.insert(key)
+        while len(queue):
+            queue.pop_min()
+
+    timed("heapq push/pop {}".format(n), heap)
+    timed("rb_tree insert/pop_min {}".format(n), tree)
+    queue = rb_tree.from_sorted(sorted(keys))
+    timed("rb_tree pop_n_smallest {}".format(n // 2), queue.pop_n_smallest, n // 2)
+    timed("100000 find_max", lambda: [queue.find_max() for _ in range(100000)])
+
+
+def bench_handles(n):
+    # n decrease-keys, by delete and insert and by update_key on the handles
+    keys = random.sample(range(4 * n), n)
+    moves = [random.randrange(n) for _ in range(n)]
+
+    def by_data():
+        tree = rb_tree()
+        current = list(keys)
+        for key in current:
+            tree.insert(key)
+        for i in moves:
+            tree.delete(current[i])
+            current[i] -= 0.5
+            tree.insert(current[i])
+
+    def by_handle():
+        tree = rb_tree()
+        handles = [tree.insert(key) for key in keys]
+        for i in moves:
+            tree.update_key(handles[i], handles[i].data - 0.5)
+
+    timed("decrease-key {}, delete and insert".format(n), by_data)
+    timed("decrease-key {}, update_key".format(n), by_handle)
+
+
+def bench_pool(n):
+    # n insert and delete pairs on a tree of n nodes, with and without a node pool
+    keys = random.sample(range(4 * n), n)
+    churn = [random.randrange(4 * n) for _ in range(n)]
+
+    def run(pool_size):
+        tree = rb_tree.from_iterable(keys, pool_size=pool_size)
+        for key in churn:
+            tree.insert(key)
+            tree.pop_min()
+        return tree
+
+    timed("churn {}, no pool".format(n), run, 0)
+    tree = timed("churn {}, pool of 1024".format(n), run, 1024)
+    print("  reuse rate {:.1%}".format(tree.pool_stats()['reuse_rate']))
+
+
+if __name__ == "__main__":
+    size = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    bench_memory(size)
+    bench_insert_delete(size)
+    bench_lookup_and_iteration(size)
+    bench_misses(size)
+    bench_range(size)
+    bench_bulk_load(size)
+    bench_batches(size)
+    bench_set_algebra(size)
+    bench_array_engine(size)
+    bench_snapshot(size)
+    bench_save_load(size)
+    bench_durable(size)
+    bench_concurrent(size)
+    bench_persistent(size)
+    bench_sharded(size)
+    bench_async(size)
+    bench_key(size)
+    bench_duplicates(size)
+    bench_interval(size)
+    bench_aggregate(size)
+    bench_priority_queue(size)
+    bench_handles(size)
+    bench_pool(size)
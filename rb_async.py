@@ -0,0 +1,171 @@
+import asyncio
+from itertools import islice
+
+from rb_tree import rb_tree
+
+
+class async_rb_tree(object):
+    """
+    An rb_tree for asyncio code that never holds the event loop for long.
+
+    ...
+
+    Scans and batches are cut into chunks of chunk_size nodes and hand the
+    loop back after every chunk, so other coroutines wait for one chunk at
+    most rather than the whole scan. Bulk loads, saving and set algebra run
+    in executor, or the loop's default thread pool. An asyncio.Lock keeps
+    the chunks and the offloaded work from interleaving with each other.
+    A scan picks up after the last node it yielded, so it sees the changes
+    made between its chunks past that point, like iterating a dict that is
+    not resized.
+
+    Attributes
+    ----------
+    self.tree: rb_tree
+        The tree, only to be touched through this class while in use
+    self.chunk_size: int
+        Number of nodes handled between two turns of the loop
+    self.executor: concurrent.futures.Executor or None
+        Where heavy work runs, None for the loop's default thread pool
+
+    Methods
+    -------
+    __len__():
+        Number of nodes
+    get(arg1 = data, arg2 = default), contains(arg1 = data):
+        Lookups
+    insert(arg1 = data, arg2 = value), delete(arg1 = data):
+        Single changes
+    insert_many(arg1 = iterable, arg2 = values), delete_many(arg1 = iterable):
+        Batches, applied chunk by chunk
+    irange(arg1 = lo, arg2 = hi, arg3 = inclusive, arg4 = reverse), __aiter__():
+        Nodes in order with async for, chunk by chunk
+    load_sorted(arg1 = iterable, arg2 = values):
+        Replaces the contents with a bulk load run in executor
+    save(arg1 = path):
+        rb_tree.save run in executor
+    union(arg1 = other), intersection(arg1 = other), difference(arg1 = other):
+        In place set algebra run in executor
+    run(arg1 = func, args):
+        Runs func(tree, *args) in executor
+    """
+
+    def __init__(self, tree=None, chunk_size=1000, executor=None):
+        self.tree = rb_tree() if tree is None else tree
+        self.chunk_size = chunk_size
+        self.executor = executor
+        self._lock = asyncio.Lock()
+
+    def __len__(self):
+        return len(self.tree)
+
+    async def get(self, data, default=None):
+        async with self._lock:
+            return self.tree.get(data, default)
+
+    async def contains(self, data):
+        async with self._lock:
+            return data in self.tree
+
+    async def insert(self, data, value=None):
+        async with self._lock:
+            self.tree.insert(data, value)
+
+    async def delete(self, data):
+        async with self._lock:
+            self.tree.delete(data)
+
+    async def insert_many(self, iterable, values=None):
+        data = list(iterable)
+        values = None if values is None else list(values)
+        for start in range(0, len(data), self.chunk_size):
+            stop = start + self.chunk_size
+            async with self._lock:
+                self.tree.insert_many(data[start:stop], None if values is None else values[start:stop])
+            await asyncio.sleep(0)
+
+    async def delete_many(self, iterable):
+        data = list(iterable)
+        count = 0
+        for start in range(0, len(data), self.chunk_size):
+            async with self._lock:
+                count += self.tree.delete_many(data[start:start + self.chunk_size])
+            await asyncio.sleep(0)
+        return count
+
+    def __aiter__(self):
+        return self.irange()
+
+    async def irange(self, lo=None, hi=None, inclusive=(True, False), reverse=False):
+        """
+        Yields the nodes with data between lo and hi in order, like
+        rb_tree.irange, for use with async for. Each chunk is looked up
+        afresh from the last key yielded, skipping the nodes with that key
+        already yielded, so changes between chunks cannot break the scan.
+
+        Parameters
+        ----------
+        lo : optional
+            Lower bound, None for no lower bound
+        hi : optional
+            Upper bound, None for no upper bound
+        inclusive : (bool, bool)
+            Whether lo and hi themselves are included
+        reverse : bool
+            Yield from hi down to lo instead
+        """
+        size = self.chunk_size
+        nodes = None
+        last = None
+        repeats = 0
+        while True:
+            async with self._lock:
+                if nodes is None:
+                    nodes = self.tree.irange(lo, hi, inclusive, reverse)
+                elif reverse:
+                    nodes = self.tree.irange(lo, last, (inclusive[0], True), True)
+                else:
+                    nodes = self.tree.irange(last, hi, (True, inclusive[1]))
+                fetched = list(islice(nodes, repeats + size))
+            chunk = fetched[repeats:]
+            for node in chunk:
+                yield node
+            if len(chunk) < size:
+                return
+            last_node = chunk[-1]
+            last = last_node.data
+            repeats = 0
+            for node in reversed(fetched):
+                if node.key != last_node.key:
+                    break
+                repeats += 1
+            await asyncio.sleep(0)
+
+    async def load_sorted(self, iterable, values=None):
+        # Builds the new tree, with the settings of the current one, in executor and
+        # swaps it in once it is done
+        tree = await asyncio.get_running_loop().run_in_executor(
+            self.executor, self.tree.like, list(iterable), None if values is None else list(values))
+        async with self._lock:
+            self.tree = tree
+
+    async def save(self, path):
+        await self.run(rb_tree.save, path)
+
+    # Set algebra changes the tree in place, so executor must be a thread pool
+    async def union(self, other):
+        await self.run(rb_tree.union, other)
+        return self
+
+    async def intersection(self, other):
+        await self.run(rb_tree.intersection, other)
+        return self
+
+    async def difference(self, other):
+        await self.run(rb_tree.difference, other)
+        return self
+
+    async def run(self, func, *args):
+        # Runs func(tree, *args) in executor with the lock held, and returns its result
+        async with self._lock:
+            return await asyncio.get_running_loop().run_in_executor(self.executor, func, self.tree, *args)
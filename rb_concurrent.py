@@ -0,0 +1,277 @@
+import contextlib
+import threading
+
+from rb_tree import rb_tree
+
+
+class rw_lock(object):
+    """
+    A readers-writer lock: any number of readers at once, or one writer.
+
+    ...
+
+    Waiting writers keep new readers out, so a steady stream of readers
+    cannot starve them, and the readers that waited during a write are let
+    in before the next writer, so a steady stream of writers cannot starve
+    readers either. Neither side is reentrant: a thread that holds the lock
+    must not acquire it again.
+
+    Methods
+    -------
+    acquire_read(), release_read():
+        Takes and gives back a shared hold
+    acquire_write(), release_write():
+        Takes and gives back the exclusive hold
+    read_locked(), write_locked():
+        Context managers for the two holds
+    """
+
+    def __init__(self):
+        self._condition = threading.Condition(threading.Lock())
+        self._readers = 0
+        self._writer = False
+        self._waiting_writers = 0
+        # Counts the writes released, so a reader knows whether one ended while it waited
+        self._writes = 0
+
+    def acquire_read(self):
+        with self._condition:
+            writes = self._writes
+            # Only a reader that waited through a write may pass the writers waiting after it
+            while self._writer or (self._waiting_writers and self._writes == writes):
+                self._condition.wait()
+            self._readers += 1
+
+    def release_read(self):
+        with self._condition:
+            self._readers -= 1
+            if not self._readers:
+                self._condition.notify_all()
+
+    def acquire_write(self):
+        with self._condition:
+            self._waiting_writers += 1
+            while self._writer or self._readers:
+                self._condition.wait()
+            self._waiting_writers -= 1
+            self._writer = True
+
+    def release_write(self):
+        with self._condition:
+            self._writer = False
+            self._writes += 1
+            self._condition.notify_all()
+
+    @contextlib.contextmanager
+    def read_locked(self):
+        self.acquire_read()
+        try:
+            yield
+        finally:
+            self.release_read()
+
+    @contextlib.contextmanager
+    def write_locked(self):
+        self.acquire_write()
+        try:
+            yield
+        finally:
+            self.release_write()
+
+
+class concurrent_rb_tree(object):
+    """
+    An rb_tree that can be shared between threads.
+
+    ...
+
+    Lookups run in parallel under the shared hold of an rw_lock and writers
+    take the exclusive hold one at a time, so a reader never sees a rotation
+    half done. Batch writes take the lock once for the whole batch. Reads
+    return data and values rather than nodes, since a node can be changed by
+    a writer as soon as the lock is released, and iteration runs over a copy
+    taken under one hold, so it sees the tree as it was at a single moment.
+
+    Attributes
+    ----------
+    self.tree: rb_tree
+        The shared tree, only to be touched inside read or write
+    self.lock: rw_lock
+        Guards tree
+
+    Methods
+    -------
+    read(), write():
+        Context managers that hold the lock and give the tree, for compound operations
+    __len__(), __contains__(arg1 = data), __getitem__(arg1 = data), get(arg1 = data, arg2 = default):
+        Lookups under the shared hold, get returning the value
+    floor(arg1 = data), ceiling(arg1 = data), lower(arg1 = data), higher(arg1 = data):
+        Neighbouring data under the shared hold, or None
+    select(arg1 = k), rank(arg1 = data), count_range(arg1 = lo, arg2 = hi, arg3 = inclusive):
+        Order statistics under the shared hold
+    keys(), values(), items(), irange(arg1 = lo, arg2 = hi, arg3 = inclusive, arg4 = reverse), __iter__():
+        Lists copied under one shared hold
+    snapshot():
+        A private rb_tree copy of the tree
+    insert(arg1 = data, arg2 = value), delete(arg1 = data), __setitem__(arg1 = data, arg2 = value), __delitem__(arg1 = data):
+        Writes under the exclusive hold
+    setdefault(arg1 = data, arg2 = default), pop(arg1 = data, arg2 = default):
+        Read-modify-writes under the exclusive hold
+    insert_many(arg1 = iterable, arg2 = values), delete_many(arg1 = iterable):
+        Batch writes under a single exclusive hold
+    union(arg1 = other), intersection(arg1 = other), difference(arg1 = other):
+        In place set algebra under a single exclusive hold
+    """
+
+    def __init__(self, tree=None):
+        self.tree = rb_tree() if tree is None else tree
+        self.lock = rw_lock()
+
+    @contextlib.contextmanager
+    def read(self):
+        with self.lock.read_locked():
+            yield self.tree
+
+    @contextlib.contextmanager
+    def write(self):
+        with self.lock.write_locked():
+            yield self.tree
+
+    def __len__(self):
+        with self.lock.read_locked():
+            return len(self.tree)
+
+    def __contains__(self, data):
+        with self.lock.read_locked():
+            return data in self.tree
+
+    def __getitem__(self, data):
+        with self.lock.read_locked():
+            return self.tree[data]
+
+    def get(self, data, default=None):
+        # Value of data, or default, unlike rb_tree.get which gives the node
+        with self.lock.read_locked():
+            node = self.tree.get(data)
+            return default if node is None else node.value
+
+    def floor(self, data):
+        with self.lock.read_locked():
+            return _data(self.tree.floor(data))
+
+    def ceiling(self, data):
+        with self.lock.read_locked():
+            return _data(self.tree.ceiling(data))
+
+    def lower(self, data):
+        with self.lock.read_locked():
+            return _data(self.tree.lower(data))
+
+    def higher(self, data):
+        with self.lock.read_locked():
+            return _data(self.tree.higher(data))
+
+    def select(self, k):
+        with self.lock.read_locked():
+            return self.tree.select(k).data
+
+    def rank(self, data):
+        with self.lock.read_locked():
+            return self.tree.rank(data)
+
+    def count_range(self, lo, hi, inclusive=(True, False)):
+        with self.lock.read_locked():
+            return self.tree.count_range(lo, hi, inclusive)
+
+    def keys(self):
+        with self.lock.read_locked():
+            return list(self.tree.keys())
+
+    def values(self):
+        with self.lock.read_locked():
+            return list(self.tree.values())
+
+    def items(self):
+        with self.lock.read_locked():
+            return list(self.tree.items())
+
+    def irange(self, lo=None, hi=None, inclusive=(True, False), reverse=False):
+        # Data and value of every node between lo and hi, as in rb_tree.irange
+        with self.lock.read_locked():
+            return [(node.data, node.value) for node in self.tree.irange(lo, hi, inclusive, reverse)]
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def snapshot(self):
+        # An rb_tree of its own, copied under one shared hold in O(n)
+        with self.lock.read_locked():
+            return self.tree.copy()
+
+    def insert(self, data, value=None):
+        with self.lock.write_locked():
+            self.tree.insert(data, value)
+
+    def delete(self, data):
+        with self.lock.write_locked():
+            self.tree.delete(data)
+
+    def __setitem__(self, data, value):
+        with self.lock.write_locked():
+            self.tree[data] = value
+
+    def __delitem__(self, data):
+        self.delete(data)
+
+    def setdefault(self, data, default=None):
+        with self.lock.write_locked():
+            return self.tree.setdefault(data, default)
+
+    def pop(self, data, *default):
+        with self.lock.write_locked():
+            return self.tree.pop(data, *default)
+
+    def insert_many(self, iterable, values=None):
+        # The batch is gathered before the lock is taken, so a slow iterable
+        # does not hold up the readers
+        data = list(iterable)
+        values = None if values is None else list(values)
+        with self.lock.write_locked():
+            self.tree.insert_many(data, values)
+
+    def delete_many(self, iterable):
+        data = list(iterable)
+        with self.lock.write_locked():
+            return self.tree.delete_many(data)
+
+    def union(self, other):
+        other = self.__operand(other)
+        with self.lock.write_locked():
+            self.tree.union(other)
+        return self
+
+    def intersection(self, other):
+        other = self.__operand(other)
+        with self.lock.write_locked():
+            self.tree.intersection(other)
+        return self
+
+    def difference(self, other):
+        other = self.__operand(other)
+        with self.lock.write_locked():
+            self.tree.difference(other)
+        return self
+
+    # Helper function __operand gives the operand of set algebra. Another
+    # concurrent tree is copied before our lock is taken, so two trees
+    # combined with each other from two threads cannot deadlock
+    def __operand(self, other):
+        if isinstance(other, concurrent_rb_tree):
+            return other.snapshot()
+        if isinstance(other, rb_tree):
+            return other
+        return list(other)
+
+
+def _data(node):
+    return None if node is None else node.data
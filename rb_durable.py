@@ -0,0 +1,263 @@
+import os
+import pickle
+import struct
+import zlib
+
+from rb_tree import rb_tree
+
+# How often the write-ahead log is forced to disk: after every mutation,
+# after every group of mutations, or never, leaving it to the OS
+FSYNC_ALWAYS = 'always'
+FSYNC_GROUP = 'group'
+FSYNC_NEVER = 'never'
+
+# Every log record is a pickled (method, args) pair behind its length and crc32
+_RECORD = struct.Struct('<II')
+_CHECKPOINT = 'checkpoint'
+_SEGMENT = 'wal-{:016d}.log'
+
+
+class durable_rb_tree(object):
+    """
+    An rb_tree whose mutations survive a crash, kept in a directory as a
+    checkpoint plus a write-ahead log.
+
+    ...
+
+    Every mutation is applied to the tree in memory and its record is
+    written to the current log segment at once, so it survives the process
+    dying. Only fsync waits for a group of group_size records, so many
+    mutations share one fsync and a crash of the machine loses at most the
+    records of the group not yet synced. commit forces the group to disk
+    early, and insert_many and delete_many are logged as one record and
+    committed, so they are durable as a unit.
+    After checkpoint_every records the whole tree is written to a new
+    checkpoint and the log starts a new segment, so recovery loads the
+    checkpoint and replays only the segments written after it.
+
+    Attributes
+    ----------
+    self.directory: str
+        Where the checkpoint and log segments are kept
+    self.tree: rb_tree
+        The tree in memory, to be read but only changed through this class
+    self.fsync: str
+        FSYNC_ALWAYS, FSYNC_GROUP or FSYNC_NEVER
+    self.group_size: int
+        Number of records forced to disk by one fsync
+    self.checkpoint_every: int
+        Number of records logged between checkpoints
+
+    Methods
+    -------
+    insert(arg1 = data, arg2 = value):
+        Inserts data and logs it
+    delete(arg1 = data):
+        Deletes data and logs it
+    __setitem__(arg1 = data, arg2 = value):
+        Sets the value of data and logs it
+    __delitem__(arg1 = data):
+        Deletes data and logs it
+    insert_many(arg1 = iterable, arg2 = values):
+        Inserts a batch and logs it as one record
+    delete_many(arg1 = iterable):
+        Deletes a batch and logs it as one record
+    __len__(), __contains__(arg1 = data), __getitem__(arg1 = data), get(arg1 = data, arg2 = default):
+        Reads from the tree in memory
+    commit():
+        Forces the records written since the last fsync to disk
+    checkpoint():
+        Writes the tree to a new checkpoint and drops the log before it
+    close():
+        Commits and closes the log
+    __recover():
+        Loads the checkpoint and replays the log after it
+    """
+
+    def __init__(self, directory, fsync=FSYNC_GROUP, group_size=1000, checkpoint_every=1000000):
+        if fsync not in (FSYNC_ALWAYS, FSYNC_GROUP, FSYNC_NEVER):
+            raise ValueError('Error, unknown fsync policy {!r}'.format(fsync))
+        self.directory = directory
+        self.fsync = fsync
+        self.group_size = group_size
+        self.checkpoint_every = checkpoint_every
+        self._unsynced = 0
+        self._logged = 0
+        os.makedirs(directory, exist_ok=True)
+        self.tree, last, torn = self.__recover()
+        # A torn segment was cut back and is left as it is, an intact one is
+        # appended to, so reopening does not pile up empty segments
+        self.__open_segment(last + 1 if torn else last)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def insert(self, data, value=None):
+        self.tree.insert(data, value)
+        self.__log('insert', data, value)
+
+    def delete(self, data):
+        # Raises KeyError like rb_tree.delete, and then nothing is logged
+        self.tree.delete(data)
+        self.__log('delete', data)
+
+    def __setitem__(self, data, value):
+        self.tree[data] = value
+        self.__log('__setitem__', data, value)
+
+    def __delitem__(self, data):
+        self.delete(data)
+
+    def insert_many(self, iterable, values=None):
+        data = list(iterable)
+        values = None if values is None else list(values)
+        self.tree.insert_many(data, values)
+        self.__log('insert_many', data, values)
+        self.commit()
+
+    def delete_many(self, iterable):
+        data = list(iterable)
+        count = self.tree.delete_many(data)
+        if count:
+            self.__log('delete_many', data)
+            self.commit()
+        return count
+
+    def __len__(self):
+        return len(self.tree)
+
+    def __contains__(self, data):
+        return data in self.tree
+
+    def __getitem__(self, data):
+        return self.tree[data]
+
+    def get(self, data, default=None):
+        return self.tree.get(data, default)
+
+    # Helper function __log writes a record to the segment and hands it to the OS, and
+    # commits once a group of records is waiting for fsync
+    def __log(self, name, *args):
+        payload = pickle.dumps((name, args), pickle.HIGHEST_PROTOCOL)
+        self._segment.write(_RECORD.pack(len(payload), zlib.crc32(payload)) + payload)
+        self._segment.flush()
+        self._unsynced += 1
+        self._logged += 1
+        if self.fsync == FSYNC_ALWAYS or self._unsynced >= self.group_size:
+            self.commit()
+
+    def commit(self):
+        # Forces the records written since the last commit to disk, unless the
+        # policy is FSYNC_NEVER
+        if not self._unsynced:
+            return
+        self.__sync()
+        if self._logged >= self.checkpoint_every:
+            self.checkpoint()
+
+    # Helper function __sync forces the records not yet synced to disk. checkpoint
+    # calls it rather than commit, which would start a checkpoint of its own
+    def __sync(self):
+        if not self._unsynced:
+            return
+        self._unsynced = 0
+        if self.fsync != FSYNC_NEVER:
+            os.fsync(self._segment.fileno())
+
+    def checkpoint(self):
+        """
+        Writes the whole tree to a new checkpoint and starts a new log
+        segment, then removes the segments the checkpoint covers. The
+        checkpoint is written next to the old one and renamed over it, so a
+        crash at any point leaves a checkpoint and log that recover the tree.
+        """
+        self.__sync()
+        self._segment.close()
+        start = self._sequence + 1
+        self.__open_segment(start)
+        path = os.path.join(self.directory, _CHECKPOINT)
+        with open(path + '.tmp', 'wb') as file:
+            pickle.dump((start, list(self.tree.keys()), list(self.tree.values())), file, pickle.HIGHEST_PROTOCOL)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(path + '.tmp', path)
+        self.__sync_directory()
+        for sequence in self.__segments():
+            if sequence < start:
+                os.remove(os.path.join(self.directory, _SEGMENT.format(sequence)))
+        self._logged = 0
+
+    def close(self):
+        self.commit()
+        self._segment.close()
+
+    def __recover(self):
+        """
+        Rebuilds the tree from the checkpoint, if there is one, and replays
+        the log segments written after it in order. A record cut short or
+        corrupted by a crash ends the replay: its segment is cut back to the
+        last whole record and the segments after it are removed, since
+        their writes came after the ones that were lost.
+
+        Returns
+        -------
+        tuple
+            The tree, the sequence number of the last segment and whether
+            the replay ended at a torn record
+        """
+        start = 0
+        tree = rb_tree()
+        path = os.path.join(self.directory, _CHECKPOINT)
+        if os.path.exists(path):
+            with open(path, 'rb') as file:
+                start, keys, values = pickle.load(file)
+            tree = rb_tree.from_sorted(keys, values)
+        last = start
+        torn = False
+        for sequence in self.__segments():
+            if sequence < start:
+                continue
+            segment = os.path.join(self.directory, _SEGMENT.format(sequence))
+            if torn:
+                os.remove(segment)
+                continue
+            last = sequence
+            with open(segment, 'rb') as file:
+                log = file.read()
+            offset = 0
+            while offset + _RECORD.size <= len(log):
+                length, checksum = _RECORD.unpack_from(log, offset)
+                payload = log[offset + _RECORD.size:offset + _RECORD.size + length]
+                if len(payload) < length or zlib.crc32(payload) != checksum:
+                    break
+                name, args = pickle.loads(payload)
+                getattr(tree, name)(*args)
+                offset += _RECORD.size + length
+            if offset < len(log):
+                with open(segment, 'r+b') as file:
+                    file.truncate(offset)
+                torn = True
+        return tree, last, torn
+
+    # Helper function __segments lists the sequence numbers of the log segments in order
+    def __segments(self):
+        names = [name for name in os.listdir(self.directory) if name.startswith('wal-') and name.endswith('.log')]
+        return sorted(int(name[4:-4]) for name in names)
+
+    def __open_segment(self, sequence):
+        self._sequence = sequence
+        self._segment = open(os.path.join(self.directory, _SEGMENT.format(sequence)), 'ab')
+        self.__sync_directory()
+
+    # Helper function __sync_directory makes new and renamed files in the directory durable
+    def __sync_directory(self):
+        if self.fsync == FSYNC_NEVER or not hasattr(os, 'O_DIRECTORY'):
+            return
+        handle = os.open(self.directory, os.O_RDONLY | os.O_DIRECTORY)
+        try:
+            os.fsync(handle)
+        finally:
+            os.close(handle)
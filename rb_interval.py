@@ -0,0 +1,231 @@
+from rb_tree import rb_tree, Node
+
+
+class _inode(Node):
+    """
+    A node of an interval_rb_tree
+
+    ...
+
+    Attributes
+    ----------
+    self.max_end: any
+        The largest end of the intervals in the subtree under and including the node
+    """
+
+    __slots__ = ('max_end',)
+
+
+class interval_rb_tree(rb_tree):
+    """
+    An rb_tree of closed intervals (start, end) that finds the intervals
+    overlapping a range.
+
+    ...
+
+    The intervals are ordered by start, then end, and every node also keeps
+    the largest end in its subtree. A subtree whose largest end is below
+    the range cannot overlap it, and neither can the nodes right of one
+    that starts past the range, so the queries only walk down to the
+    intervals they report. rb_tree keeps the largest ends up to date
+    through augment wherever it rotates or relinks nodes, which covers the
+    batches, bulk loads, join, split and set algebra it inherits.
+
+    Methods
+    -------
+    insert(arg1 = interval, arg2 = value), insert_many(arg1 = iterable, arg2 = values):
+        Inserts intervals, checking that none of them ends before it starts
+    __setitem__(arg1 = interval, arg2 = value), setdefault(arg1 = interval, arg2 = default):
+        Map writes, checked the same way
+    from_sorted(arg1 = iterable, arg2 = values, ...), join(arg1 = left, arg2 = interval, arg3 = right, arg4 = value), union(arg1 = other):
+        Bulk loads, joins and unions, checked the same way
+    update_key(arg1 = node, arg2 = interval):
+        Gives a node a new interval, checked the same way
+    find_node, get, __contains__, __getitem__, pop, delete, delete_many, floor, ceiling, lower, higher, rank, count_range, irange, split, intersection, difference:
+        As in rb_tree, taking intervals as any pair the way insert does
+    overlapping(arg1 = start, arg2 = end):
+        The nodes whose interval overlaps [start, end], in order
+    stabbing(arg1 = point):
+        The nodes whose interval holds point, in order
+    any_overlap(arg1 = start, arg2 = end):
+        Some node whose interval overlaps [start, end], or None
+    augment(arg1 = node):
+        Recomputes the largest end of the subtree under node
+    """
+
+    node_type = _inode
+    augmented = True
+
+    def __init__(self, key=None, reverse=False, duplicates=rb_tree.ALLOW, monoid=None, pool_size=0):
+        # key, reverse and monoid are only taken so that the tree can be built like an rb_tree
+        if key is not None or reverse:
+            raise ValueError('Error, an interval tree is ordered by its intervals')
+        if monoid is not None:
+            raise ValueError('Error, an interval tree keeps no aggregates')
+        super().__init__(duplicates=duplicates, pool_size=pool_size)
+
+    def insert(self, interval, value=None):
+        return super().insert(_interval(interval), value)
+
+    def insert_many(self, iterable, values=None):
+        super().insert_many([_interval(interval) for interval in iterable], values)
+
+    def __setitem__(self, interval, value):
+        super().__setitem__(_interval(interval), value)
+
+    def setdefault(self, interval, default=None):
+        return super().setdefault(_interval(interval), default)
+
+    @classmethod
+    def from_sorted(cls, iterable, values=None, key=None, reverse=False, duplicates=rb_tree.ALLOW, monoid=None,
+                    pool_size=0):
+        # from_iterable and like load through here as well
+        return super().from_sorted([_interval(interval) for interval in iterable], values, key, reverse,
+                                   duplicates, monoid, pool_size)
+
+    @classmethod
+    def join(cls, left, interval, right, value=None):
+        return super().join(left, _interval(interval), right, value)
+
+    def union(self, other):
+        # The intervals of another interval tree were checked when they were added
+        if not isinstance(other, rb_tree):
+            other = [_interval(interval) for interval in other]
+        elif not isinstance(other, interval_rb_tree):
+            for node in other:
+                _interval(node.data)
+        return super().union(other)
+
+    def update_key(self, node, interval):
+        return super().update_key(node, _interval(interval))
+
+    # Lookups, deletes and bounds take an interval as any pair, like insert, and
+    # look it up as the tuple insert stored
+    def find_node(self, interval, *default):
+        return super().find_node(tuple(interval), *default)
+
+    def get(self, interval, default=None):
+        return super().get(tuple(interval), default)
+
+    def __contains__(self, interval):
+        return super().__contains__(tuple(interval))
+
+    def __getitem__(self, interval):
+        return super().__getitem__(tuple(interval))
+
+    def pop(self, interval, *default):
+        return super().pop(tuple(interval), *default)
+
+    def delete(self, interval):
+        super().delete(tuple(interval))
+
+    def delete_many(self, iterable):
+        return super().delete_many([tuple(interval) for interval in iterable])
+
+    def floor(self, interval):
+        return super().floor(tuple(interval))
+
+    def ceiling(self, interval):
+        return super().ceiling(tuple(interval))
+
+    def lower(self, interval):
+        return super().lower(tuple(interval))
+
+    def higher(self, interval):
+        return super().higher(tuple(interval))
+
+    def rank(self, interval):
+        return super().rank(tuple(interval))
+
+    def count_range(self, lo, hi, inclusive=(True, False)):
+        return super().count_range(tuple(lo), tuple(hi), inclusive)
+
+    def irange(self, lo=None, hi=None, inclusive=(True, False), reverse=False):
+        return super().irange(None if lo is None else tuple(lo), None if hi is None else tuple(hi),
+                              inclusive, reverse)
+
+    def split(self, interval):
+        return super().split(tuple(interval))
+
+    def intersection(self, other):
+        return super().intersection(other if isinstance(other, rb_tree) else [tuple(interval) for interval in other])
+
+    def difference(self, other):
+        return super().difference(other if isinstance(other, rb_tree) else [tuple(interval) for interval in other])
+
+    def augment(self, node):
+        sentinel = self.sentinel
+        max_end = node.data[1]
+        if node.left is not sentinel and max_end < node.left.max_end:
+            max_end = node.left.max_end
+        if node.right is not sentinel and max_end < node.right.max_end:
+            max_end = node.right.max_end
+        node.max_end = max_end
+
+    def overlapping(self, start, end):
+        """
+        Yields the nodes whose interval overlaps the closed range [start, end]
+        in order. Only subtrees that can hold an overlap are entered, which
+        takes O(log n + k) for k overlaps when they lie close together in
+        the order, and at most O(k log n) when they are spread out.
+
+        Parameters
+        ----------
+        start :
+            Start of the range
+        end :
+            End of the range, at least start
+        """
+        sentinel = self.sentinel
+        stack = []
+        node = self.root
+        while True:
+            # Subtrees that end before start are skipped whole
+            while node is not sentinel and not node.max_end < start:
+                stack.append(node)
+                node = node.left
+            if not stack:
+                return
+            node = stack.pop()
+            if end < node.data[0]:
+                # Every interval from here on starts past the range
+                return
+            if not node.data[1] < start:
+                yield node
+            node = node.right
+
+    def stabbing(self, point):
+        # The nodes whose interval holds point, in order
+        return self.overlapping(point, point)
+
+    def any_overlap(self, start, end):
+        """
+        Returns some node whose interval overlaps the closed range [start, end],
+        or None, in O(log n). Whenever the left subtree reaches start, an
+        overlap is either there or nowhere, so a single path is walked.
+
+        Parameters
+        ----------
+        start :
+            Start of the range
+        end :
+            End of the range, at least start
+        """
+        sentinel = self.sentinel
+        node = self.root
+        while node is not sentinel:
+            if not (end < node.data[0] or node.data[1] < start):
+                return node
+            if node.left is not sentinel and not node.left.max_end < start:
+                node = node.left
+            else:
+                node = node.right
+        return None
+
+
+def _interval(interval):
+    # Checks an interval and gives it as a (start, end) tuple
+    start, end = interval
+    if end < start:
+        raise ValueError('Error, interval ends before it starts')
+    return start, end
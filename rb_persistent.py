@@ -0,0 +1,335 @@
+from rb_tree import RED, BLACK, _MISSING
+
+
+class _pnode(object):
+    """
+    A node of a persistent red black tree, never changed once built
+
+    ...
+
+    Attributes
+    ----------
+    self.data: any
+        The key of the node
+    self.value: any
+        The value stored with data
+    self.left, self.right: _pnode
+        The children, or _LEAF
+    self.red: bool
+        The color of the node
+    self.size: int
+        Number of nodes in the subtree under and including the node
+    """
+
+    __slots__ = ('data', 'value', 'left', 'right', 'red', 'size')
+
+    def __init__(self, red, left, data, value, right):
+        self.red = red
+        self.left = left
+        self.data = data
+        self.value = value
+        self.right = right
+        self.size = left.size + 1 + right.size
+
+    @property
+    def color(self):
+        return 'red' if self.red else 'black'
+
+
+# The shared empty subtree, black and of size 0, in place of None children
+_LEAF = object.__new__(_pnode)
+_LEAF.red = BLACK
+_LEAF.left = _LEAF.right = _LEAF
+_LEAF.data = _LEAF.value = None
+_LEAF.size = 0
+
+
+class persistent_rb_tree(object):
+    """
+    An immutable red black tree: insert and delete return a new version and
+    leave the old one as it was.
+
+    ...
+
+    A new version copies only the O(log n) nodes on the path to the change
+    and shares every other node with the version it came from, so keeping
+    many versions is cheap and any of them can be read from many threads
+    without a lock. Insertion follows Okasaki and deletion follows Kahrs.
+    Unlike rb_tree this is a map: inserting data that is already present
+    replaces its value instead of adding a second node.
+
+    Attributes
+    ----------
+    self.root: _pnode
+        The root of this version, _LEAF when empty
+
+    Methods
+    -------
+    from_sorted(arg1 = iterable, arg2 = values):
+        Builds a version from sorted, distinct data in O(n)
+    insert(arg1 = data, arg2 = value):
+        The version with data set to value
+    delete(arg1 = data):
+        The version without data
+    __len__():
+        Number of nodes
+    __contains__(arg1 = data), find_node(arg1 = data, arg2 = default), get(arg1 = data, arg2 = default):
+        Lookups, find_node and get returning the node
+    __getitem__(arg1 = data):
+        The value of data
+    __iter__(), inorder():
+        The nodes in order
+    keys(), values(), items():
+        The data, values, and pairs of both in order
+    find_min():
+        The node with the smallest data
+    select(arg1 = k), rank(arg1 = data):
+        Order statistics on the subtree sizes
+    """
+
+    __slots__ = ('root',)
+
+    def __init__(self, root=_LEAF):
+        self.root = root
+
+    @classmethod
+    def from_sorted(cls, iterable, values=None):
+        """
+        Builds a version from data in strictly increasing order in O(n),
+        coloring the deepest level red like rb_tree.from_sorted.
+
+        Raises
+        ------
+        ValueError
+            If the data is not strictly increasing or values does not match
+            it in length
+        """
+        data = list(iterable)
+        values = [None] * len(data) if values is None else list(values)
+        if len(values) != len(data):
+            raise ValueError('Error, data and values differ in length')
+        for i in range(1, len(data)):
+            if not data[i - 1] < data[i]:
+                raise ValueError('Error, data is not sorted and distinct')
+        red_depth = len(data).bit_length() - 1
+
+        def build(lo, hi, depth):
+            if lo >= hi:
+                return _LEAF
+            mid = (lo + hi) // 2
+            return _pnode(depth == red_depth and depth > 0, build(lo, mid, depth + 1),
+                          data[mid], values[mid], build(mid + 1, hi, depth + 1))
+
+        return cls(build(0, len(data), 0))
+
+    def insert(self, data, value=None):
+        return persistent_rb_tree(_blacken(_insert(self.root, data, value)))
+
+    def delete(self, data):
+        # Raises KeyError if data is not in the tree
+        if self.find_node(data, None) is None:
+            raise KeyError(data)
+        return persistent_rb_tree(_blacken(_delete(self.root, data)))
+
+    def __len__(self):
+        return self.root.size
+
+    def __contains__(self, data):
+        return self.find_node(data, None) is not None
+
+    def find_node(self, data, default=_MISSING):
+        node = self.root
+        while node is not _LEAF:
+            if data < node.data:
+                node = node.left
+            elif node.data < data:
+                node = node.right
+            else:
+                return node
+        if default is _MISSING:
+            raise KeyError(data)
+        return default
+
+    def get(self, data, default=None):
+        return self.find_node(data, default)
+
+    def __getitem__(self, data):
+        return self.find_node(data).value
+
+    def __iter__(self):
+        return self.inorder()
+
+    def inorder(self):
+        stack = []
+        node = self.root
+        while stack or node is not _LEAF:
+            if node is not _LEAF:
+                stack.append(node)
+                node = node.left
+            else:
+                node = stack.pop()
+                yield node
+                node = node.right
+
+    def keys(self):
+        for node in self.inorder():
+            yield node.data
+
+    def values(self):
+        for node in self.inorder():
+            yield node.value
+
+    def items(self):
+        for node in self.inorder():
+            yield node.data, node.value
+
+    def find_min(self):
+        node = self.root
+        if node is _LEAF:
+            return None
+        while node.left is not _LEAF:
+            node = node.left
+        return node
+
+    def select(self, k):
+        # The node with k smaller nodes, counting from the end if k is negative
+        if k < 0:
+            k += len(self)
+        if not 0 <= k < len(self):
+            raise IndexError('Error, index out of range')
+        node = self.root
+        while k != node.left.size:
+            if k < node.left.size:
+                node = node.left
+            else:
+                k -= node.left.size + 1
+                node = node.right
+        return node
+
+    def rank(self, data):
+        # Number of nodes with data smaller than data
+        rank = 0
+        node = self.root
+        while node is not _LEAF:
+            if node.data < data:
+                rank += node.left.size + 1
+                node = node.right
+            else:
+                node = node.left
+        return rank
+
+
+# The functions below build new nodes and never change old ones. node only
+# lends its data and value to the copy in each of them
+
+
+def _copy(red, left, node, right):
+    return _pnode(red, left, node.data, node.value, right)
+
+
+def _blacken(node):
+    return _copy(BLACK, node.left, node, node.right) if node.red else node
+
+
+def _redden(node):
+    return _copy(RED, node.left, node, node.right)
+
+
+def _balance(left, node, right):
+    # A black node over left and right, with a red child of a red child
+    # below it rotated up into a red node with two black children
+    if left.red and right.red:
+        return _copy(RED, _blacken(left), node, _blacken(right))
+    if left.red:
+        if left.left.red:
+            return _copy(RED, _blacken(left.left), left, _copy(BLACK, left.right, node, right))
+        if left.right.red:
+            middle = left.right
+            return _copy(RED, _copy(BLACK, left.left, left, middle.left), middle,
+                         _copy(BLACK, middle.right, node, right))
+    if right.red:
+        if right.right.red:
+            return _copy(RED, _copy(BLACK, left, node, right.left), right, _blacken(right.right))
+        if right.left.red:
+            middle = right.left
+            return _copy(RED, _copy(BLACK, left, node, middle.left), middle,
+                         _copy(BLACK, middle.right, right, right.right))
+    return _copy(BLACK, left, node, right)
+
+
+def _insert(node, data, value):
+    if node is _LEAF:
+        return _pnode(RED, _LEAF, data, value, _LEAF)
+    if data < node.data:
+        left, right = _insert(node.left, data, value), node.right
+    elif node.data < data:
+        left, right = node.left, _insert(node.right, data, value)
+    else:
+        return _pnode(node.red, node.left, data, value, node.right)
+    if node.red:
+        return _copy(RED, left, node, right)
+    return _balance(left, node, right)
+
+
+# Deleting from a subtree with a black root gives a subtree one black node
+# shorter, which _balance_left and _balance_right make up for at its parent.
+# data must be in the subtree
+
+
+def _delete(node, data):
+    if data < node.data:
+        left = _delete(node.left, data)
+        if node.left.red:
+            return _copy(RED, left, node, node.right)
+        return _balance_left(left, node, node.right)
+    if node.data < data:
+        right = _delete(node.right, data)
+        if node.right.red:
+            return _copy(RED, node.left, node, right)
+        return _balance_right(node.left, node, right)
+    return _append(node.left, node.right)
+
+
+def _balance_left(left, node, right):
+    # left is one black node shorter than right
+    if left.red:
+        return _copy(RED, _blacken(left), node, right)
+    if not right.red:
+        return _balance(left, node, _redden(right))
+    middle = right.left
+    return _copy(RED, _copy(BLACK, left, node, middle.left), middle,
+                 _balance(middle.right, right, _redden(right.right)))
+
+
+def _balance_right(left, node, right):
+    # right is one black node shorter than left
+    if right.red:
+        return _copy(RED, left, node, _blacken(right))
+    if not left.red:
+        return _balance(_redden(left), node, right)
+    middle = left.right
+    return _copy(RED, _balance(_redden(left.left), left, middle.left), middle,
+                 _copy(BLACK, middle.right, node, right))
+
+
+def _append(left, right):
+    # Joins the two children of a deleted node, all of left before all of right
+    if left is _LEAF:
+        return right
+    if right is _LEAF:
+        return left
+    if left.red and right.red:
+        middle = _append(left.right, right.left)
+        if middle.red:
+            return _copy(RED, _copy(RED, left.left, left, middle.left), middle,
+                         _copy(RED, middle.right, right, right.right))
+        return _copy(RED, left.left, left, _copy(RED, middle, right, right.right))
+    if not left.red and not right.red:
+        middle = _append(left.right, right.left)
+        if middle.red:
+            return _copy(RED, _copy(BLACK, left.left, left, middle.left), middle,
+                         _copy(BLACK, middle.right, right, right.right))
+        return _balance_left(left.left, left, _copy(BLACK, middle, right, right.right))
+    if right.red:
+        return _copy(RED, _append(left, right.left), right, right.right)
+    return _copy(RED, left.left, left, _append(left.right, right))
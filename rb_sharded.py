@@ -0,0 +1,316 @@
+import bisect
+import multiprocessing
+import os
+
+from rb_tree import rb_tree
+
+
+class sharded_rb_tree(object):
+    """
+    A tree split by key range over worker processes, each owning an rb_tree.
+
+    ...
+
+    Shard i holds the keys from boundaries[i - 1] up to but not including
+    boundaries[i]. Every batch is cut into one request per shard, the
+    requests are all sent before any reply is read, so the shards work on
+    them in parallel, and the replies are put back together in key order.
+    A fresh tree has no boundaries and keeps everything in the first shard;
+    once the largest shard holds more than skew times its share, the
+    boundaries are moved to the quantiles of the keys and only the keys
+    that changed shard are moved. Values cross between processes by
+    pickling, so reads return data and values rather than nodes.
+
+    Attributes
+    ----------
+    self.shards: int
+        Number of worker processes
+    self.boundaries: list
+        The smallest key of every shard but the first
+    self.skew: float
+        How far over its share the largest shard may grow before a rebalance
+    self.min_rebalance: int
+        Number of keys below which the tree is never rebalanced
+
+    Methods
+    -------
+    insert(arg1 = data, arg2 = value), insert_many(arg1 = iterable, arg2 = values):
+        Inserts into the shards that own the data
+    get(arg1 = data, arg2 = default), get_many(arg1 = iterable, arg2 = default):
+        Values of data, in the order asked for
+    __contains__(arg1 = data), contains_many(arg1 = iterable):
+        Whether data is in the tree
+    delete_many(arg1 = iterable):
+        Deletes one node for each of iterable, returning how many were deleted
+    irange(arg1 = lo, arg2 = hi, arg3 = inclusive), items():
+        Data and values in a range, in order
+    __len__():
+        Number of nodes over all shards
+    rebalance():
+        Moves the boundaries to the quantiles of the keys
+    close():
+        Stops the workers
+    __insert_batches(arg1 = data, arg2 = values):
+        Sends each shard its part of a batch
+    __check_skew():
+        Rebalances if the largest shard has grown too big
+    __route(arg1 = data):
+        Index of the shard that owns data
+    __call(arg1 = requests):
+        Sends requests to their shards and gathers the replies
+    """
+
+    def __init__(self, shards=None, skew=2.0, min_rebalance=1024):
+        self.shards = shards or os.cpu_count() or 1
+        self.boundaries = []
+        self.skew = skew
+        self.min_rebalance = min_rebalance
+        self._sizes = [0] * self.shards
+        self._changes = 0
+        self._connections = []
+        self._workers = []
+        for _ in range(self.shards):
+            connection, worker_connection = multiprocessing.Pipe()
+            worker = multiprocessing.Process(target=_serve, args=(worker_connection,), daemon=True)
+            worker.start()
+            worker_connection.close()
+            self._connections.append(connection)
+            self._workers.append(worker)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        for connection in self._connections:
+            connection.send((None, ()))
+            connection.close()
+        for worker in self._workers:
+            worker.join()
+        self._connections = []
+        self._workers = []
+
+    def __len__(self):
+        return sum(self._sizes)
+
+    def insert(self, data, value=None):
+        self.insert_many([data], [value])
+
+    def insert_many(self, iterable, values=None):
+        data = list(iterable)
+        values = [None] * len(data) if values is None else list(values)
+        if len(values) != len(data):
+            raise ValueError('Error, data and values differ in length')
+        self.__insert_batches(data, values)
+        self._changes += len(data)
+        self.__check_skew()
+
+    def __insert_batches(self, data, values):
+        batches = {}
+        for item, value in zip(data, values):
+            batch = batches.setdefault(self.__route(item), ([], []))
+            batch[0].append(item)
+            batch[1].append(value)
+        replies = self.__call({shard: ('insert_many', batch) for shard, batch in batches.items()})
+        for shard, size in replies.items():
+            self._sizes[shard] = size
+
+    def get(self, data, default=None):
+        return self.get_many([data], default)[0]
+
+    def get_many(self, iterable, default=None):
+        # Values of iterable, or default for those missing, in the order of iterable
+        return self.__gather('get_many', list(iterable), default)
+
+    def __contains__(self, data):
+        return self.contains_many([data])[0]
+
+    def contains_many(self, iterable):
+        return self.__gather('contains_many', list(iterable))
+
+    def delete_many(self, iterable):
+        batches = {}
+        for item in iterable:
+            batches.setdefault(self.__route(item), []).append(item)
+        replies = self.__call({shard: ('delete_many', (batch,)) for shard, batch in batches.items()})
+        deleted = 0
+        for shard, (count, size) in replies.items():
+            deleted += count
+            self._sizes[shard] = size
+        self._changes += deleted
+        self.__check_skew()
+        return deleted
+
+    def irange(self, lo=None, hi=None, inclusive=(True, False)):
+        # (data, value) pairs between lo and hi in order, bounded like rb_tree.irange
+        first = 0 if lo is None else self.__route(lo)
+        last = self.shards - 1 if hi is None else self.__route(hi)
+        replies = self.__call({shard: ('irange', (lo, hi, inclusive)) for shard in range(first, last + 1)})
+        items = []
+        for shard in range(first, last + 1):
+            items.extend(replies[shard])
+        return items
+
+    def items(self):
+        return self.irange()
+
+    def rebalance(self):
+        """
+        Moves the boundaries to the quantiles of the keys, so every shard
+        holds about the same number of nodes, and sends the keys that now
+        belong to another shard over to it. The quantile keys are looked up
+        with select on the shards that hold them, and each shard gives up
+        only its keys outside its new range.
+        """
+        total = len(self)
+        if not total:
+            return
+        starts = [0]
+        for size in self._sizes:
+            starts.append(starts[-1] + size)
+        requests = {}
+        for i in range(1, self.shards):
+            rank = total * i // self.shards
+            shard = bisect.bisect_right(starts, rank) - 1
+            requests.setdefault(shard, []).append(rank - starts[shard])
+        replies = self.__call({shard: ('select_many', (ranks,)) for shard, ranks in requests.items()})
+        self.boundaries = [key for shard in sorted(replies) for key in replies[shard]]
+        bounds = [None] + self.boundaries + [None]
+        replies = self.__call({shard: ('extract', (bounds[shard], bounds[shard + 1]))
+                               for shard in range(self.shards) if self._sizes[shard]})
+        moved = ([], [])
+        for shard, (items, size) in replies.items():
+            self._sizes[shard] = size
+            for item, value in items:
+                moved[0].append(item)
+                moved[1].append(value)
+        self.__insert_batches(*moved)
+        self._changes = 0
+
+    # Helper function __check_skew rebalances once the largest shard holds
+    # more than skew times its share of the nodes. Waiting for as many
+    # changes as half the nodes in between keeps the cost of moving keys
+    # constant per change, even when duplicates leave a shard too big
+    def __check_skew(self):
+        total = len(self)
+        if total < self.min_rebalance or 2 * self._changes < total:
+            return
+        if max(self._sizes) * self.shards > self.skew * total:
+            self.rebalance()
+
+    def __route(self, data):
+        return bisect.bisect_right(self.boundaries, data)
+
+    # Helper function __gather runs a per-key lookup on the shards that own
+    # the keys and returns the answers in the order of data
+    def __gather(self, name, data, *args):
+        batches = {}
+        for position, item in enumerate(data):
+            batch = batches.setdefault(self.__route(item), ([], []))
+            batch[0].append(position)
+            batch[1].append(item)
+        replies = self.__call({shard: (name, (batch[1],) + args) for shard, batch in batches.items()})
+        answers = [None] * len(data)
+        for shard, batch in batches.items():
+            for position, answer in zip(batch[0], replies[shard]):
+                answers[position] = answer
+        return answers
+
+    def __call(self, requests):
+        """
+        Sends every request to its shard before reading any reply, so the
+        shards serve them in parallel.
+
+        Parameters
+        ----------
+        requests : dict
+            (name, args) of the request for each shard index
+
+        Raises
+        ------
+        Exception
+            The first error a shard raised, after every reply is read
+        """
+        for shard, request in requests.items():
+            self._connections[shard].send(request)
+        replies = {}
+        error = None
+        for shard in requests:
+            succeeded, reply = self._connections[shard].recv()
+            if succeeded:
+                replies[shard] = reply
+            elif error is None:
+                error = reply
+        if error is not None:
+            raise error
+        return replies
+
+
+# What a worker runs for each request, on its own tree
+
+
+def _insert_many(tree, data, values):
+    tree.insert_many(data, values)
+    return len(tree)
+
+
+def _get_many(tree, data, default):
+    answers = []
+    for item in data:
+        node = tree.get(item)
+        answers.append(default if node is None else node.value)
+    return answers
+
+
+def _contains_many(tree, data):
+    return [item in tree for item in data]
+
+
+def _delete_many(tree, data):
+    return tree.delete_many(data), len(tree)
+
+
+def _irange(tree, lo, hi, inclusive):
+    return [(node.data, node.value) for node in tree.irange(lo, hi, inclusive)]
+
+
+def _select_many(tree, ranks):
+    return [tree.select(rank).data for rank in ranks]
+
+
+def _extract(tree, lo, hi):
+    # Removes and returns the items below lo and at or above hi
+    items = []
+    if lo is not None:
+        items.extend(_irange(tree, None, lo, (True, False)))
+    if hi is not None:
+        items.extend(_irange(tree, hi, None, (True, False)))
+    tree.delete_many([item for item, value in items])
+    return items, len(tree)
+
+
+_REQUESTS = {
+    'insert_many': _insert_many,
+    'get_many': _get_many,
+    'contains_many': _contains_many,
+    'delete_many': _delete_many,
+    'irange': _irange,
+    'select_many': _select_many,
+    'extract': _extract,
+}
+
+
+def _serve(connection):
+    # The loop of a worker process, until it is sent a None request
+    tree = rb_tree()
+    while True:
+        name, args = connection.recv()
+        if name is None:
+            break
+        try:
+            connection.send((True, _REQUESTS[name](tree, *args)))
+        except Exception as error:
+            connection.send((False, error))
+    connection.close()
@@ -0,0 +1,272 @@
+import mmap as _mmap
+import os
+import struct
+import zlib
+
+import numpy
+
+from rb_tree import rb_tree
+
+# File layout: a header, then the keys, values and colors arrays, each
+# starting on a _ALIGN byte boundary so they can be mapped in place. The byte
+# after the flags holds the duplicates mode, 0 or ALLOW in files written
+# before it was kept. Since version 2 the crc32 covers the header, with the
+# checksum field zeroed, as well as the arrays, where version 1 left the
+# header out. The _REVERSED flag marks a reversed tree, whose arrays still run
+# from the smallest key up
+_MAGIC = b'RBTS'
+_VERSION = 2
+_HEADER = struct.Struct('<4sHBBQ16s16sI')
+_ALIGN = 64
+_HAS_VALUES = 1
+_HAS_COLORS = 2
+_REVERSED = 4
+
+
+class rb_snapshot(object):
+    """
+    An immutable snapshot of an rb_tree as sorted NumPy arrays.
+
+    ...
+
+    Batch queries answer every key with one numpy.searchsorted call instead
+    of a Python level descent per key, and give the same answers as the
+    matching rb_tree methods on the tree the snapshot was taken from. The
+    keys of a reversed tree are kept from the smallest up all the same, as
+    searchsorted needs them, and the queries mirror them as the tree does.
+
+    Attributes
+    ----------
+    self.keys: numpy.ndarray
+        The keys of the tree from the smallest up, read-only, which are its
+        data unless it has a key function. A COUNT tree repeats each key by
+        its count
+    self.values: numpy.ndarray or None
+        The values matching keys, read-only, if they were captured
+    self.colors: numpy.ndarray or None
+        Whether the node of each key was red, read-only, if they were captured
+    self.duplicates: int
+        The duplicates mode of the tree, which thaw gives back
+    self.reverse: bool
+        Whether the tree was ordered from the largest key down
+
+    Methods
+    -------
+    from_tree(arg1 = tree, arg2 = values, arg3 = colors):
+        Takes a snapshot of an rb_tree
+    save(arg1 = path):
+        Writes the snapshot to a file
+    load(arg1 = path, arg2 = mmap, arg3 = verify):
+        Reads a snapshot from a file, mapping it into memory
+    thaw():
+        Rebuilds a writable rb_tree from the snapshot
+    __len__():
+        Number of keys in the snapshot
+    __contains__(arg1 = key):
+        Whether key is in the snapshot
+    get(arg1 = key, arg2 = default):
+        Value of key, or default
+    irange(arg1 = lo, arg2 = hi, arg3 = inclusive, arg4 = reverse):
+        Keys between lo and hi, as a view of keys
+    contains_many(arg1 = keys):
+        Which of keys are in the snapshot
+    rank_many(arg1 = keys):
+        How many keys of the snapshot are smaller than each of keys
+    range_count_many(arg1 = lo, arg2 = hi, arg3 = inclusive):
+        How many keys of the snapshot lie in each range
+    """
+
+    def __init__(self, keys, values=None, colors=None, duplicates=rb_tree.ALLOW, reverse=False):
+        self.keys = _read_only(keys)
+        self.duplicates = duplicates
+        self.reverse = reverse
+        self.values = None if values is None else _read_only(values)
+        self.colors = None if colors is None else _read_only(colors)
+        for array in (self.values, self.colors):
+            if array is not None and len(array) != len(self.keys):
+                raise ValueError('Error, arrays differ in length from keys')
+
+    @classmethod
+    def from_tree(cls, tree, values=False, colors=False):
+        # The snapshot holds the keys the tree is ordered by, which are the
+        # data unless the tree has a key function, from the smallest up
+        nodes = list(tree)
+        if tree.reverse:
+            nodes.reverse()
+        keys = numpy.array([node.key for node in nodes])
+        color_array = numpy.fromiter((node.red for node in nodes), numpy.bool_, len(keys)) if colors else None
+        if tree.duplicates == rb_tree.COUNT:
+            # Repeat every key by its count, so ranks and counts match the tree
+            counts = numpy.fromiter((node.count for node in nodes), numpy.intp, len(keys))
+            keys = numpy.repeat(keys, counts)
+            if colors:
+                color_array = numpy.repeat(color_array, counts)
+        value_array = None
+        if values:
+            value_list = list(tree.values())
+            if tree.reverse:
+                value_list.reverse()
+            value_array = numpy.array(value_list)
+        return cls(keys, value_array, color_array, tree.duplicates, tree.reverse)
+
+    def save(self, path):
+        """
+        Writes the snapshot to path in a versioned, checksummed format that
+        load can map back into memory without copying. The file is written
+        next to path first and renamed over it, so readers never see a
+        partial file.
+
+        Parameters
+        ----------
+        path : str
+            Where to write the snapshot
+
+        Raises
+        ------
+        ValueError
+            If the keys or values are not of a fixed size type, like Python
+            objects, and so cannot be mapped
+        """
+        arrays = [self.keys]
+        flags = 0
+        if self.values is not None:
+            arrays.append(self.values)
+            flags |= _HAS_VALUES
+        if self.colors is not None:
+            arrays.append(self.colors.astype(numpy.uint8))
+            flags |= _HAS_COLORS
+        if self.reverse:
+            flags |= _REVERSED
+        for array in arrays:
+            if array.dtype.hasobject:
+                raise ValueError('Error, cannot save keys or values of type object')
+        payload = bytearray()
+        for array in arrays:
+            payload += bytes(-(_HEADER.size + len(payload)) % _ALIGN)
+            payload += numpy.ascontiguousarray(array).tobytes()
+        value_type = self.values.dtype.str if self.values is not None else ''
+        fields = (_MAGIC, _VERSION, flags, self.duplicates, len(self.keys), self.keys.dtype.str.encode(),
+                  value_type.encode())
+        header = _HEADER.pack(*fields, zlib.crc32(payload, zlib.crc32(_HEADER.pack(*fields, 0))))
+        partial = path + '.tmp'
+        with open(partial, 'wb') as file:
+            file.write(header)
+            file.write(payload)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(partial, path)
+
+    @classmethod
+    def load(cls, path, mmap=True, verify=True):
+        """
+        Reads a snapshot written by save. With mmap the arrays are views of
+        the mapped file, so loading costs no copy and processes that load the
+        same file share its pages.
+
+        Parameters
+        ----------
+        path : str
+            The file to read
+        mmap : bool
+            Whether to map the file instead of reading it into memory
+        verify : bool
+            Whether to check the checksum, which reads the whole file once
+
+        Raises
+        ------
+        ValueError
+            If the file is not a snapshot, is of an unknown version, or is
+            corrupt
+        """
+        with open(path, 'rb') as file:
+            if mmap:
+                buffer = _mmap.mmap(file.fileno(), 0, access=_mmap.ACCESS_READ)
+            else:
+                buffer = file.read()
+        if len(buffer) < _HEADER.size:
+            raise ValueError('Error, {} is not a snapshot'.format(path))
+        magic, version, flags, duplicates, count, key_type, value_type, checksum = _HEADER.unpack_from(buffer)
+        if magic != _MAGIC:
+            raise ValueError('Error, {} is not a snapshot'.format(path))
+        if version not in (1, _VERSION):
+            raise ValueError('Error, unknown snapshot version {}'.format(version))
+        if verify:
+            crc = 0
+            if version != 1:
+                crc = zlib.crc32(_HEADER.pack(magic, version, flags, duplicates, count, key_type, value_type, 0))
+            if zlib.crc32(memoryview(buffer)[_HEADER.size:], crc) != checksum:
+                raise ValueError('Error, {} is corrupt'.format(path))
+        types = [numpy.dtype(key_type.rstrip(b'\0').decode())]
+        if flags & _HAS_VALUES:
+            types.append(numpy.dtype(value_type.rstrip(b'\0').decode()))
+        if flags & _HAS_COLORS:
+            types.append(numpy.dtype(numpy.bool_))
+        arrays = []
+        offset = _HEADER.size
+        for dtype in types:
+            offset += -offset % _ALIGN
+            arrays.append(numpy.frombuffer(buffer, dtype, count, offset))
+            offset += dtype.itemsize * count
+        keys = arrays.pop(0)
+        values = arrays.pop(0) if flags & _HAS_VALUES else None
+        colors = arrays.pop(0) if flags & _HAS_COLORS else None
+        return cls(keys, values, colors, duplicates, bool(flags & _REVERSED))
+
+    def thaw(self):
+        # Rebuilds a writable rb_tree in O(n) with rb_tree.from_sorted, which
+        # colors the balanced tree itself rather than using colors. The repeated
+        # keys of a COUNT tree fold back into counts
+        step = -1 if self.reverse else 1
+        values = None if self.values is None else self.values[::step].tolist()
+        return rb_tree.from_sorted(self.keys[::step].tolist(), values, duplicates=self.duplicates,
+                                   reverse=self.reverse)
+
+    def __len__(self):
+        return len(self.keys)
+
+    def __contains__(self, key):
+        index = numpy.searchsorted(self.keys, key, side='left')
+        return index < len(self.keys) and self.keys[index] == key
+
+    def get(self, key, default=None):
+        # Value of key, or default if key is missing or there are no values
+        index = numpy.searchsorted(self.keys, key, side='left')
+        if self.values is None or index == len(self.keys) or self.keys[index] != key:
+            return default
+        return self.values[index]
+
+    def irange(self, lo=None, hi=None, inclusive=(True, False), reverse=False):
+        # Keys between lo and hi, bounded like rb_tree.irange, as a view of keys
+        if self.reverse:
+            lo, hi, inclusive, reverse = hi, lo, (inclusive[1], inclusive[0]), not reverse
+        start = 0 if lo is None else numpy.searchsorted(self.keys, lo, side='left' if inclusive[0] else 'right')
+        stop = len(self.keys) if hi is None else numpy.searchsorted(self.keys, hi, side='right' if inclusive[1] else 'left')
+        keys = self.keys[start:max(start, stop)]
+        return keys[::-1] if reverse else keys
+
+    def contains_many(self, keys):
+        keys = numpy.asarray(keys)
+        index = numpy.searchsorted(self.keys, keys, side='left')
+        found = index < len(self.keys)
+        found[found] = self.keys[index[found]] == keys[found]
+        return found
+
+    def rank_many(self, keys):
+        # Same as rb_tree.rank for each of keys
+        if self.reverse:
+            return len(self.keys) - numpy.searchsorted(self.keys, numpy.asarray(keys), side='right')
+        return numpy.searchsorted(self.keys, numpy.asarray(keys), side='left')
+
+    def range_count_many(self, lo, hi, inclusive=(True, False)):
+        # Same as rb_tree.count_range for each pair of lo and hi
+        if self.reverse:
+            lo, hi, inclusive = hi, lo, (inclusive[1], inclusive[0])
+        upper = numpy.searchsorted(self.keys, numpy.asarray(hi), side='right' if inclusive[1] else 'left')
+        lower = numpy.searchsorted(self.keys, numpy.asarray(lo), side='left' if inclusive[0] else 'right')
+        return numpy.maximum(upper - lower, 0)
+
+
+def _read_only(array):
+    array = numpy.asarray(array)
+    array.flags.writeable = False
+    return array
@@ -1,3 +1,28 @@
+import contextlib
+import gc
+import heapq
+from itertools import repeat
+from operator import attrgetter, itemgetter
+
+RED = True
+BLACK = False
+
+# Marks an argument that was not passed, since None is a valid default
+_MISSING = object()
+
+
+@contextlib.contextmanager
+def _gc_paused():
+    # Bulk builds allocate nodes that cannot be garbage yet, so keep the cycle
+    # collector from rescanning them over and over while they are allocated
+    gc_was_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if gc_was_enabled:
+            gc.enable()
+
 
 class Node(object):
     """
@@ -15,15 +40,133 @@ class Node(object):
         The node's right child
     self.parent: Node
         The node's parent
+    self.red: bool
+        The node's color bit, True for red and False for black
     self.color: str
-        The node's color
+        The node's color as 'red' or 'black', derived from self.red
+    self.value: object
+        Payload stored under data when the tree is used as a map
+    self.size: int
+        Number of nodes in the subtree rooted at this node, with every node
+        counted as many times as its count
+    self.count: int
+        How many times the key of the node was inserted, derived from the
+        sizes. Above 1 only in a tree that counts duplicates
+    self.key: object
+        What the tree orders the node by. On a Node it is another name for
+        data, and only the nodes of a tree with a key function keep a key of
+        their own
     """
-    def __init__(self, data, left=None, right=None, parent=None, color='red'):
+    __slots__ = ('data', 'value', 'left', 'right', 'parent', 'red', 'size')
+
+    def __init__(self, data, left=None, right=None, parent=None, color='red', value=None, key=_MISSING):
         self.data = data
+        self.key = data if key is _MISSING else key
+        self.value = value
         self.left = left
         self.right = right
         self.parent = parent
-        self.color = color
+        self.red = color == 'red'
+        self.size = 1
+
+    @property
+    def color(self):
+        # Compatibility view over the color bit
+        return 'red' if self.red else 'black'
+
+    @color.setter
+    def color(self, color):
+        self.red = color == 'red'
+
+    @property
+    def count(self):
+        return self.size - self.left.size - self.right.size
+
+
+# A Node is ordered by its data, so key reads and writes the data slot itself
+# and plain trees pay nothing for it
+Node.key = Node.data
+
+
+class _Sentinel(Node):
+    # The null node that stands in for every missing child and for the root's
+    # parent. Nothing ever writes to it, so all trees share the one instance,
+    # which lets split and join move nodes between trees without touching leaves.
+    # Copying or pickling a tree keeps referring to that same instance
+    __slots__ = ()
+
+    def __reduce__(self):
+        return '_SENTINEL'
+
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        return self
+
+
+_SENTINEL = _Sentinel(None, color='black')
+_SENTINEL.parent = _SENTINEL
+_SENTINEL.left = _SENTINEL
+_SENTINEL.right = _SENTINEL
+_SENTINEL.size = 0
+
+
+class _knode(Node):
+    # A node of a tree with a key function, which keeps its key
+    __slots__ = ('key',)
+
+
+class _anode(Node):
+    # A node of a tree with a monoid, which also keeps the fold of its subtree
+    __slots__ = ('aggregate',)
+
+
+class _aknode(_anode):
+    # A node of a tree with both a monoid and a key function
+    __slots__ = ('key',)
+
+
+class monoid(object):
+    """
+    An associative way of combining the values of a tree, for range aggregates
+
+    ...
+
+    combine must be associative and identity must leave anything it is
+    combined with unchanged, like operator.add and 0 for sums, or min and
+    math.inf for minimums. combine need not be commutative: the nodes are
+    always combined in the order of the tree.
+
+    Attributes
+    ----------
+    self.combine: function
+        Combines two aggregates into one, the left one coming first
+    self.identity: any
+        The aggregate of no nodes
+    self.measure: function or None
+        Maps the data and value of a node to what is combined, None for the value
+    """
+
+    __slots__ = ('combine', 'identity', 'measure')
+
+    def __init__(self, combine, identity, measure=None):
+        self.combine = combine
+        self.identity = identity
+        self.measure = measure
+
+
+class _flipped(object):
+    # The combine of a monoid with its arguments swapped. A reversed tree keeps its
+    # nodes from the smallest key up, so folding them with this combines their
+    # values from the largest key down, in the order the tree shows
+    __slots__ = ('combine',)
+
+    def __init__(self, combine):
+        self.combine = combine
+
+    def __call__(self, first, second):
+        return self.combine(second, first)
 
 
 class rb_tree(object):
@@ -32,6 +175,38 @@ class rb_tree(object):
 
     ...
 
+    Like sorted, the tree takes a key function and a reverse flag. The key
+    of every node is computed once when it is inserted and kept on the node,
+    so ordering by a field of a record costs no more than ordering plain
+    data. Every method takes data, as insert does, and keys it the same
+    way, while find_key and irange_key take keys themselves, so that a
+    lookup does not need a whole record to be built. A reversed tree keeps
+    its nodes from the smallest key up like any other, so its comparisons
+    are as cheap, and mirrors only the order it shows: iteration, the ends,
+    the neighbours of a node, select, rank and the range methods all go
+    from the largest key down, and equal keys still come out in the order
+    they went in.
+
+    Given a monoid, every node also keeps the aggregate of the values in
+    its subtree, updated on the way back up from every change, so
+    reduce_range combines the values of any key range in O(log n). Values
+    must then only be changed through the tree, as by tree[data] = value.
+
+    duplicates says what inserting a key that is already in the tree does.
+    ALLOW adds another node, as a plain binary search tree would. COUNT
+    keeps one node per key and counts the inserts on it, so memory and
+    height grow with the distinct keys only; len, select, rank, delete and
+    keys, values and items all go by the counts, while iterating the tree
+    or irange gives every node once. IGNORE drops the new key and REJECT
+    raises ValueError, which makes the tree a set. Writing through
+    __setitem__ always replaces the value of the key instead.
+
+    With pool_size set, the tree keeps up to that many of the nodes it
+    deletes and insert reinitializes one of them rather than allocating,
+    which spares the allocator and the garbage collector under steady
+    churn. A node handle must then not be used after its node is deleted,
+    as the node may already hold other data. pool_stats shows the reuse.
+
     Attributes
     ----------
     Preorder: int
@@ -43,9 +218,49 @@ class rb_tree(object):
     self.root: Node
         Root of the tree
     self.sentinel: Null node
+    self.key: function or None
+        Maps data to the key it is ordered by, None to order by data itself
+    self.reverse: bool
+        Whether the tree is ordered from the largest key down
+    self.duplicates: int
+        ALLOW, COUNT, IGNORE or REJECT, what inserting a key already in the tree does
+    self.monoid: monoid or None
+        How the values of a range are combined by reduce_range
+    self._min, self._max: Node or None
+        The nodes with the smallest and largest keys, kept up to date by
+        insert and delete, or None when they have to be looked up again.
+        They go by key, whichever way the tree is ordered
+    self._combine: function or None
+        The combine of the monoid, flipped on a reversed tree
+    self.pool_size: int
+        Most deleted nodes kept in self._pool for insert to reuse, 0 for no pool
+    node_type: type
+        The class of the nodes the tree makes, Node unless a subclass needs more fields
+    augmented: bool
+        Whether augment has to be called when nodes are relinked
 
     Methods
     -------
+    from_sorted(arg1=iterable, arg2=values, arg3=key, arg4=reverse, arg5=duplicates, arg6=monoid, arg7=pool_size):
+        Builds a tree from sorted data in O(n)
+    from_iterable(arg1=iterable, arg2=key, arg3=reverse, arg4=duplicates, arg5=monoid, arg6=pool_size):
+        Builds a tree from unsorted data with a sort and from_sorted
+    like(arg1=iterable, arg2=values), copy():
+        Build a tree with the same class and settings, from sorted data or from this tree
+    __key_of(arg1=data):
+        The key a node holding data is ordered by
+    __build(arg1=nodes, arg2=counts):
+        Relinks sorted nodes into a balanced tree
+    __collapse(arg1=nodes):
+        Applies the duplicates mode to sorted nodes before a build
+    augment(arg1=node), __refresh(arg1=node):
+        Keep the aggregates or the fields of an augmented subclass up to date, for one node or up to the root
+    freeze(arg1=values):
+        Takes a read-only NumPy snapshot of the tree for batch queries
+    save(arg1=path):
+        Writes the tree to a file
+    load(arg1=path, arg2=mmap):
+        Maps a file written by save as a read-only snapshot
     print_tree():
         Print the data of all nodes in order
     __print_tree(arg1=curr_node):
@@ -62,22 +277,75 @@ class rb_tree(object):
         A preorder traversal of the tree
     postorder():
         A postorder traversal of the tree
-    __traverse(arg1 = curr_node, arg2 = traversal type):
+    __traverse(arg1 = curr_node, arg2 = traversal type, arg3 = mirrored):
         Helper function for tree traversals
-    find_min():
-        Finds node with minimum value in tree
-    find_node(arg1 = data):
-        Finds node with value specified by data
+    find_min(), find_max():
+        Finds the first or last node in order, in O(1) once known
+    __first(), __last():
+        Find the nodes with the smallest and largest keys, whichever way the tree is ordered
+    peek_min(), peek_max():
+        The first or last node in order, or None if the tree is empty
+    pop_min(), pop_max():
+        Removes the first or last node in order and returns its data and value
+    pop_n_smallest(arg1 = k):
+        Removes the first k nodes and returns their data and values in order
+    find_node(arg1 = data, arg2 = default):
+        Finds node with value specified by data, raising KeyError or
+        returning default if it is missing
+    get(arg1 = data, arg2 = default):
+        Finds node with value specified by data, or returns default
+    __contains__(arg1 = data):
+        Checks whether a node with value data is in the tree
+    find_key(arg1 = key, arg2 = default):
+        Finds the node with the given key, or returns default
     __get(arg1=data, arg2=current_node):
         Helper function for find_node
     find_successor(arg1=data):
         Finds the successor of the node with the given data
-    insert(arg1=data):
-        Insert a node that contains the given data into the tree
+    successor(arg1=current_node), predecessor(arg1=current_node):
+        Step from a node to its neighbour in order
+    __next(arg1=current_node), __prev(arg1=current_node):
+        Step from a node to its neighbour by key, whichever way the tree is ordered
+    __ceiling(arg1=data, arg2=inclusive), __floor(arg1=data, arg2=inclusive):
+        Find the first node above or the last node below data
+    floor(arg1=data), ceiling(arg1=data), lower(arg1=data), higher(arg1=data):
+        Find the nearest node at or below, at or above, below or above data
+    cursor(arg1=data):
+        Creates an rb_cursor positioned at the first node at or above data
+    irange(arg1=lo, arg2=hi, arg3=inclusive, arg4=reverse):
+        Lazily iterates over the nodes with data between lo and hi
+    irange_key(arg1=lo, arg2=hi, arg3=inclusive, arg4=reverse), __irange(arg1=lo, arg2=hi, arg3=inclusive, arg4=reverse):
+        The same between two keys, and the helper function for both
+    insert(arg1=data, arg2=value):
+        Insert a node that contains the given data into the tree and returns it
+    __insert(arg1=data, arg2=value, arg3=replace):
+        Helper function for insert and __setitem__
     bst_insert(arg1=data):
         Inserts a node as you would in a binary search tree
-    __put(arg1=data, arg2=current_node):
+    __put(arg1=data, arg2=key, arg3=current_node, arg4=value, arg5=replace, arg6=node):
         Helper function for insert that finds appropriate place to put a node in the tree
+    __getitem__(arg1=data), __setitem__(arg1=data, arg2=value), __delitem__(arg1=data):
+        Map access to the value stored under data
+    setdefault(arg1=data, arg2=default), pop(arg1=data, arg2=default):
+        Map helpers that behave like their dict counterparts
+    keys(), values(), items():
+        Iterate over data, values or (data, value) pairs in order
+    __len__():
+        Number of nodes in the tree, or of inserts counted on them, in O(1)
+    count(arg1 = data):
+        Number of times data is in the tree
+    select(arg1 = k):
+        Finds the k-th node in order
+    rank(arg1 = data):
+        Counts the nodes with data that comes before the given data
+    count_range(arg1 = lo, arg2 = hi, arg3 = inclusive):
+        Counts the nodes with data between lo and hi
+    reduce_range(arg1 = lo, arg2 = hi, arg3 = inclusive):
+        Combines the values of the nodes with data between lo and hi with the monoid
+    __item(arg1 = node), __fold_above(arg1 = node, arg2 = key, arg3 = inclusive), __fold_below(arg1 = node, arg2 = key, arg3 = inclusive):
+        Helper functions for reduce_range
+    __rank(arg1 = data, arg2 = inclusive):
+        Helper function for rank and count_range
     left_rotate(arg1 = x):
         Rotates node to the left
     right_rotate(arg1 = x):
@@ -88,7 +356,33 @@ class rb_tree(object):
         Replaces one node(original) with another(replacer)
     delete(arg1 = data):
         Deletes node with given data as would in a binary search tree
-    __rb_delete_fixup(arg1 = x):
+    delete_node(arg1 = node):
+        Deletes a node of the tree without searching for it
+    update_key(arg1 = node, arg2 = data):
+        Gives a node of the tree new data, moving the node only if its place changes
+    __discard(arg1 = node):
+        Takes one count off a node, removing it once none are left
+    __new_node(arg1 = data, arg2 = key, arg3 = value, arg4 = parent), __recycle(arg1 = node):
+        Take nodes from and give them back to the node pool
+    pool_stats():
+        How often insert reused a pooled node
+    __remove(arg1 = node):
+        Helper function for delete that unlinks a node and rebalances the tree
+    insert_many(arg1 = iterable, arg2 = values):
+        Inserts a batch of data
+    delete_many(arg1 = iterable):
+        Deletes a batch of data
+    join(arg1 = left, arg2 = data, arg3 = right, arg4 = value):
+        Joins two trees around a new node
+    split(arg1 = data):
+        Splits the tree into the data below data and the rest
+    union(arg1 = other), intersection(arg1 = other), difference(arg1 = other):
+        Set algebra against the data of another tree, in place
+    __join(arg1 = left, arg2 = node, arg3 = right, arg4 = left_height, arg5 = right_height), __join2(arg1 = left, arg2 = left_height, arg3 = right, arg4 = right_height):
+        Join subtrees of known black heights with or without a middle node
+    __split(arg1 = root, arg2 = data, arg3 = inclusive, arg4 = height), __split3(arg1 = root, arg2 = data, arg3 = height):
+        Split a subtree in two or three parts
+    __rb_delete_fixup(arg1 = x, arg2 = parent):
         Fixes tree after node is deleted   
     """
 
@@ -96,13 +390,272 @@ class rb_tree(object):
     INORDER = 2
     POSTORDER = 3
 
+    ALLOW = 0
+    COUNT = 1
+    IGNORE = 2
+    REJECT = 3
+
+    # What trees that keep more on each node change, see augment
+    node_type = Node
+    augmented = False
+
     # Initialize root and size
-    def __init__(self):
-        self.root = None
-        self.sentinel = Node(None, color='black')
-        self.sentinel.parent = self.sentinel
-        self.sentinel.left = self.sentinel
-        self.sentinel.right = self.sentinel
+    def __init__(self, key=None, reverse=False, duplicates=ALLOW, monoid=None, pool_size=0):
+        if duplicates not in (self.ALLOW, self.COUNT, self.IGNORE, self.REJECT):
+            raise ValueError('Error, unknown duplicates mode')
+        if pool_size < 0:
+            raise ValueError('Error, pool_size is negative')
+        self.sentinel = _SENTINEL
+        self.root = self.sentinel
+        self.key = key
+        self.reverse = reverse
+        self.duplicates = duplicates
+        self.monoid = monoid
+        self._min = None
+        self._max = None
+        self.pool_size = pool_size
+        self._pool = [] if pool_size else None
+        self._reused = 0
+        self._allocated = 0
+        self._combine = None
+        if monoid is not None:
+            self._combine = _flipped(monoid.combine) if reverse else monoid.combine
+            self.node_type = _aknode if key is not None else _anode
+            self.augmented = True
+        elif key is not None:
+            self.node_type = _knode
+
+    @classmethod
+    def from_sorted(cls, iterable, values=None, key=None, reverse=False, duplicates=ALLOW, monoid=None, pool_size=0):
+        """
+        Builds a tree from data that is already in non-decreasing order in
+        O(n), without a single rotation. Equal keys are handled by the
+        duplicates mode as if they were inserted in order.
+
+        Parameters
+        ----------
+        iterable : iterable
+            The data in sorted order, by key and reversed if reverse is set
+        values : iterable, optional
+            Values matching iterable one to one, for use as a map
+        key : function, optional
+            The key function of the tree
+        reverse : bool
+            Whether the tree is ordered from the largest key down
+        duplicates : int
+            The duplicates mode of the tree
+        monoid : monoid, optional
+            How reduce_range combines values
+        pool_size : int
+            How many deleted nodes the tree keeps for reuse
+
+        Raises
+        ------
+        ValueError
+            If iterable is not sorted, values does not match it in length,
+            or iterable repeats a key and duplicates is REJECT
+        """
+        data = list(iterable)
+        values = None if values is None else list(values)
+        if values is not None and len(values) != len(data):
+            raise ValueError('Error, data and values differ in length')
+        tree = cls(key, reverse, duplicates, monoid, pool_size)
+        keys = data if key is None else [tree.__key_of(item) for item in data]
+        if reverse:
+            # The nodes are linked from the smallest key up all the same
+            data.reverse()
+            if keys is not data:
+                keys.reverse()
+            if values is not None:
+                values.reverse()
+        for i in range(1, len(keys)):
+            if keys[i] < keys[i - 1]:
+                raise ValueError('Error, data is not sorted')
+        sentinel = tree.sentinel
+        node_type = tree.node_type
+        with _gc_paused():
+            if keys is data:
+                if values is None:
+                    nodes = [node_type(item, sentinel, sentinel) for item in data]
+                else:
+                    nodes = [node_type(item, sentinel, sentinel, None, 'red', value)
+                             for item, value in zip(data, values)]
+            else:
+                if values is None:
+                    values = [None] * len(data)
+                nodes = [node_type(item, sentinel, sentinel, None, 'red', value, item_key)
+                         for item, value, item_key in zip(data, values, keys)]
+            tree.__build(*tree.__collapse(nodes))
+        return tree
+
+    @classmethod
+    def from_iterable(cls, iterable, key=None, reverse=False, duplicates=ALLOW, monoid=None, pool_size=0):
+        # Sorts the data and bulk loads it with from_sorted
+        return cls.from_sorted(sorted(iterable, key=key, reverse=reverse), key=key, reverse=reverse,
+                               duplicates=duplicates, monoid=monoid, pool_size=pool_size)
+
+    def like(self, iterable, values=None):
+        # Bulk loads sorted data with from_sorted into a tree of the same class and settings
+        return type(self).from_sorted(iterable, values, self.key, self.reverse, self.duplicates,
+                                      self.monoid, self.pool_size)
+
+    def copy(self):
+        # A tree like this one holding the same data and values, built in O(n)
+        return self.like(self.keys(), self.values())
+
+    # Helper function __key_of gives the key that a node holding data is ordered by
+    def __key_of(self, data):
+        return data if self.key is None else self.key(data)
+
+    # Helper function __build relinks a list of nodes, sorted by data, into a perfectly
+    # balanced tree. Only the nodes on the deepest level are red, so every path from
+    # the root down has the same number of black nodes. counts gives the count of
+    # each node, or is None when every count is 1
+    def __build(self, nodes, counts=None):
+        sentinel = self.sentinel
+        red_depth = len(nodes).bit_length() - 1
+        augment = self.augment if self.augmented else None
+
+        def build(lo, hi, depth, parent):
+            mid = (lo + hi) // 2
+            node = nodes[mid]
+            node.parent = parent
+            node.red = depth == red_depth
+            node.left = build(lo, mid, depth + 1, node) if lo < mid else sentinel
+            node.right = build(mid + 1, hi, depth + 1, node) if mid + 1 < hi else sentinel
+            if counts is None:
+                node.size = hi - lo
+            else:
+                node.size = node.left.size + node.right.size + counts[mid]
+            if augment is not None:
+                augment(node)
+            return node
+
+        if nodes:
+            self.root = build(0, len(nodes), 0, sentinel)
+            self.root.red = BLACK
+        else:
+            self.root = sentinel
+        self._min = self._max = None
+
+    # Helper function __collapse applies the duplicates mode to nodes sorted by key,
+    # before any of them is relinked, and returns the nodes to build and their counts.
+    # COUNT folds the counts of equal keys into the node with the key that was inserted
+    # first, which is the first one or on a reversed tree the last one, IGNORE keeps
+    # only that node and REJECT raises ValueError
+    def __collapse(self, nodes):
+        duplicates = self.duplicates
+        if duplicates == self.ALLOW or not nodes:
+            return nodes, None
+        reverse = self.reverse
+        kept = [nodes[0]]
+        counts = [nodes[0].count]
+        for i in range(1, len(nodes)):
+            node = nodes[i]
+            if kept[-1].key < node.key:
+                kept.append(node)
+                counts.append(node.count)
+                continue
+            if duplicates == self.REJECT:
+                raise ValueError('Error, data is already in the tree')
+            if duplicates == self.COUNT:
+                counts[-1] += node.count
+            if reverse:
+                kept[-1] = node
+        return kept, counts if duplicates == self.COUNT else None
+
+    def augment(self, node):
+        """
+        Recomputes what node keeps about its subtree from node and its
+        children, which are already up to date. The tree calls it bottom up
+        wherever it relinks nodes or changes a value or count, including in
+        the rotations, once augmented is set. Here it folds the subtree with
+        the monoid; subclasses that keep something else set augmented and
+        node_type and override it.
+
+        Parameters
+        ----------
+        node : Node
+            The node to update, never the sentinel
+        """
+        sentinel = self.sentinel
+        combine = self._combine
+        aggregate = self.__item(node)
+        if node.left is not sentinel:
+            aggregate = combine(node.left.aggregate, aggregate)
+        if node.right is not sentinel:
+            aggregate = combine(aggregate, node.right.aggregate)
+        node.aggregate = aggregate
+
+    # Helper function __refresh calls augment on node and every node above it
+    def __refresh(self, node):
+        sentinel = self.sentinel
+        while node is not sentinel:
+            self.augment(node)
+            node = node.parent
+
+    def freeze(self, values=False):
+        """
+        Returns an rb_snapshot of the tree: the keys it is ordered by, which
+        are its data unless it has a key function, and values if asked for,
+        in read-only NumPy arrays that answer batches of lookups with
+        numpy.searchsorted. Needs NumPy.
+
+        Parameters
+        ----------
+        values : bool
+            Whether to capture the values as well
+        """
+        from rb_snapshot import rb_snapshot
+        return rb_snapshot.from_tree(self, values)
+
+    def save(self, path):
+        """
+        Writes the data, values and colors of the tree, in order, to a
+        versioned and checksummed file that load maps back into memory,
+        along with the duplicates mode. Values are only written if some node
+        has one. Needs NumPy.
+
+        Parameters
+        ----------
+        path : str
+            Where to write the tree
+
+        Raises
+        ------
+        ValueError
+            If the data or values are not all numbers, or otherwise of one
+            fixed size type, or the tree has a key function, as the file
+            could only hold the keys and not the data
+        """
+        if self.key is not None:
+            raise ValueError('Error, cannot save a tree with a key function')
+        from rb_snapshot import rb_snapshot
+        values = any(node.value is not None for node in self)
+        rb_snapshot.from_tree(self, values, colors=True).save(path)
+
+    @staticmethod
+    def load(path, mmap=True):
+        """
+        Reads a file written by save into a read-only rb_snapshot. With mmap
+        the snapshot is a view of the file, so it loads without copying and
+        processes that load the same file share its pages. Call thaw on the
+        snapshot for a writable tree, which is rebuilt in O(n). Needs NumPy.
+
+        Parameters
+        ----------
+        path : str
+            The file to read
+        mmap : bool
+            Whether to map the file instead of reading it into memory
+
+        Raises
+        ------
+        ValueError
+            If the file is not a saved tree or is corrupt
+        """
+        from rb_snapshot import rb_snapshot
+        return rb_snapshot.load(path, mmap)
 
     def print_tree(self):
         # Print the data of all nodes in order
@@ -123,7 +676,7 @@ class rb_tree(object):
         # Extracts the color of the node and print it in the format -dataC-
         # where C is B for black and R for red
         if curr_node is not self.sentinel:
-            node_color = "R" if curr_node.color == "red" else "B"
+            node_color = "R" if curr_node.red else "B"
             print(str(curr_node.data) + node_color, end=' ')  # save space
             self.__print_with_colors(curr_node.left)
             self.__print_with_colors(curr_node.right)
@@ -135,121 +688,757 @@ class rb_tree(object):
     def __iter__(self):
         return self.inorder()
 
+    # The traversals of a reversed tree are mirrored, so they visit the right
+    # subtree of every node first
     def inorder(self):
-        return self.__traverse(self.root, rb_tree.INORDER)
+        return self.__traverse(self.root, rb_tree.INORDER, self.reverse)
 
     def preorder(self):
-        return self.__traverse(self.root, rb_tree.PREORDER)
+        return self.__traverse(self.root, rb_tree.PREORDER, self.reverse)
 
     def postorder(self):
-        return self.__traverse(self.root, rb_tree.POSTORDER)
+        return self.__traverse(self.root, rb_tree.POSTORDER, self.reverse)
 
-    def __traverse(self, curr_node, traversal_type):
-        if curr_node is not self.sentinel:
-            if traversal_type == self.PREORDER:
-                yield curr_node
-            yield from self.__traverse(curr_node.left, traversal_type)
-            if traversal_type == self.INORDER:
+    def __traverse(self, curr_node, traversal_type, mirrored=False):
+        # Walks the subtree rooted at curr_node with an explicit stack instead
+        # of nested generators, so each yielded node costs O(1) frames
+        sentinel = self.sentinel
+        stack = []
+        if traversal_type == self.INORDER:
+            if mirrored:
+                while True:
+                    while curr_node is not sentinel:
+                        stack.append(curr_node)
+                        curr_node = curr_node.right
+                    if not stack:
+                        return
+                    curr_node = stack.pop()
+                    yield curr_node
+                    curr_node = curr_node.left
+            while True:
+                while curr_node is not sentinel:
+                    stack.append(curr_node)
+                    curr_node = curr_node.left
+                if not stack:
+                    return
+                curr_node = stack.pop()
                 yield curr_node
-            yield from self.__traverse(curr_node.right, traversal_type)
-            if traversal_type == self.POSTORDER:
+                curr_node = curr_node.right
+        elif traversal_type == self.PREORDER:
+            if curr_node is not sentinel:
+                stack.append(curr_node)
+            while stack:
+                curr_node = stack.pop()
                 yield curr_node
+                first, second = curr_node.left, curr_node.right
+                if mirrored:
+                    first, second = second, first
+                if second is not sentinel:
+                    stack.append(second)
+                if first is not sentinel:
+                    stack.append(first)
+        else:
+            # Postorder: a node is yielded once its second subtree is done
+            last_node = sentinel
+            while stack or curr_node is not sentinel:
+                if curr_node is not sentinel:
+                    stack.append(curr_node)
+                    curr_node = curr_node.right if mirrored else curr_node.left
+                else:
+                    top = stack[-1]
+                    second = top.left if mirrored else top.right
+                    if second is not sentinel and second is not last_node:
+                        curr_node = second
+                    else:
+                        last_node = stack.pop()
+                        yield last_node
 
-    # find_min travels across the leftChild of every node,
-    # and returns the node who has no leftChild. This is the min value of a subtree
+    # find_min and find_max give the first and last node in order, which on a reversed
+    # tree are the ones with the largest and smallest keys
     def find_min(self):
+        return self.__last() if self.reverse else self.__first()
+
+    def find_max(self):
+        return self.__first() if self.reverse else self.__last()
+
+    # __first travels across the leftChild of every node,
+    # and returns the node who has no leftChild. This is the min value of a subtree.
+    # The node found is kept until it is deleted, so later calls take O(1)
+    def __first(self):
+        if self._min is not None:
+            return self._min
         current_node = self.root
         while current_node.left is not self.sentinel:
             current_node = current_node.left
+        if current_node is not self.sentinel:
+            self._min = current_node
         return current_node
 
-    # find_node expects a data and returns the Node object for the given data
-    def find_node(self, data):
-        if self.root:
-            res = self.__get(data, self.root)
-            if res:
-                return res
-            else:
-                raise KeyError('Error, data not found')
-        else:
+    def __last(self):
+        if self._max is not None:
+            return self._max
+        current_node = self.root
+        while current_node.right is not self.sentinel:
+            current_node = current_node.right
+        if current_node is not self.sentinel:
+            self._max = current_node
+        return current_node
+
+    # peek_min and peek_max give the node at either end, or None if the tree is empty
+    def peek_min(self):
+        node = self.find_min()
+        return None if node is self.sentinel else node
+
+    def peek_max(self):
+        node = self.find_max()
+        return None if node is self.sentinel else node
+
+    # find_node expects a data and returns the Node object holding data's key.
+    # If default is given it is returned on a miss instead of raising KeyError
+    def find_node(self, data, default=_MISSING):
+        res = self.__get(self.__key_of(data), self.root)
+        if res is not None:
+            return res
+        if default is not _MISSING:
+            return default
+        if self.root is self.sentinel:
             raise KeyError('Error, tree has no root')
+        raise KeyError('Error, data not found')
 
-    # Helper function __get receives a data and a node. Returns the node with the given data
-    def __get(self, data, current_node):
-        if current_node is self.sentinel:  # if current_node does not exist return None
-            print("couldn't find data: {}".format(data))
-            return None
-        elif current_node.data == data:
-            return current_node
-        elif data < current_node.data:
-            # Recursively call __get with data and current_node's left
-            return self.__get(data, current_node.left)
-        else:  # data is greater than current_node.data
-            # Recursively call __get with data and current_node's right
-            return self.__get(data, current_node.right)
+    # get returns the node holding data, or default if there is none. Never raises
+    def get(self, data, default=None):
+        res = self.__get(self.__key_of(data), self.root)
+        return default if res is None else res
+
+    def __contains__(self, data):
+        return self.__get(self.__key_of(data), self.root) is not None
+
+    # find_key returns the node whose key is key, or default if there is none. It takes
+    # the key itself, as the key function returns it, rather than data
+    def find_key(self, key, default=None):
+        res = self.__get(key, self.root)
+        return default if res is None else res
+
+    # Helper function __get receives a key and a node. Returns the node with the given key,
+    # or None if no node holds it
+    def __get(self, key, current_node):
+        sentinel = self.sentinel
+        while current_node is not sentinel:
+            node_key = current_node.key
+            if node_key == key:
+                return current_node
+            elif key < node_key:
+                current_node = current_node.left
+            else:  # key is greater than current_node.key
+                current_node = current_node.right
+        return None
 
     def find_successor(self, data):
-        # Private Method, can only be used inside of BST.
-        current_node = self.find_node(data)
-        if current_node is self.sentinel:
-            raise KeyError
+        # Finds the node that follows the node holding data, or None if it is the last
+        return self.successor(self.find_node(data))
+
+    # successor steps from a node to the next one in order, or None past the last.
+    # Walking the whole tree this way costs amortized O(1) per step
+    def successor(self, current_node):
+        return self.__prev(current_node) if self.reverse else self.__next(current_node)
+
+    # predecessor steps from a node to the previous one in order, or None before the first
+    def predecessor(self, current_node):
+        return self.__next(current_node) if self.reverse else self.__prev(current_node)
+
+    # Helper function __next steps from a node to the one with the next larger key
+    def __next(self, current_node):
+        sentinel = self.sentinel
         # Travel left down the rightmost subtree
-        if current_node.right:
+        if current_node.right is not sentinel:
             current_node = current_node.right
-            while current_node.left is not self.sentinel:
+            while current_node.left is not sentinel:
                 current_node = current_node.left
-            successor = current_node
+            return current_node
         # Travel up until the node is a left child
+        parent = current_node.parent
+        while parent is not sentinel and current_node is parent.right:
+            current_node = parent
+            parent = parent.parent
+        return None if parent is sentinel else parent
+
+    # Helper function __prev steps from a node to the one with the next smaller key
+    def __prev(self, current_node):
+        sentinel = self.sentinel
+        # Travel right down the leftmost subtree
+        if current_node.left is not sentinel:
+            current_node = current_node.left
+            while current_node.right is not sentinel:
+                current_node = current_node.right
+            return current_node
+        # Travel up until the node is a right child
+        parent = current_node.parent
+        while parent is not sentinel and current_node is parent.left:
+            current_node = parent
+            parent = parent.parent
+        return None if parent is sentinel else parent
+
+    # Helper function __ceiling finds the first node whose key is at least key,
+    # or strictly greater if inclusive is not set. Returns None if there is none
+    def __ceiling(self, key, inclusive):
+        sentinel = self.sentinel
+        current_node = self.root
+        found = None
+        while current_node is not sentinel:
+            if key < current_node.key or (inclusive and key == current_node.key):
+                found = current_node
+                current_node = current_node.left
+            else:
+                current_node = current_node.right
+        return found
+
+    # Helper function __floor finds the last node whose key is at most key,
+    # or strictly smaller if inclusive is not set. Returns None if there is none
+    def __floor(self, key, inclusive):
+        sentinel = self.sentinel
+        current_node = self.root
+        found = None
+        while current_node is not sentinel:
+            if current_node.key < key or (inclusive and key == current_node.key):
+                found = current_node
+                current_node = current_node.right
+            else:
+                current_node = current_node.left
+        return found
+
+    # floor, ceiling, lower and higher return the nearest node on one side of data in
+    # order, or None. On a reversed tree the nodes before data have larger keys
+    def floor(self, data):
+        if self.reverse:
+            return self.__ceiling(self.__key_of(data), True)
+        return self.__floor(self.__key_of(data), True)
+
+    def ceiling(self, data):
+        if self.reverse:
+            return self.__floor(self.__key_of(data), True)
+        return self.__ceiling(self.__key_of(data), True)
+
+    def lower(self, data):
+        if self.reverse:
+            return self.__ceiling(self.__key_of(data), False)
+        return self.__floor(self.__key_of(data), False)
+
+    def higher(self, data):
+        if self.reverse:
+            return self.__floor(self.__key_of(data), False)
+        return self.__ceiling(self.__key_of(data), False)
+
+    def cursor(self, data=None):
+        # Returns an rb_cursor on the first node at or above data, or on the smallest node
+        cursor = rb_cursor(self)
+        if data is None:
+            cursor.first()
         else:
-            parent = current_node.parent
-            while parent is not self.sentinel and current_node is not parent.left:
-                current_node = parent
-                parent = parent.parent
-            successor = parent
-        if successor:
-            return successor
+            cursor.seek(data)
+        return cursor
+
+    def irange(self, lo=None, hi=None, inclusive=(True, False), reverse=False):
+        """
+        Lazily yields the nodes with data between lo and hi in order.
+        Finding the first node costs O(log n) and each further node is one
+        successor step, so a scan over k nodes costs O(log n + k).
+
+        Parameters
+        ----------
+        lo : optional
+            Lower bound, None for no lower bound
+        hi : optional
+            Upper bound, None for no upper bound
+        inclusive : (bool, bool)
+            Whether lo and hi themselves are included
+        reverse : bool
+            Yield from hi down to lo instead
+        """
+        return self.__irange(None if lo is None else self.__key_of(lo),
+                             None if hi is None else self.__key_of(hi), inclusive, reverse)
+
+    def irange_key(self, lo=None, hi=None, inclusive=(True, False), reverse=False):
+        # irange with bounds that are keys, as the key function returns them, rather than data
+        return self.__irange(lo, hi, inclusive, reverse)
+
+    # Helper function __irange is irange over bounds that are already keys of the tree.
+    # A reversed tree walks its keys from lo down to hi, which is the same as walking
+    # from hi up to lo backwards
+    def __irange(self, lo, hi, inclusive, reverse):
+        sentinel = self.sentinel
+        if self.root is sentinel:
+            return
+        if self.reverse:
+            lo, hi, inclusive, reverse = hi, lo, (inclusive[1], inclusive[0]), not reverse
+        if not reverse:
+            if lo is None:
+                current_node = self.__first()
+            else:
+                current_node = self.__ceiling(lo, inclusive[0])
+            hi_inclusive = inclusive[1]
+            while current_node is not None:
+                if hi is not None and (hi < current_node.key or
+                                       (not hi_inclusive and hi == current_node.key)):
+                    return
+                yield current_node
+                current_node = self.__next(current_node)
         else:
-            return None
+            if hi is None:
+                current_node = self.__last()
+            else:
+                current_node = self.__floor(hi, inclusive[1])
+            lo_inclusive = inclusive[0]
+            while current_node is not None:
+                if lo is not None and (current_node.key < lo or
+                                       (not lo_inclusive and lo == current_node.key)):
+                    return
+                yield current_node
+                current_node = self.__prev(current_node)
 
-    # put adds a node to the tree
-    def insert(self, data):
+    # put adds a node to the tree and returns it, as a handle for delete_node and
+    # update_key. If the duplicates mode counts or ignores data that is already in
+    # the tree, the node already holding it is returned instead
+    def insert(self, data, value=None):
+        return self.__insert(data, value, False)
+
+    # Helper function __insert adds a node, rebalances the tree and returns the node. With
+    # replace set, a node that already holds data gets its value overwritten instead and is
+    # returned, as it is when the duplicates mode counts or ignores data already in the tree
+    def __insert(self, data, value, replace):
+        key = data if self.key is None else self.key(data)
         # if the tree has a root
-        if self.root and self.root != self.sentinel:
+        if self.root is not self.sentinel:
             # use helper method __put to add the new node to the tree
-            new_node = self.__put(data, self.root)
-            self.__rb_insert_fixup(new_node)
+            new_node, created = self.__put(data, key, self.root, value, replace)
+            if not created:
+                return new_node
         else:  # there is no root
             # make root a Node with values passed to put
-            self.root = Node(data, parent=self.sentinel, left=self.sentinel, right=self.sentinel)
+            self.root = self.__new_node(data, key, value, self.sentinel)
             new_node = self.root
-            self.__rb_insert_fixup(new_node)
+            self._min = self._max = new_node
+            if self.augmented:
+                self.augment(new_node)
+        self.__rb_insert_fixup(new_node)
+        return new_node
 
     # Insertion for Binary Search Tree
     def bst_insert(self, data):
         # if the tree has a root
-        if self.root and self.root != self.sentinel:
+        if self.root is not self.sentinel:
             # use helper method __put to add the new node to the tree
-            self.__put(data, self.root)
+            self.__put(data, self.__key_of(data), self.root)
         else:  # there is no root
             # make root a Node with values passed to put
-            self.root = Node(data, parent=self.sentinel, left=self.sentinel, right=self.sentinel)
-
-    # Helper function __put finds the appropriate place to add a node in the tree
-    def __put(self, data, current_node):
-        if data < current_node.data:
-            if current_node.left != self.sentinel:
-                new_node = self.__put(data, current_node.left)
-            else:  # current_node has no child
-                new_node = Node(data, parent=current_node, left=self.sentinel, right=self.sentinel)
-                current_node.left = new_node
-        else:  # data is greater than or equal to current_node's data
-            if current_node.right != self.sentinel:
-                new_node = self.__put(data, current_node.right)
-            else:  # current_node has no right child
-                new_node = Node(data, parent=current_node, left=self.sentinel, right=self.sentinel)
-                current_node.right = new_node
-        return new_node
-        
+            self.root = self.node_type(data, parent=self.sentinel, left=self.sentinel, right=self.sentinel,
+                                       key=self.__key_of(data))
+            self._min = self._max = self.root
+            if self.augmented:
+                self.augment(self.root)
+
+    # Helper function __put finds the appropriate place to add a node in the tree. A
+    # detached node passed as node, with its data, key and size already set, is
+    # linked there in place of a new one. Returns the node and whether it was linked,
+    # which it is not when an equal key was replaced, counted or ignored, and then
+    # the node holding that key is returned
+    def __put(self, data, key, current_node, value=None, replace=False, node=None):
+        sentinel = self.sentinel
+        duplicates = self.duplicates
+        # A reversed tree shows equal keys from right to left, so a new one goes to
+        # their left to come out after them
+        equal_left = self.reverse and not (replace or duplicates)
+        while True:
+            if key < current_node.key or (equal_left and key == current_node.key):
+                if current_node.left is sentinel:  # current_node has no left child
+                    if node is None:
+                        node = self.__new_node(data, key, value, current_node)
+                    else:
+                        node.parent = current_node
+                    current_node.left = node
+                    break
+                current_node = current_node.left
+            elif (replace or duplicates) and key == current_node.key:
+                if replace:
+                    current_node.value = value
+                elif duplicates == self.COUNT:
+                    # One more count on the node, and on every subtree holding it
+                    ancestor = current_node
+                    while ancestor is not sentinel:
+                        ancestor.size += 1
+                        ancestor = ancestor.parent
+                elif duplicates == self.REJECT:
+                    raise ValueError('Error, data is already in the tree')
+                else:
+                    return current_node, False
+                if self.augmented:
+                    self.__refresh(current_node)
+                return current_node, False
+            else:  # key is greater than or equal to current_node's key
+                if current_node.right is sentinel:  # current_node has no right child
+                    if node is None:
+                        node = self.__new_node(data, key, value, current_node)
+                    else:
+                        node.parent = current_node
+                    current_node.right = node
+                    break
+                current_node = current_node.right
+        # Every ancestor of the new node gained the node, with all of its count
+        grown = node.size
+        while current_node is not sentinel:
+            current_node.size += grown
+            current_node = current_node.parent
+        if self.augmented:
+            self.__refresh(node)
+        # An equal key goes to the right, so it becomes the largest but not the smallest,
+        # or the other way round on a reversed tree
+        if self._min is not None and (key < self._min.key or (equal_left and key == self._min.key)):
+            self._min = node
+        if self._max is not None and not (key < self._max.key or (equal_left and key == self._max.key)):
+            self._max = node
+        return node, True
+
+    # Helper function __new_node makes a node for insert, taking it from the pool when
+    # the pool has one
+    def __new_node(self, data, key, value, parent):
+        sentinel = self.sentinel
+        pool = self._pool
+        if pool:
+            node = pool.pop()
+            node.__init__(data, sentinel, sentinel, parent, 'red', value, key)
+            self._reused += 1
+            return node
+        if pool is not None:
+            self._allocated += 1
+        return self.node_type(data, sentinel, sentinel, parent, 'red', value, key)
+
+    # Helper function __recycle puts a node that left the tree in the pool, if the pool
+    # is not full, dropping everything the node refers to so the pool keeps nothing
+    # else alive
+    def __recycle(self, node):
+        pool = self._pool
+        if pool is not None and len(pool) < self.pool_size:
+            node.data = node.value = node.key = None
+            node.left = node.right = node.parent = None
+            pool.append(node)
+
+    def pool_stats(self):
+        """
+        Returns how the node pool has done since the tree was made, as a dict
+        of reused, the new nodes taken from the pool, allocated, the new
+        nodes made because the pool was empty, pooled, the nodes waiting in
+        the pool, capacity, the pool size, and reuse_rate, the share of new
+        nodes that were reused. Only single inserts draw from the pool, bulk
+        loads allocate their nodes in one go.
+        """
+        made = self._reused + self._allocated
+        return {
+            'reused': self._reused,
+            'allocated': self._allocated,
+            'pooled': 0 if self._pool is None else len(self._pool),
+            'capacity': self.pool_size,
+            'reuse_rate': self._reused / made if made else 0.0,
+        }
+
+    # The map interface stores one value per key. Setting the data of an existing
+    # key replaces its value in place instead of adding another node
+    def __getitem__(self, data):
+        node = self.__get(self.__key_of(data), self.root)
+        if node is None:
+            raise KeyError(data)
+        return node.value
+
+    def __setitem__(self, data, value):
+        self.__insert(data, value, True)
+
+    def __delitem__(self, data):
+        self.delete(data)
+
+    def setdefault(self, data, default=None):
+        # Returns the value of data, inserting it with default first if it is missing
+        node = self.__get(self.__key_of(data), self.root)
+        if node is None:
+            self.__insert(data, default, False)
+            return default
+        return node.value
+
+    def pop(self, data, default=_MISSING):
+        # Removes data and returns its value, or default if data is missing
+        node = self.__get(self.__key_of(data), self.root)
+        if node is None:
+            if default is _MISSING:
+                raise KeyError(data)
+            return default
+        value = node.value
+        self.__discard(node)
+        return value
+
+    # pop_min and pop_max remove the node at either end, or one count of it, and return
+    # its data and value like dict.popitem, raising KeyError if the tree is empty
+    def pop_min(self):
+        node = self.find_min()
+        if node is self.sentinel:
+            raise KeyError('Error, the tree is empty')
+        item = node.data, node.value
+        self.__discard(node)
+        return item
+
+    def pop_max(self):
+        node = self.find_max()
+        if node is self.sentinel:
+            raise KeyError('Error, the tree is empty')
+        item = node.data, node.value
+        self.__discard(node)
+        return item
+
+    def pop_n_smallest(self, k):
+        """
+        Removes the first k nodes in order, which have the smallest keys
+        unless the tree is reversed, or every node if there are fewer, and
+        returns their data and values in order. Each node is taken off the
+        cached first end in O(log n), and once k is large
+        next to the tree the rest is rebuilt in O(n) instead, like
+        delete_many.
+
+        Parameters
+        ----------
+        k : int
+            How many nodes to remove, counting every count of a node
+        """
+        items = []
+        if k <= 0:
+            return items
+        if k * 4 >= self.root.size:
+            nodes = list(self.inorder())
+            counts = None
+            if self.duplicates != self.COUNT:
+                kept = nodes[k:]
+                dropped = nodes[:k]
+                items = [(node.data, node.value) for node in dropped]
+            else:
+                # Take the counts off the smallest nodes until k are taken
+                kept = []
+                dropped = []
+                counts = []
+                for node in nodes:
+                    count = node.count
+                    taken = min(count, k - len(items))
+                    items.extend(repeat((node.data, node.value), taken))
+                    if taken < count:
+                        kept.append(node)
+                        counts.append(count - taken)
+                    else:
+                        dropped.append(node)
+            if self.reverse:
+                # Rebuilt from the smallest key up, the way the tree keeps its nodes
+                kept.reverse()
+                if counts is not None:
+                    counts.reverse()
+            self.__build(kept, counts)
+            if self._pool is not None:
+                for node in dropped:
+                    self.__recycle(node)
+            return items
+        while len(items) < k:
+            items.append(self.pop_min())
+        return items
+
+    # keys, values and items give each node as many times as its count
+    def keys(self):
+        if self.duplicates == self.COUNT:
+            for node in self.inorder():
+                yield from repeat(node.data, node.count)
+            return
+        for node in self.inorder():
+            yield node.data
+
+    def values(self):
+        if self.duplicates == self.COUNT:
+            for node in self.inorder():
+                yield from repeat(node.value, node.count)
+            return
+        for node in self.inorder():
+            yield node.value
+
+    def items(self):
+        if self.duplicates == self.COUNT:
+            for node in self.inorder():
+                yield from repeat((node.data, node.value), node.count)
+            return
+        for node in self.inorder():
+            yield node.data, node.value
+
+    # Order statistics use the subtree sizes kept on every node
+    def __len__(self):
+        return self.root.size
+
+    def count(self, data):
+        # Number of times data is in the tree, whatever the duplicates mode
+        return self.count_range(data, data, (True, True))
+
+    def select(self, k):
+        """
+        Returns the k-th node in order, counting from 0, which holds the
+        k-th smallest data unless the tree is reversed. Negative k counts
+        from the last node, like a list index. A node with a
+        count above 1 takes up that many positions.
+
+        Parameters
+        ----------
+        k : int
+            Position of the node in an inorder traversal
+
+        Raises
+        ------
+        IndexError
+            If k is out of range
+        """
+        node = self.root
+        if k < 0:
+            k += node.size
+        if k < 0 or k >= node.size:
+            raise IndexError('Error, index out of range')
+        if self.reverse:
+            k = node.size - 1 - k
+        while True:
+            if k < node.left.size:
+                node = node.left
+            else:
+                # Step past the left subtree and the count of node
+                k -= node.size - node.right.size
+                if k < 0:
+                    return node
+                node = node.right
+
+    def rank(self, data):
+        # Number of nodes whose key comes before the given key, which on a reversed
+        # tree are the ones with larger keys
+        if self.reverse:
+            return self.root.size - self.__rank(self.__key_of(data), True)
+        return self.__rank(self.__key_of(data), False)
+
+    def count_range(self, lo, hi, inclusive=(True, False)):
+        # Number of nodes with lo <= key < hi. inclusive says whether each bound is included
+        if self.reverse:
+            lo, hi, inclusive = hi, lo, (inclusive[1], inclusive[0])
+        count = self.__rank(self.__key_of(hi), inclusive[1]) - self.__rank(self.__key_of(lo), not inclusive[0])
+        return count if count > 0 else 0
+
+    # Helper function __rank counts the nodes below key, or up to and including it if
+    # inclusive is set, by adding up the left subtrees passed on the way down
+    def __rank(self, key, inclusive):
+        sentinel = self.sentinel
+        current_node = self.root
+        count = 0
+        while current_node is not sentinel:
+            if current_node.key < key or (inclusive and current_node.key == key):
+                count += current_node.size - current_node.right.size
+                current_node = current_node.right
+            else:
+                current_node = current_node.left
+        return count
+
+    def reduce_range(self, lo=None, hi=None, inclusive=(True, False)):
+        """
+        Combines the values of the nodes with lo <= key < hi, in order, with
+        the monoid of the tree in O(log n). The aggregates kept on the
+        subtrees hanging between the two search paths for lo and hi are
+        combined instead of their nodes. reduce_range(None, key) gives a
+        prefix aggregate and reduce_range() that of the whole tree.
+
+        Parameters
+        ----------
+        lo : optional
+            Lower bound, None for no lower bound
+        hi : optional
+            Upper bound, None for no upper bound
+        inclusive : (bool, bool)
+            Whether lo and hi themselves are included
+
+        Raises
+        ------
+        ValueError
+            If the tree has no monoid
+        """
+        if self.monoid is None:
+            raise ValueError('Error, the tree has no monoid')
+        sentinel = self.sentinel
+        lo = None if lo is None else self.__key_of(lo)
+        hi = None if hi is None else self.__key_of(hi)
+        lo_inclusive, hi_inclusive = inclusive
+        if self.reverse:
+            # The range runs from hi up to lo by key, and _combine folds it back down
+            lo, hi, lo_inclusive, hi_inclusive = hi, lo, hi_inclusive, lo_inclusive
+        # Walk down to the highest node in the range, where the paths to lo and hi part
+        node = self.root
+        while node is not sentinel:
+            if lo is not None and (node.key < lo or (not lo_inclusive and lo == node.key)):
+                node = node.right
+            elif hi is not None and (hi < node.key or (not hi_inclusive and hi == node.key)):
+                node = node.left
+            else:
+                break
+        if node is sentinel:
+            return self.monoid.identity
+        combine = self._combine
+        aggregate = combine(self.__fold_above(node.left, lo, lo_inclusive), self.__item(node))
+        return combine(aggregate, self.__fold_below(node.right, hi, hi_inclusive))
+
+    # Helper function __item gives what node adds to an aggregate: its measure, combined
+    # with itself as many times as its count
+    def __item(self, node):
+        monoid = self.monoid
+        item = node.value if monoid.measure is None else monoid.measure(node.data, node.value)
+        count = node.count if self.duplicates == self.COUNT else 1
+        if count == 1:
+            return item
+        combine = self._combine
+        result = None
+        while count:
+            if count & 1:
+                result = item if result is None else combine(result, item)
+            count >>= 1
+            if count:
+                item = combine(item, item)
+        return result
+
+    # Helper functions __fold_above and __fold_below combine the nodes under node with
+    # keys above key, or below it, taking whole subtrees where the path to key passes them
+    def __fold_above(self, node, key, inclusive):
+        sentinel = self.sentinel
+        combine = self._combine
+        if key is None:
+            return self.monoid.identity if node is sentinel else node.aggregate
+        parts = []
+        while node is not sentinel:
+            if key < node.key or (inclusive and key == node.key):
+                right = self.__item(node)
+                if node.right is not sentinel:
+                    right = combine(right, node.right.aggregate)
+                parts.append(right)
+                node = node.left
+            else:
+                node = node.right
+        aggregate = self.monoid.identity
+        for part in reversed(parts):
+            aggregate = combine(aggregate, part)
+        return aggregate
+
+    def __fold_below(self, node, key, inclusive):
+        sentinel = self.sentinel
+        combine = self._combine
+        if key is None:
+            return self.monoid.identity if node is sentinel else node.aggregate
+        aggregate = self.monoid.identity
+        while node is not sentinel:
+            if node.key < key or (inclusive and key == node.key):
+                if node.left is not sentinel:
+                    aggregate = combine(aggregate, node.left.aggregate)
+                aggregate = combine(aggregate, self.__item(node))
+                node = node.right
+            else:
+                node = node.left
+        return aggregate
+
     def left_rotate(self,x:Node):
         """
         Rotates the node x to the left and modifies other nodes based on this rotation
@@ -265,21 +1454,28 @@ class rb_tree(object):
             If x's right child is null node because left rotation is impossible
             if the node's right child is null
         """
-        if x.right == self.sentinel:
+        if x.right is self.sentinel:
             raise KeyError
         y = x.right
+        # y takes over x's subtree, x loses y but gains y's left subtree
+        size = x.size
+        x.size = size - y.size + y.left.size
+        y.size = size
         x.right = y.left
-        if y.left != self.sentinel:
+        if y.left is not self.sentinel:
             y.left.parent = x
         y.parent = x.parent
-        if x.parent == self.sentinel:
+        if x.parent is self.sentinel:
             self.root = y
-        elif x == x.parent.left:
+        elif x is x.parent.left:
             x.parent.left = y
         else:
             x.parent.right = y
         y.left = x
         x.parent = y
+        if self.augmented:
+            self.augment(x)
+            self.augment(y)
 
     def right_rotate(self,x:Node):
         """
@@ -296,21 +1492,28 @@ class rb_tree(object):
             If x's left child is null node because right rotation is impossible
             if the node's left child is null
         """
-        if x.left == self.sentinel:
+        if x.left is self.sentinel:
             raise KeyError
         y = x.left
+        # y takes over x's subtree, x loses y but gains y's right subtree
+        size = x.size
+        x.size = size - y.size + y.right.size
+        y.size = size
         x.left = y.right
-        if y.right != self.sentinel:
+        if y.right is not self.sentinel:
             y.right.parent = x
         y.parent = x.parent
-        if x.parent == self.sentinel:
+        if x.parent is self.sentinel:
             self.root = y
-        elif x == x.parent.left:
+        elif x is x.parent.left:
             x.parent.left = y
         else:
             x.parent.right = y
         y.right = x
         x.parent = y
+        if self.augmented:
+            self.augment(x)
+            self.augment(y)
 
     def __rb_insert_fixup(self, z:Node):
         """
@@ -322,38 +1525,48 @@ class rb_tree(object):
         Z : Node
             Node that was just inserted and needs to be adjusted
             to maintain rb tree properties
+
+        Returns
+        -------
+        bool
+            Whether the black height of the tree grew by one
         """
         # Maintains balancing and coloring property after BST insertion
-        while z.parent.color == 'red':
-            if z.parent == z.parent.parent.left:
+        while z.parent.red:
+            if z.parent is z.parent.parent.left:
                 y = z.parent.parent.right
-                if y.color == 'red':
-                    z.parent.color = 'black'
-                    y.color = 'black'
-                    z.parent.parent.color = 'red'
+                if y.red:
+                    z.parent.red = BLACK
+                    y.red = BLACK
+                    z.parent.parent.red = RED
                     z = z.parent.parent
                 else: 
-                    if z == z.parent.right:
+                    if z is z.parent.right:
                         z = z.parent
                         self.left_rotate(z)
-                    z.parent.color = 'black'
-                    z.parent.parent.color = 'red'
+                    z.parent.red = BLACK
+                    z.parent.parent.red = RED
                     self.right_rotate(z.parent.parent)
             else:
                 y = z.parent.parent.left
-                if y.color == 'red':
-                    z.parent.color = 'black'
-                    y.color = 'black'
-                    z.parent.parent.color = 'red'
+                if y.red:
+                    z.parent.red = BLACK
+                    y.red = BLACK
+                    z.parent.parent.red = RED
                     z = z.parent.parent
                 else: 
-                    if z == z.parent.left:
+                    if z is z.parent.left:
                         z = z.parent
                         self.right_rotate(z)
-                    z.parent.color = 'black'
-                    z.parent.parent.color = 'red'
+                    z.parent.red = BLACK
+                    z.parent.parent.red = RED
                     self.left_rotate(z.parent.parent)
-        self.root.color = 'black'
+        # The root turning black adds one to the black height of the tree
+        root = self.root
+        if root.red:
+            root.red = BLACK
+            return True
+        return False
 
     def replace(self,original:Node,replacer:Node):
         """
@@ -366,14 +1579,14 @@ class rb_tree(object):
         replacer : Node
             Node that is replacing original
         """
-        if original.parent == self.sentinel:
+        if original.parent is self.sentinel:
             self.root = replacer
-            replacer.parent = self.sentinel
+        elif original is original.parent.left:
+            original.parent.left = replacer
         else:
-            if original == original.parent.left:
-                original.parent.left = replacer
-            else:
-                original.parent.right = replacer
+            original.parent.right = replacer
+        # The shared sentinel is never written to
+        if replacer is not self.sentinel:
             replacer.parent = original.parent
 
     def delete(self, data):
@@ -393,35 +1606,627 @@ class rb_tree(object):
             If node with given data does not exist in the tree
         """
         # Same as binary tree delete, except we call rb_delete fixup at the end.
-        if not self.root:
+        if self.root is self.sentinel:
             raise KeyError
-        node = self.find_node(data)
-        
-        original_color = node.color
-        if node.left == self.sentinel:
+        self.__discard(self.find_node(data))
+
+    def delete_node(self, node):
+        """
+        Deletes node, or one count of it, like delete but without searching
+        for it, so a handle returned by insert or a lookup is deleted in
+        O(log n) without a single comparison of keys.
+
+        Parameters
+        ----------
+        node : Node
+            A node of this tree. Any other node, or one already deleted,
+            corrupts the tree
+        """
+        self.__discard(node)
+
+    def update_key(self, node, data):
+        """
+        Gives node new data, and so a new key, and returns node. If the key
+        still falls between the keys of its neighbours the node stays where
+        it is; otherwise it is unlinked and linked back in at its new place,
+        with its value and count. Either way the node object stays the same,
+        so handles to it stay valid, which makes this the decrease-key of a
+        priority queue.
+
+        Parameters
+        ----------
+        node : Node
+            A node of this tree
+        data :
+            The new data of node
+
+        Raises
+        ------
+        ValueError
+            If the duplicates mode is not ALLOW and another node already
+            holds the new key
+        """
+        sentinel = self.sentinel
+        key = self.__key_of(data)
+        if self.duplicates != self.ALLOW:
+            other = self.__get(key, self.root)
+            if other is not None and other is not node:
+                raise ValueError('Error, data is already in the tree')
+        predecessor = self.__prev(node)
+        successor = self.__next(node)
+        if ((predecessor is None or not key < predecessor.key) and
+                (successor is None or not successor.key < key)):
+            node.data = data
+            node.key = key
+            if self.augmented:
+                self.__refresh(node)
+            return node
+        count = node.count
+        self.__remove(node)
+        node.data = data
+        node.key = key
+        node.left = node.right = sentinel
+        node.red = RED
+        node.size = count
+        # node had a neighbour, so the tree still has a root to descend from
+        self.__put(data, key, self.root, node=node)
+        self.__rb_insert_fixup(node)
+        return node
+
+    # Helper function __discard deletes one count of node, which only unlinks it
+    # once it is down to its last count
+    def __discard(self, node):
+        if self.duplicates == self.COUNT and node.count > 1:
+            current_node = node
+            while current_node is not self.sentinel:
+                current_node.size -= 1
+                current_node = current_node.parent
+            if self.augmented:
+                self.__refresh(node)
+        else:
+            self.__remove(node)
+            self.__recycle(node)
+
+    # Helper function __remove unlinks node from the tree, whatever its count, and
+    # rebalances it. node keeps its size and children links
+    def __remove(self, node):
+        sentinel = self.sentinel
+        counted = self.duplicates == self.COUNT
+        count = node.count if counted else 1
+        if node is self._min:
+            self._min = self.__next(node)
+        if node is self._max:
+            self._max = self.__prev(node)
+
+        original_red = node.red
+        if node.left is sentinel or node.right is sentinel:
+            # Every ancestor of node loses node's count from its subtree
+            parent = node.parent
+            while parent is not sentinel:
+                parent.size -= count
+                parent = parent.parent
+        # x takes the place of the node that is physically removed. It may be the
+        # sentinel, so its parent is tracked separately for the fixup
+        if node.left is sentinel:
             x = node.right
+            x_parent = node.parent
             self.replace(node,node.right)
-        elif node.right == self.sentinel:
+        elif node.right is sentinel:
             x = node.left
+            x_parent = node.parent
             self.replace(node,node.left)
         else:
-            successor = self.find_successor(node.data)
-            original_color = successor.color
+            successor = self.__next(node)
+            # The successor moves into node's place, so everything from its old
+            # parent up to node loses the successor's count, and everything
+            # above loses node's
+            successor_count = successor.count if counted else 1
+            parent = successor.parent
+            while parent is not node:
+                parent.size -= successor_count
+                parent = parent.parent
+            successor.size = node.size - count
+            parent = node.parent
+            while parent is not sentinel:
+                parent.size -= count
+                parent = parent.parent
+            original_red = successor.red
             x = successor.right
-            if successor.parent == node:
-                x.parent = successor
+            if successor.parent is node:
+                x_parent = successor
             else:
+                x_parent = successor.parent
                 self.replace(successor,successor.right)
                 successor.right = node.right
                 successor.right.parent = successor
             self.replace(node,successor)
             successor.left = node.left
             successor.left.parent = successor
-            successor.color = node.color
-        if original_color == 'black':
-            self.__rb_delete_fixup(x)
+            successor.red = node.red
+        if self.augmented:
+            self.__refresh(x_parent)
+        if not original_red:
+            self.__rb_delete_fixup(x, x_parent)
+
+    def insert_many(self, iterable, values=None):
+        """
+        Inserts every item of iterable, like calling insert on each of them.
+        The batch is sorted first so each insertion can start from the node
+        inserted before it instead of descending from the root. A batch that
+        is large next to the tree is merged with it and rebuilt in O(n + m).
+
+        Parameters
+        ----------
+        iterable : iterable
+            The data to insert
+        values : iterable, optional
+            Values matching iterable one to one
+
+        Raises
+        ------
+        ValueError
+            If values does not match iterable in length, or if duplicates is
+            REJECT and the batch repeats a key or holds one already in the
+            tree, in which case nothing is inserted
+        """
+        batch = list(iterable)
+        batch_values = None if values is None else list(values)
+        if batch_values is not None and len(batch) != len(batch_values):
+            raise ValueError('Error, data and values differ in length')
+        plain = self.key is None
+        # A reversed tree keeps equal keys newest first, which a rebuild gets by
+        # sorting the batch from the largest key down and turning it round, while
+        # inserting one by one puts each new key before the equal ones by itself
+        descending = self.reverse and len(batch) * 4 >= self.root.size
+        if plain and batch_values is None:
+            batch.sort(reverse=descending)
+            if descending:
+                batch.reverse()
+            keys = batch
+        else:
+            # Sort the data, keys and values together by key, keeping the
+            # order of the batch among equal keys
+            keys = batch if plain else [self.__key_of(item) for item in batch]
+            order = sorted(range(len(batch)), key=keys.__getitem__, reverse=descending)
+            if descending:
+                order.reverse()
+            batch = [batch[i] for i in order]
+            keys = batch if plain else [keys[i] for i in order]
+            if batch_values is not None:
+                batch_values = [batch_values[i] for i in order]
+        if not batch:
+            return
+        sentinel = self.sentinel
+        if len(batch) * 4 >= self.root.size:
+            node_type = self.node_type
+            with _gc_paused():
+                if keys is batch and batch_values is None:
+                    new_nodes = [node_type(item, sentinel, sentinel) for item in batch]
+                else:
+                    if batch_values is None:
+                        batch_values = [None] * len(batch)
+                    new_nodes = [node_type(item, sentinel, sentinel, None, 'red', value, key)
+                                 for item, value, key in zip(batch, batch_values, keys)]
+                runs = [self.__traverse(self.root, self.INORDER), new_nodes]
+                if self.reverse:
+                    runs.reverse()
+                # merge is stable, so new duplicates land after the old ones like insert,
+                # or before them on a reversed tree
+                self.__build(*self.__collapse(list(heapq.merge(*runs, key=attrgetter('key')))))
+            return
+        if self.duplicates == self.REJECT:
+            # Check the whole batch first, so a rejected batch changes nothing
+            for i, key in enumerate(keys):
+                if (i and not keys[i - 1] < key) or self.__get(key, self.root) is not None:
+                    raise ValueError('Error, data is already in the tree')
+        finger = None
+        largest = self.__last()
+        # As in __put, a key equal to the largest one goes to its left on a reversed tree
+        equal_left = self.reverse and not self.duplicates
+        for i, data in enumerate(batch):
+            key = keys[i]
+            appending = not (key < largest.key or (equal_left and key == largest.key))
+            if appending:
+                # Appending past the largest node, which has no right child
+                current_node = largest
+            elif finger is not None:
+                # Climb from the last inserted node until key belongs in the subtree
+                current_node = finger
+                while current_node.parent is not sentinel:
+                    parent = current_node.parent
+                    if current_node is parent.left and key < parent.key:
+                        break
+                    current_node = parent
+            else:
+                current_node = self.root
+            new_node, created = self.__put(data, key, current_node, None if batch_values is None else batch_values[i])
+            if not created:
+                # Counted on or ignored in favour of a node already in the tree
+                continue
+            finger = new_node
+            if appending:
+                largest = finger
+            self.__rb_insert_fixup(finger)
+
+    def delete_many(self, iterable):
+        """
+        Deletes one node for every item of iterable and returns how many
+        nodes were deleted. Items that are not in the tree are skipped. A
+        batch that is large next to the tree is removed in a single inorder
+        pass and the remaining nodes are rebuilt in O(n + m).
+
+        Parameters
+        ----------
+        iterable : iterable
+            The data to delete
+        """
+        reverse = self.reverse
+        batch = sorted(iterable if self.key is None else map(self.key, iterable), reverse=reverse)
+        if not batch or self.root is self.sentinel:
+            return 0
+        removed = 0
+        if len(batch) * 4 >= self.root.size:
+            # The walk goes in the order of the tree, so that of equal keys the ones
+            # inserted first are deleted, and the batch is sorted to match
+            kept = []
+            dropped = []
+            counts = [] if self.duplicates == self.COUNT else None
+            i = 0
+            for node in self.inorder():
+                key = node.key
+                while i < len(batch) and (key < batch[i] if reverse else batch[i] < key):
+                    i += 1
+                if counts is not None:
+                    # Each equal item of the batch takes one count off the node
+                    count = node.count
+                    while count and i < len(batch) and batch[i] == key:
+                        i += 1
+                        count -= 1
+                        removed += 1
+                    if count:
+                        kept.append(node)
+                        counts.append(count)
+                    else:
+                        dropped.append(node)
+                elif i < len(batch) and batch[i] == key:
+                    i += 1
+                    removed += 1
+                    dropped.append(node)
+                else:
+                    kept.append(node)
+            if reverse:
+                kept.reverse()
+                if counts is not None:
+                    counts.reverse()
+            self.__build(kept, counts)
+            # Recycled only now, as the walk above follows their links
+            if self._pool is not None:
+                for node in dropped:
+                    self.__recycle(node)
+            return removed
+        for key in batch:
+            node = self.__get(key, self.root)
+            if node is not None:
+                self.__discard(node)
+                removed += 1
+        return removed
+
+    @classmethod
+    def join(cls, left, data, right, value=None):
+        """
+        Joins two trees around a new node holding data and returns the joined
+        tree. Every data in left must come at or before data in order and
+        every data in right at or after it, or strictly so unless the
+        duplicates mode of left is ALLOW. The joined tree takes the modes of
+        left, and left and right are left empty. Takes O(log n) because
+        only the spine of the taller tree is walked before rebalancing.
+
+        Parameters
+        ----------
+        left : rb_tree
+            Tree with the data that comes first
+        data :
+            The data joining the two trees
+        right : rb_tree
+            Tree with the data that comes last
+        value : optional
+            Value stored with data
+
+        Raises
+        ------
+        ValueError
+            If the data of left, data and the data of right are out of order
+        """
+        sentinel = _SENTINEL
+        key = left.__key_of(data)
+        # Without duplicates the one node of data cannot sit next to an equal key
+        distinct = left.duplicates != left.ALLOW
+        # A reversed tree keeps the data that comes first on the right
+        smaller, larger = (right, left) if left.reverse else (left, right)
+        if smaller.root is not sentinel:
+            largest = smaller.__last().key
+            if key < largest or (distinct and key == largest):
+                raise ValueError('Error, {} holds data out of order with data'.format(
+                    'right' if left.reverse else 'left'))
+        if larger.root is not sentinel:
+            smallest = larger.__first().key
+            if smallest < key or (distinct and key == smallest):
+                raise ValueError('Error, {} holds data out of order with data'.format(
+                    'left' if left.reverse else 'right'))
+        tree = left.__spawn(sentinel)
+        node = tree.node_type(data, sentinel, sentinel, sentinel, 'red', value, key)
+        tree.root = tree.__join(smaller.root, node, larger.root, tree.__black_height(smaller.root),
+                                tree.__black_height(larger.root))[0]
+        left.root = right.root = sentinel
+        left._min = left._max = right._min = right._max = None
+        return tree
+
+    def split(self, data):
+        """
+        Splits the tree into two trees, one with the data that comes before
+        data and one with the rest, and returns them as (left, right). This tree is
+        left empty. Takes O(log n): each node on the search path is joined
+        back onto one of the two sides, and each join only walks down the
+        difference in black height between the pieces, which add up to the
+        height of the tree.
+
+        Parameters
+        ----------
+        data :
+            The key to split the tree at
+        """
+        key = self.__key_of(data)
+        height = self.__black_height(self.root)
+        if self.reverse:
+            # The data that comes before data has the larger keys, and data itself goes right
+            right_root, _, left_root, _ = self.__split(self.root, key, True, height)
+        else:
+            left_root, _, right_root, _ = self.__split(self.root, key, False, height)
+        self.root = self.sentinel
+        self._min = self._max = None
+        return self.__spawn(left_root), self.__spawn(right_root)
+
+    def union(self, other):
+        """
+        Adds a node for every data of other that is not already in this tree
+        and returns this tree. Data that is in both keeps this tree's nodes.
+        Works by splitting this tree at other's distinct data and joining the
+        pieces back, which takes O(m log(n/m + 1)) after an O(m) walk over other.
 
-    def __rb_delete_fixup(self, x:Node):
+        Parameters
+        ----------
+        other : rb_tree or iterable
+            The data to add, with its values if it is an rb_tree
+        """
+        keys, data, values = self.__distinct(other)
+        self.root = self.__union(self.root, self.__black_height(self.root), keys, data, values, 0, len(keys))[0]
+        self._min = self._max = None
+        return self
+
+    def intersection(self, other):
+        # Keeps only the nodes whose key is also in other and returns this tree
+        keys = self.__distinct(other)[0]
+        self.root = self.__intersection(self.root, self.__black_height(self.root), keys, 0, len(keys))[0]
+        self._min = self._max = None
+        return self
+
+    def difference(self, other):
+        # Deletes every node whose key is in other and returns this tree
+        keys = self.__distinct(other)[0]
+        self.root = self.__difference(self.root, self.__black_height(self.root), keys, 0, len(keys))[0]
+        self._min = self._max = None
+        return self
+
+    # Helper function __spawn makes an empty tree like this one that holds the
+    # subtree rooted at root
+    def __spawn(self, root):
+        tree = type(self)(self.key, self.reverse, self.duplicates, self.monoid, self.pool_size)
+        if root is not self.sentinel:
+            root.red = BLACK
+        tree.root = root
+        return tree
+
+    # Helper function __distinct returns the distinct keys of other from the smallest up,
+    # with the data and value of the first node holding each of them when other is a
+    # tree. A tree ordered like this one is walked in its order, and turned round after
+    # if it is reversed, anything else is keyed and sorted
+    def __distinct(self, other):
+        descending = False
+        if isinstance(other, rb_tree) and other.key is self.key and other.reverse == self.reverse:
+            triples = ((node.key, node.data, node.value) for node in other)
+            descending = self.reverse
+        else:
+            pairs = other.items() if isinstance(other, rb_tree) else ((item, None) for item in other)
+            triples = sorted(((self.__key_of(item), item, value) for item, value in pairs), key=itemgetter(0))
+        keys = []
+        data = []
+        values = []
+        for key, item, value in triples:
+            if not keys or (key < keys[-1] if descending else keys[-1] < key):
+                keys.append(key)
+                data.append(item)
+                values.append(value)
+        if descending:
+            keys.reverse()
+            data.reverse()
+            values.reverse()
+        return keys, data, values
+
+    # Helper function __black_height counts the black nodes on the way down
+    # from root to the sentinel, root included. The helpers below pass these
+    # heights along with the subtrees instead of counting them again
+    def __black_height(self, root):
+        height = 0
+        while root is not self.sentinel:
+            if not root.red:
+                height += 1
+            root = root.left
+        return height
+
+    # Helper function __join links the subtrees rooted at left and right, of the given
+    # black heights, under node, whose links are overwritten and whose size holds its
+    # own count, and returns the root and black height of the result. node is hung off
+    # the spine of the taller subtree at the height of the shorter one and the insert
+    # fixup repairs any red-red violation above it, so only the difference in height
+    # is walked
+    def __join(self, left, node, right, left_height, right_height):
+        sentinel = self.sentinel
+        count = node.size
+        if left.red:
+            left.red = BLACK
+            left_height += 1
+        if right.red:
+            right.red = BLACK
+            right_height += 1
+        node.red = RED
+        if left_height == right_height:
+            node.left = left
+            node.right = right
+            node.parent = sentinel
+            node.size = left.size + right.size + count
+            node.red = BLACK
+            if left is not sentinel:
+                left.parent = node
+            if right is not sentinel:
+                right.parent = node
+            if self.augmented:
+                self.augment(node)
+            return node, left_height + 1
+        if left_height > right_height:
+            # Walk down the right spine to a black node as high as right
+            parent = sentinel
+            current_node = left
+            height = left_height
+            while current_node.red or height != right_height:
+                if not current_node.red:
+                    height -= 1
+                parent = current_node
+                current_node = current_node.right
+            node.left = current_node
+            node.right = right
+            parent.right = node
+            self.root = left
+        else:
+            # Walk down the left spine to a black node as high as left
+            parent = sentinel
+            current_node = right
+            height = right_height
+            while current_node.red or height != left_height:
+                if not current_node.red:
+                    height -= 1
+                parent = current_node
+                current_node = current_node.left
+            node.left = left
+            node.right = current_node
+            parent.left = node
+            self.root = right
+        node.parent = parent
+        if node.left is not sentinel:
+            node.left.parent = node
+        if node.right is not sentinel:
+            node.right.parent = node
+        node.size = node.left.size + node.right.size + count
+        # Every node above gains the shorter subtree plus node itself
+        grown = node.size - current_node.size
+        while parent is not sentinel:
+            parent.size += grown
+            parent = parent.parent
+        if self.augmented:
+            self.__refresh(node)
+        grew = self.__rb_insert_fixup(node)
+        return self.root, max(left_height, right_height) + grew
+
+    # Helper function __join2 joins two subtrees without a middle node by taking the
+    # smallest node out of right. Removing it costs O(height of right) already, so the
+    # new height of right is counted again on the way
+    def __join2(self, left, left_height, right, right_height):
+        sentinel = self.sentinel
+        if left is sentinel:
+            return right, right_height
+        if right is sentinel:
+            return left, left_height
+        smallest = right
+        while smallest.left is not sentinel:
+            smallest = smallest.left
+        self.root = right
+        self.__remove(smallest)
+        smallest.size = smallest.count
+        return self.__join(left, smallest, self.root, left_height, self.__black_height(self.root))
+
+    # Helper function __split splits the subtree rooted at root, of black height height,
+    # into the nodes with keys below key (or at most key if inclusive is set) and the
+    # rest, and returns both roots with their black heights
+    def __split(self, root, key, inclusive, height):
+        sentinel = self.sentinel
+        if root is sentinel:
+            return sentinel, 0, sentinel, 0
+        left = root.left
+        right = root.right
+        # Joining root back needs its own count, before its subtrees are split up
+        root.size = root.count
+        if left is not sentinel:
+            left.parent = sentinel
+        if right is not sentinel:
+            right.parent = sentinel
+        if not root.red:
+            height -= 1
+        if root.key < key or (inclusive and root.key == key):
+            smaller, smaller_height, larger, larger_height = self.__split(right, key, inclusive, height)
+            smaller, smaller_height = self.__join(left, root, smaller, height, smaller_height)
+        else:
+            smaller, smaller_height, larger, larger_height = self.__split(left, key, inclusive, height)
+            larger, larger_height = self.__join(larger, root, right, larger_height, height)
+        return smaller, smaller_height, larger, larger_height
+
+    # Helper function __split3 splits the subtree rooted at root into the nodes with
+    # keys below, equal to and above key, each with its black height
+    def __split3(self, root, key, height):
+        smaller, smaller_height, rest, rest_height = self.__split(root, key, False, height)
+        return (smaller, smaller_height) + self.__split(rest, key, True, rest_height)
+
+    # Helper functions __union, __intersection and __difference combine the subtree
+    # rooted at root, of black height height, with keys[lo:hi], splitting it at the
+    # middle key and recursing on both halves, and return the root and black height
+    # of the result
+    def __union(self, root, height, keys, data, values, lo, hi):
+        sentinel = self.sentinel
+        if lo >= hi:
+            return root, height
+        if root is sentinel:
+            nodes = [self.node_type(data[i], sentinel, sentinel, sentinel, 'red', values[i], keys[i]) for i in range(lo, hi)]
+            self.__build(nodes)
+            # Every level of a built tree but the deepest is black, and so is its root
+            return self.root, max(len(nodes).bit_length() - 1, 1)
+        mid = (lo + hi) // 2
+        smaller, smaller_height, equal, equal_height, larger, larger_height = self.__split3(root, keys[mid], height)
+        smaller, smaller_height = self.__union(smaller, smaller_height, keys, data, values, lo, mid)
+        larger, larger_height = self.__union(larger, larger_height, keys, data, values, mid + 1, hi)
+        if equal is sentinel:
+            node = self.node_type(data[mid], sentinel, sentinel, sentinel, 'red', values[mid], keys[mid])
+            return self.__join(smaller, node, larger, smaller_height, larger_height)
+        return self.__join2(*self.__join2(smaller, smaller_height, equal, equal_height), larger, larger_height)
+
+    def __intersection(self, root, height, keys, lo, hi):
+        sentinel = self.sentinel
+        if root is sentinel or lo >= hi:
+            return sentinel, 0
+        mid = (lo + hi) // 2
+        smaller, smaller_height, equal, equal_height, larger, larger_height = self.__split3(root, keys[mid], height)
+        smaller, smaller_height = self.__intersection(smaller, smaller_height, keys, lo, mid)
+        larger, larger_height = self.__intersection(larger, larger_height, keys, mid + 1, hi)
+        return self.__join2(*self.__join2(smaller, smaller_height, equal, equal_height), larger, larger_height)
+
+    def __difference(self, root, height, keys, lo, hi):
+        sentinel = self.sentinel
+        if root is sentinel or lo >= hi:
+            return root, height
+        mid = (lo + hi) // 2
+        smaller, smaller_height, _, _, larger, larger_height = self.__split3(root, keys[mid], height)
+        smaller, smaller_height = self.__difference(smaller, smaller_height, keys, lo, mid)
+        larger, larger_height = self.__difference(larger, larger_height, keys, mid + 1, hi)
+        return self.__join2(smaller, smaller_height, larger, larger_height)
+
+    def __rb_delete_fixup(self, x:Node, parent:Node):
         # Maintains balancing and coloring property after BST deletion
         """
         Makes sure the tree is a legal red black tree after a
@@ -432,50 +2237,129 @@ class rb_tree(object):
         X : Node
             Node that needs to be adjusted in order to maintain
             rb tree properties.
+        parent : Node
+            X's parent, which cannot be read from X when it is the sentinel
         """
-        while x != self.root and x.color == 'black':
-            if x == x.parent.left:
-                w = x.parent.right
-                if w.color == 'red':
-                    w.color = 'black'
-                    x.parent.color = 'red'
-                    self.left_rotate(x.parent)
-                    w = x.parent.right
-                if w.left.color == 'black' and w.right.color == 'black':
-                    w.color = 'red'
-                    x = x.parent
+        while x is not self.root and not x.red:
+            if x is parent.left:
+                w = parent.right
+                if w.red:
+                    w.red = BLACK
+                    parent.red = RED
+                    self.left_rotate(parent)
+                    w = parent.right
+                if not w.left.red and not w.right.red:
+                    w.red = RED
+                    x = parent
+                    parent = x.parent
                 else:
-                    if w.right.color == 'black':
-                        w.left.color = 'black'
-                        w.color = 'red'
+                    if not w.right.red:
+                        w.left.red = BLACK
+                        w.red = RED
                         self.right_rotate(w)
-                        w = x.parent.right
-                    w.color = x.parent.color
-                    x.parent.color = 'black'
-                    w.right.color = 'black'
-                    self.left_rotate(x.parent)
+                        w = parent.right
+                    w.red = parent.red
+                    parent.red = BLACK
+                    w.right.red = BLACK
+                    self.left_rotate(parent)
                     x = self.root
             else:
-                w = x.parent.left
-                if w.color == 'red':
-                    w.color = 'black'
-                    x.parent.color = 'red'
-                    self.right_rotate(x.parent)
-                    w = x.parent.left
-                if w.right.color == 'black' and w.left.color == 'black':
-                    w.color = 'red'
-                    x = x.parent
+                w = parent.left
+                if w.red:
+                    w.red = BLACK
+                    parent.red = RED
+                    self.right_rotate(parent)
+                    w = parent.left
+                if not w.right.red and not w.left.red:
+                    w.red = RED
+                    x = parent
+                    parent = x.parent
                 else:
-                    if w.left.color == 'black':
-                        w.right.color = 'black'
-                        w.color = 'red'
+                    if not w.left.red:
+                        w.right.red = BLACK
+                        w.red = RED
                         self.left_rotate(w)
-                        w = x.parent.left
-                    w.color = x.parent.color
-                    x.parent.color = 'black'
-                    w.left.color = 'black'
-                    self.right_rotate(x.parent)
+                        w = parent.left
+                    w.red = parent.red
+                    parent.red = BLACK
+                    w.left.red = BLACK
+                    self.right_rotate(parent)
                     x = self.root
-        x.color = 'black'
+        if x.red:
+            x.red = BLACK
+
+
+class rb_cursor(object):
+    """
+    A position in a red black tree that steps between neighbouring nodes
+
+    ...
+
+    Each step follows parent pointers from the current node, so walking k
+    nodes costs amortized O(k) instead of a fresh O(log n) search per node.
+    The cursor holds on to a node, so it must be re-seeked after that node
+    is deleted from the tree.
+
+    Attributes
+    ----------
+    self.tree: rb_tree
+        The tree the cursor walks
+    self.node: Node
+        The current node, or None once the cursor has run off either end
+
+    Methods
+    -------
+    peek():
+        Returns the current node without moving
+    next():
+        Moves to the next node and returns it
+    prev():
+        Moves to the previous node and returns it
+    seek(arg1=data):
+        Moves to the first node at or above data and returns it
+    first(), last():
+        Moves to the first or last node in order and returns it
+    """
+    __slots__ = ('tree', 'node', '_after_end')
+
+    def __init__(self, tree, node=None):
+        self.tree = tree
+        self.node = node
+        # Which end the cursor ran off when node is None
+        self._after_end = False
+
+    def peek(self):
+        return self.node
+
+    def next(self):
+        if self.node is not None:
+            self.node = self.tree.successor(self.node)
+            self._after_end = self.node is None
+        elif not self._after_end:
+            return self.first()
+        return self.node
+
+    def prev(self):
+        if self.node is not None:
+            self.node = self.tree.predecessor(self.node)
+            self._after_end = False
+        elif self._after_end:
+            return self.last()
+        return self.node
+
+    def seek(self, data):
+        self.node = self.tree.ceiling(data)
+        self._after_end = self.node is None
+        return self.node
 
+    def first(self):
+        tree = self.tree
+        self.node = None if tree.root is tree.sentinel else tree.find_min()
+        self._after_end = False
+        return self.node
 
+    def last(self):
+        tree = self.tree
+        self.node = None if tree.root is tree.sentinel else tree.find_max()
+        self._after_end = True
+        return self.node
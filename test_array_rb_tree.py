@@ -0,0 +1,135 @@
+from array_rb_tree import array_rb_tree, array_node
+from rb_tree import rb_tree
+import random
+import unittest
+
+
+def shape(tree):
+    # Preorder data and colors, which pin down the shape of the tree
+    return [(node.data, node.color) for node in tree.preorder()]
+
+
+class T0_array_tree_insert(unittest.TestCase):
+    def test_array_tree_insert_0(self):
+        print("\n")
+        print("array_tree_insert_color")
+        tree = array_rb_tree()
+        for i in [7, 5, 9, 3, 6, 8, 10, 1, 2]:
+            tree.insert(i)
+        tree_preorder = [node.data for node in tree.preorder()]
+        tree_preorder_color = [node.color for node in tree.preorder()]
+        self.assertEqual(tree_preorder, [7, 5, 2, 1, 3, 6, 9, 8, 10])
+        self.assertEqual(tree_preorder_color, ['black', 'red', 'black', 'red', 'red', 'black', 'black', 'red', 'red'])
+        self.assertEqual([node.data for node in tree], [1, 2, 3, 5, 6, 7, 8, 9, 10])
+        self.assertEqual([node.data for node in tree.postorder()], [1, 3, 2, 6, 5, 8, 10, 9, 7])
+        self.assertEqual(list(tree.keys()), [1, 2, 3, 5, 6, 7, 8, 9, 10])
+        self.assertEqual(len(tree), 9)
+
+    def test_array_tree_insert_1(self):
+        print("\n")
+        print("array_tree_matches_rb_tree")
+        rng = random.Random(1)
+        tree = array_rb_tree(capacity=2)
+        reference = rb_tree()
+        for _ in range(500):
+            key = rng.randrange(200)
+            tree.insert(key)
+            reference.insert(key)
+        self.assertEqual(shape(tree), shape(reference))
+
+
+class T1_array_tree_delete(unittest.TestCase):
+    def test_array_tree_delete_0(self):
+        print("\n")
+        print("array_tree_delete")
+        tree = array_rb_tree()
+        for i in range(1, 8):
+            tree.insert(i)
+        tree.delete(5)
+        tree.delete(4)
+        tree_preorder = [node.data for node in tree.preorder()]
+        tree_preorder_color = [node.color for node in tree.preorder()]
+        self.assertEqual(tree_preorder, [2, 1, 6, 3, 7])
+        self.assertEqual(tree_preorder_color, ['black', 'black', 'red', 'black', 'black'])
+        with self.assertRaises(KeyError):
+            tree.delete(4)
+        with self.assertRaises(KeyError):
+            array_rb_tree().delete(1)
+
+    def test_array_tree_delete_1(self):
+        print("\n")
+        print("array_tree_delete_matches_rb_tree")
+        rng = random.Random(2)
+        tree = array_rb_tree(typecode='q')
+        reference = rb_tree()
+        keys = [rng.randrange(1000) for _ in range(600)]
+        for key in keys:
+            tree.insert(key)
+            reference.insert(key)
+        rng.shuffle(keys)
+        for key in keys[:400]:
+            tree.delete(key)
+            reference.delete(key)
+            self.assertEqual(shape(tree), shape(reference))
+        self.assertEqual(len(tree), 200)
+
+    def test_array_tree_delete_2(self):
+        print("\n")
+        print("array_tree_free_list")
+        tree = array_rb_tree(capacity=4)
+        for i in range(100):
+            tree.insert(i)
+        capacity = len(tree._left)
+        for i in range(50):
+            tree.delete(i)
+        for i in range(100, 150):
+            tree.insert(i)
+        # Deleted slots are reused before the buffers grow again
+        self.assertEqual(len(tree._left), capacity)
+        self.assertEqual(list(tree.keys()), list(range(50, 150)))
+
+    def test_array_tree_delete_3(self):
+        print("\n")
+        print("array_tree_bad_key")
+        # A key the typed buffers refuse takes no slot, fresh or freed
+        tree = array_rb_tree(typecode='q')
+        tree.insert(1)
+        with self.assertRaises(TypeError):
+            tree.insert(1.5)
+        self.assertEqual((tree._top, len(tree)), (2, 1))
+        tree.insert(2)
+        tree.delete(2)
+        free = tree._free
+        with self.assertRaises(TypeError):
+            tree.insert(2.5)
+        self.assertEqual(tree._free, free)
+        tree.insert(3)
+        self.assertEqual((tree._top, list(tree.keys())), (3, [1, 3]))
+
+
+class T2_array_tree_lookup(unittest.TestCase):
+    def test_array_tree_lookup_0(self):
+        print("\n")
+        print("array_tree_lookup")
+        tree = array_rb_tree()
+        self.assertFalse(1 in tree)
+        self.assertIsNone(tree.get(1))
+        with self.assertRaises(KeyError):
+            tree.find_node(1)
+        for i in range(0, 20, 2):
+            tree.insert(i)
+        node = tree.find_node(4)
+        self.assertIsInstance(node, array_node)
+        self.assertEqual(node.data, 4)
+        self.assertEqual(node.parent.left if node.parent.left == node else node.parent.right, node)
+        self.assertTrue(6 in tree)
+        self.assertFalse(7 in tree)
+        self.assertEqual(tree.get(7, 'missing'), 'missing')
+        self.assertIsNone(tree.find_node(7, None))
+        self.assertEqual(tree.find_min().data, 0)
+        self.assertIsNone(tree.sentinel.data)
+        self.assertEqual(tree.sentinel.color, 'black')
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,74 @@
+from rb_async import async_rb_tree
+from rb_tree import rb_tree
+from test_rb_tree import check_tree
+import asyncio
+import unittest
+
+
+class T0_async_tree_ops(unittest.TestCase):
+    def test_async_tree_ops_0(self):
+        print("\n")
+        print("async_tree_ops")
+
+        async def main():
+            tree = async_rb_tree(chunk_size=3)
+            for i in [7, 5, 9, 3, 6, 8, 10, 1, 2]:
+                await tree.insert(i, str(i))
+            self.assertEqual(len(tree), 9)
+            self.assertTrue(await tree.contains(6))
+            self.assertEqual((await tree.get(6)).value, '6')
+            self.assertEqual(await tree.get(4, 'missing'), 'missing')
+            await tree.delete(9)
+            self.assertEqual([node.data async for node in tree], [1, 2, 3, 5, 6, 7, 8, 10])
+            self.assertEqual([node.data async for node in tree.irange(2, 8)], [2, 3, 5, 6, 7])
+            self.assertEqual([node.data async for node in tree.irange(2, 8, (False, True), reverse=True)],
+                             [8, 7, 6, 5, 3])
+            await tree.insert_many(range(100, 120))
+            self.assertEqual(await tree.delete_many(range(100, 110)), 10)
+            await tree.union([0, 200])
+            await tree.difference([1, 2])
+            self.assertEqual(list(tree.tree.keys()), [0, 3, 5, 6, 7, 8, 10] + list(range(110, 120)) + [200])
+            self.assertEqual(await tree.run(rb_tree.rank, 7), 4)
+            await tree.load_sorted(range(50))
+            self.assertEqual(len(tree), 50)
+            check_tree(self, tree.tree)
+            # The loaded tree keeps the key and duplicates mode of the one it replaces
+            keyed = async_rb_tree(rb_tree(key=lambda data: -data, duplicates=rb_tree.COUNT))
+            await keyed.load_sorted([9, 4, 4, 1], 'abcd')
+            self.assertEqual(list(keyed.tree.items()), [(9, 'a'), (4, 'b'), (4, 'b'), (1, 'd')])
+            self.assertEqual((keyed.tree.duplicates, keyed.tree.count(4)), (rb_tree.COUNT, 2))
+            check_tree(self, keyed.tree)
+
+        asyncio.run(main())
+
+    def test_async_tree_ops_1(self):
+        print("\n")
+        print("async_tree_scan_chunks")
+
+        async def main():
+            tree = async_rb_tree(rb_tree.from_sorted([1] + [2] * 7 + list(range(3, 30))), chunk_size=4)
+            ticks = []
+
+            async def ticker():
+                while True:
+                    ticks.append(len(seen))
+                    await asyncio.sleep(0)
+
+            seen = []
+            task = asyncio.ensure_future(ticker())
+            async for node in tree:
+                seen.append(node.data)
+                # Changes between chunks behind the scan are not seen, ahead of it they are
+                if node.data == 5:
+                    await tree.insert(0)
+                    await tree.insert(100)
+            task.cancel()
+            self.assertEqual(seen, [1] + [2] * 7 + list(range(3, 30)) + [100])
+            # The ticker ran between the chunks
+            self.assertGreater(len(set(ticks)), 5)
+
+        asyncio.run(main())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,147 @@
+from rb_concurrent import concurrent_rb_tree, rw_lock
+from rb_tree import rb_tree
+from test_rb_tree import check_tree
+import threading
+import time
+import unittest
+
+
+class T0_concurrent_tree_lock(unittest.TestCase):
+    def test_concurrent_tree_lock_0(self):
+        print("\n")
+        print("rw_lock_shared_readers")
+        lock = rw_lock()
+        # Both readers must hold the lock at once to pass the barrier
+        barrier = threading.Barrier(2, timeout=5)
+
+        def reader():
+            with lock.read_locked():
+                barrier.wait()
+
+        threads = [threading.Thread(target=reader) for _ in range(2)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertFalse(barrier.broken)
+
+    def test_concurrent_tree_lock_1(self):
+        print("\n")
+        print("rw_lock_exclusive_writer")
+        lock = rw_lock()
+        events = []
+        lock.acquire_read()
+        writer = threading.Thread(target=lambda: (lock.acquire_write(), events.append('write'), lock.release_write()))
+        writer.start()
+        writer.join(0.1)
+        # The writer waits for the reader, and new readers wait for the writer
+        self.assertEqual(events, [])
+        reader = threading.Thread(target=lambda: (lock.acquire_read(), events.append('read'), lock.release_read()))
+        reader.start()
+        reader.join(0.1)
+        self.assertEqual(events, [])
+        lock.release_read()
+        writer.join()
+        reader.join()
+        self.assertEqual(events, ['write', 'read'])
+
+    def test_concurrent_tree_lock_2(self):
+        print("\n")
+        print("rw_lock_no_writer_starvation")
+        lock = rw_lock()
+        lock.acquire_write()
+        lock.release_write()
+        stop = threading.Event()
+
+        def reader():
+            # Overlapping readers that never leave the lock free on their own
+            while not stop.is_set():
+                with lock.read_locked():
+                    time.sleep(0.001)
+
+        threads = [threading.Thread(target=reader) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        writer = threading.Thread(target=lambda: (lock.acquire_write(), lock.release_write()))
+        writer.start()
+        writer.join(3)
+        starved = writer.is_alive()
+        stop.set()
+        for thread in threads:
+            thread.join()
+        writer.join()
+        self.assertFalse(starved)
+
+
+class T1_concurrent_tree_ops(unittest.TestCase):
+    def test_concurrent_tree_ops_0(self):
+        print("\n")
+        print("concurrent_tree_ops")
+        tree = concurrent_rb_tree()
+        for i in [7, 5, 9, 3, 6, 8, 10, 1, 2]:
+            tree[i] = str(i)
+        self.assertEqual(len(tree), 9)
+        self.assertTrue(6 in tree)
+        self.assertEqual(tree[6], '6')
+        self.assertEqual(tree.get(4, 'missing'), 'missing')
+        self.assertEqual(tree.get(5), '5')
+        self.assertEqual((tree.floor(4), tree.ceiling(4), tree.lower(5), tree.higher(10)), (3, 5, 3, None))
+        self.assertEqual((tree.select(0), tree.rank(6), tree.count_range(3, 8)), (1, 4, 4))
+        self.assertEqual(list(tree), [1, 2, 3, 5, 6, 7, 8, 9, 10])
+        self.assertEqual(tree.irange(3, 6), [(3, '3'), (5, '5')])
+        self.assertEqual(tree.pop(5), '5')
+        self.assertEqual(tree.pop(5, None), None)
+        del tree[7]
+        self.assertEqual(tree.setdefault(4, 'four'), 'four')
+        tree.insert_many([11, 12])
+        self.assertEqual(tree.delete_many([1, 2, 99]), 2)
+        tree.union(concurrent_rb_tree(rb_tree.from_sorted([0, 3, 13])))
+        tree.difference([12, 13])
+        self.assertEqual(tree.keys(), [0, 3, 4, 6, 8, 9, 10, 11])
+        snapshot = tree.snapshot()
+        tree.insert(20)
+        self.assertEqual(list(snapshot.keys()), [0, 3, 4, 6, 8, 9, 10, 11])
+        with tree.read() as inner:
+            check_tree(self, inner)
+        # Snapshots keep the settings of the tree they copy
+        keyed = concurrent_rb_tree(rb_tree.from_iterable([3, 1, 2], key=lambda data: -data))
+        counted = concurrent_rb_tree(rb_tree(duplicates=rb_tree.COUNT))
+        counted.insert_many([2, 2, 5])
+        copied = counted.snapshot()
+        self.assertEqual((copied.duplicates, len(copied), copied.root.size, copied.count(2)), (rb_tree.COUNT, 3, 3, 2))
+        self.assertEqual(list(keyed.snapshot().keys()), [3, 2, 1])
+        keyed.union(counted)
+        self.assertEqual(keyed.keys(), [5, 3, 2, 1])
+        check_tree(self, copied)
+
+    def test_concurrent_tree_ops_1(self):
+        print("\n")
+        print("concurrent_tree_threads")
+        tree = concurrent_rb_tree()
+        errors = []
+
+        def writer(offset):
+            for i in range(offset, 4000, 4):
+                tree.insert(i)
+            tree.delete_many(range(offset, 4000, 8))
+
+        def reader():
+            for _ in range(50):
+                keys = tree.keys()
+                if keys != sorted(keys):
+                    errors.append(keys)
+
+        threads = [threading.Thread(target=writer, args=(offset,)) for offset in range(4)]
+        threads += [threading.Thread(target=reader) for _ in range(2)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+        self.assertEqual(tree.keys(), sorted(set(range(4000)) - set(i for o in range(4) for i in range(o, 4000, 8))))
+        with tree.write() as inner:
+            check_tree(self, inner)
+
+
+if __name__ == "__main__":
+    unittest.main()
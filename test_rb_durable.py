@@ -0,0 +1,157 @@
+from rb_durable import durable_rb_tree, FSYNC_ALWAYS, FSYNC_NEVER
+import os
+import random
+import tempfile
+import unittest
+
+
+def segments(directory):
+    return sorted(name for name in os.listdir(directory) if name.endswith('.log'))
+
+
+def recovered(directory):
+    # Items of the tree recovered from directory
+    with durable_rb_tree(directory) as tree:
+        return list(tree.tree.items())
+
+
+class T0_durable_tree_log(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = self.directory.name
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_durable_tree_log_0(self):
+        print("\n")
+        print("durable_tree_reopen")
+        with durable_rb_tree(self.path) as tree:
+            for i in [7, 5, 9, 3, 6, 8, 10, 1, 2]:
+                tree.insert(i, str(i))
+            tree.delete(5)
+            tree[3] = 'three'
+            del tree[9]
+            with self.assertRaises(KeyError):
+                tree.delete(5)
+        with durable_rb_tree(self.path) as tree:
+            self.assertEqual(list(tree.tree.items()), [(1, '1'), (2, '2'), (3, 'three'), (6, '6'), (7, '7'), (8, '8'), (10, '10')])
+            self.assertEqual(len(tree), 7)
+            self.assertTrue(6 in tree)
+            self.assertEqual(tree[8], '8')
+
+    def test_durable_tree_log_1(self):
+        print("\n")
+        print("durable_tree_crash")
+        # Each tree is recovered before it is closed, as if the process had died
+        tree = durable_rb_tree(self.path, fsync=FSYNC_ALWAYS)
+        for i in range(20):
+            tree.insert(i)
+        self.assertEqual([key for key, value in recovered(self.path)], list(range(20)))
+        tree.close()
+        tree = durable_rb_tree(self.path, group_size=10)
+        for i in range(20, 25):
+            tree.insert(i)
+        # Records reach the file at once, only their fsync waits for the group
+        self.assertEqual(len(recovered(self.path)), 25)
+        tree.commit()
+        self.assertEqual(len(recovered(self.path)), 25)
+        tree.insert_many([30, 31, 32])
+        tree.delete_many([0, 1, 99])
+        self.assertEqual([key for key, value in recovered(self.path)], list(range(2, 25)) + [30, 31, 32])
+        tree.close()
+
+    def test_durable_tree_log_2(self):
+        print("\n")
+        print("durable_tree_torn_record")
+        with durable_rb_tree(self.path) as tree:
+            for i in range(10):
+                tree.insert(i)
+        last = os.path.join(self.path, segments(self.path)[-1])
+        with open(last, 'ab') as file:
+            file.write(b'\x40\x00\x00\x00\x00\x00\x00\x00partial')
+        size = os.path.getsize(last)
+        with durable_rb_tree(self.path) as tree:
+            self.assertEqual(list(tree.tree.keys()), list(range(10)))
+            tree.insert(10)
+        self.assertLess(os.path.getsize(last), size)
+        self.assertEqual(len(recovered(self.path)), 11)
+
+    def test_durable_tree_log_3(self):
+        print("\n")
+        print("durable_tree_gap")
+        # A torn record in one segment ends the replay, later segments are not applied
+        with durable_rb_tree(self.path) as tree:
+            tree.insert_many(range(5))
+        first = os.path.join(self.path, segments(self.path)[-1])
+        # Recovering from a torn record is what starts a second segment
+        with open(first, 'ab') as file:
+            file.write(b'\x40\x00')
+        with durable_rb_tree(self.path) as tree:
+            tree.insert(5)
+        self.assertEqual(len(segments(self.path)), 2)
+        with open(first, 'r+b') as file:
+            file.truncate(os.path.getsize(first) - 1)
+        self.assertEqual(recovered(self.path), [])
+        # The segment after the gap was removed, and the one opened in its place is empty
+        self.assertEqual(os.path.getsize(os.path.join(self.path, segments(self.path)[-1])), 0)
+        with durable_rb_tree(self.path) as tree:
+            tree.insert(6)
+        self.assertEqual(recovered(self.path), [(6, None)])
+
+
+class T1_durable_tree_checkpoint(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = self.directory.name
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_durable_tree_checkpoint_0(self):
+        print("\n")
+        print("durable_tree_checkpoint")
+        rng = random.Random(14)
+        keys = rng.sample(range(10000), 1000)
+        with durable_rb_tree(self.path, fsync=FSYNC_NEVER, group_size=50, checkpoint_every=300) as tree:
+            for key in keys:
+                tree.insert(key, -key)
+            for key in keys[:400]:
+                tree.delete(key)
+            expected = list(tree.tree.items())
+        # Checkpoints dropped every segment but the tail
+        self.assertLessEqual(len(segments(self.path)), 2)
+        self.assertTrue(os.path.exists(os.path.join(self.path, 'checkpoint')))
+        with durable_rb_tree(self.path) as tree:
+            self.assertEqual(list(tree.tree.items()), expected)
+            tree.checkpoint()
+        self.assertEqual(len(segments(self.path)), 1)
+        self.assertEqual(recovered(self.path), expected)
+
+    def test_durable_tree_checkpoint_1(self):
+        print("\n")
+        print("durable_tree_checkpoint_sequence")
+        # A checkpoint past checkpoint_every starts exactly one new segment
+        with durable_rb_tree(self.path, group_size=1000, checkpoint_every=3) as tree:
+            for i in range(5):
+                tree.insert(i)
+            before = segments(self.path)
+            tree.checkpoint()
+            self.assertEqual(len(before), 1)
+            self.assertEqual(segments(self.path), ['wal-{:016d}.log'.format(int(before[0][4:-4]) + 1)])
+        # Reopening an intact log appends to its last segment
+        for i in range(3):
+            with durable_rb_tree(self.path) as tree:
+                tree.insert(10 + i)
+        self.assertEqual(len(segments(self.path)), 1)
+        self.assertEqual([key for key, value in recovered(self.path)], [0, 1, 2, 3, 4, 10, 11, 12])
+
+    def test_durable_tree_checkpoint_2(self):
+        print("\n")
+        print("durable_tree_bad_policy")
+        with self.assertRaises(ValueError):
+            durable_rb_tree(self.path, fsync='sometimes')
+
+
+if __name__ == "__main__":
+    unittest.main()
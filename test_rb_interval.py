@@ -0,0 +1,140 @@
+from rb_interval import interval_rb_tree
+from rb_tree import rb_tree
+from test_rb_tree import check_tree
+import random
+import unittest
+
+
+def check_max_end(test, tree):
+    # Asserts that every node keeps the largest end of its subtree
+    def walk(node):
+        if node is tree.sentinel:
+            return None
+        ends = [node.data[1]] + [end for end in (walk(node.left), walk(node.right)) if end is not None]
+        test.assertEqual(node.max_end, max(ends))
+        return node.max_end
+
+    walk(tree.root)
+    check_tree(test, tree)
+
+
+def overlaps(intervals, start, end):
+    return sorted(interval for interval in intervals if interval[0] <= end and start <= interval[1])
+
+
+class T0_interval_tree(unittest.TestCase):
+    def test_interval_tree_0(self):
+        print("\n")
+        print("interval_tree_queries")
+        tree = interval_rb_tree()
+        for interval in [(15, 20), (10, 30), (17, 19), (5, 20), (12, 15), (30, 40)]:
+            tree.insert(interval, str(interval))
+        check_max_end(self, tree)
+        self.assertEqual([node.data for node in tree.overlapping(14, 16)], [(5, 20), (10, 30), (12, 15), (15, 20)])
+        self.assertEqual([node.value for node in tree.stabbing(30)], ['(10, 30)', '(30, 40)'])
+        self.assertEqual(list(tree.stabbing(41)), [])
+        self.assertEqual(list(tree.overlapping(0, 4)), [])
+        self.assertIn(tree.any_overlap(21, 23).data, [(10, 30)])
+        self.assertIsNone(tree.any_overlap(41, 50))
+        tree.delete((10, 30))
+        check_max_end(self, tree)
+        self.assertIsNone(tree.any_overlap(21, 29))
+        node = tree.insert((1, 2))
+        tree.update_key(node, (25, 26))
+        check_max_end(self, tree)
+        self.assertIs(tree.any_overlap(21, 29), node)
+        with self.assertRaises(ValueError):
+            tree.update_key(node, (26, 25))
+        with self.assertRaises(ValueError):
+            tree.insert((3, 2))
+        with self.assertRaises(ValueError):
+            interval_rb_tree(reverse=True)
+        # Every way in checks the interval
+        for add in (lambda: tree.__setitem__((5, 1), 'x'), lambda: tree.setdefault((5, 1)),
+                    lambda: interval_rb_tree.from_sorted([(1, 0)]), lambda: interval_rb_tree.from_iterable([(3, 4), (2, 1)]),
+                    lambda: tree.union([(5, 1)]), lambda: tree.union(rb_tree.from_sorted([(5, 1)])),
+                    lambda: interval_rb_tree.join(interval_rb_tree(), (5, 1), interval_rb_tree())):
+            with self.assertRaises(ValueError):
+                add()
+        self.assertEqual([node.data for node in tree.stabbing(3)], [])
+        check_max_end(self, tree)
+        # Any pair insert takes is found, deleted and popped the same way
+        tree.insert([40, 45], 'list')
+        self.assertTrue([40, 45] in tree)
+        self.assertEqual((tree[[40, 45]], tree.get([40, 45]).data, tree.find_node([40, 45]).value), ('list', (40, 45), 'list'))
+        self.assertEqual((tree.count([40, 45]), tree.rank([40, 45]), tree.ceiling([39, 0]).data), (1, len(tree) - 1, (40, 45)))
+        self.assertEqual([node.data for node in tree.irange([30, 40], [40, 46])], [(30, 40), (40, 45)])
+        self.assertEqual(tree.pop([40, 45]), 'list')
+        self.assertIsNone(tree.get([40, 45]))
+        tree.insert([41, 42])
+        tree.delete([41, 42])
+        tree.insert_many([[50, 51], [52, 53]])
+        self.assertEqual(tree.delete_many([[50, 51], [52, 53]]), 2)
+        tree.difference([[30, 40]])
+        self.assertFalse((30, 40) in tree)
+        check_max_end(self, tree)
+
+    def test_interval_tree_1(self):
+        print("\n")
+        print("interval_tree_random")
+        rng = random.Random(21)
+        tree = interval_rb_tree()
+        intervals = []
+        for step in range(40):
+            choice = rng.random()
+            if choice < 0.5:
+                batch = []
+                for _ in range(rng.choice([1, 10, 300])):
+                    start = rng.randrange(1000)
+                    batch.append((start, start + rng.randrange(60)))
+                if len(batch) == 1:
+                    tree.insert(batch[0])
+                else:
+                    tree.insert_many(batch)
+                intervals.extend(batch)
+            elif intervals:
+                batch = rng.sample(intervals, min(len(intervals), rng.choice([1, 5, 200])))
+                for interval in batch:
+                    intervals.remove(interval)
+                if len(batch) == 1:
+                    tree.delete(batch[0])
+                else:
+                    tree.delete_many(batch)
+            check_max_end(self, tree)
+            for _ in range(20):
+                start = rng.randrange(-50, 1050)
+                end = start + rng.randrange(30)
+                expected = overlaps(intervals, start, end)
+                self.assertEqual([node.data for node in tree.overlapping(start, end)], expected)
+                self.assertEqual([node.data for node in tree.stabbing(start)], overlaps(intervals, start, start))
+                found = tree.any_overlap(start, end)
+                if expected:
+                    self.assertIn(found.data, expected)
+                else:
+                    self.assertIsNone(found)
+
+    def test_interval_tree_2(self):
+        print("\n")
+        print("interval_tree_bulk")
+        intervals = sorted((i, i + i % 7) for i in range(0, 2000, 3))
+        tree = interval_rb_tree.from_sorted(intervals)
+        check_max_end(self, tree)
+        left, right = tree.split((1000,))
+        self.assertIsInstance(left, interval_rb_tree)
+        check_max_end(self, left)
+        check_max_end(self, right)
+        joined = rb_tree.join(left, (1000, 1500), right)
+        check_max_end(self, joined)
+        self.assertEqual([node.data for node in joined.stabbing(1400)], [(1000, 1500), (1398, 1403)])
+        joined.union([(5, 2000)])
+        joined.difference([(0, 0), (3, 6)])
+        check_max_end(self, joined)
+        self.assertEqual([node.data for node in joined.stabbing(1999)], [(5, 2000), (1998, 2001)])
+        counted = interval_rb_tree(duplicates=rb_tree.COUNT)
+        counted.insert_many([(1, 2)] * 5 + [(0, 9)])
+        check_max_end(self, counted)
+        self.assertEqual((len(counted), counted.count((1, 2)), counted.root.max_end), (6, 5, 9))
+
+
+if __name__ == "__main__":
+    unittest.main()
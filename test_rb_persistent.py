@@ -0,0 +1,114 @@
+from rb_persistent import persistent_rb_tree, _LEAF
+import random
+import threading
+import unittest
+
+
+def check_version(test, node):
+    # Asserts the red black properties and subtree sizes, and returns the
+    # black height of the subtree under node
+    if node is _LEAF:
+        return 1
+    if node.red:
+        test.assertFalse(node.left.red or node.right.red)
+    test.assertEqual(node.size, node.left.size + 1 + node.right.size)
+    height = check_version(test, node.left)
+    test.assertEqual(height, check_version(test, node.right))
+    return height + (not node.red)
+
+
+def nodes(node):
+    # Every node of a version
+    if node is _LEAF:
+        return []
+    return nodes(node.left) + [node] + nodes(node.right)
+
+
+class T0_persistent_tree_versions(unittest.TestCase):
+    def test_persistent_tree_versions_0(self):
+        print("\n")
+        print("persistent_tree_insert_delete")
+        empty = persistent_rb_tree()
+        tree = empty
+        for i in [7, 5, 9, 3, 6, 8, 10, 1, 2]:
+            tree = tree.insert(i, str(i))
+        self.assertEqual(len(empty), 0)
+        self.assertEqual(list(tree.keys()), [1, 2, 3, 5, 6, 7, 8, 9, 10])
+        self.assertEqual(tree[6], '6')
+        self.assertTrue(6 in tree)
+        self.assertIsNone(tree.get(4))
+        self.assertEqual(tree.find_min().data, 1)
+        self.assertEqual((tree.select(-1).data, tree.rank(6)), (10, 4))
+        replaced = tree.insert(6, 'six')
+        self.assertEqual((tree[6], replaced[6], len(replaced)), ('6', 'six', 9))
+        smaller = tree.delete(5).delete(7)
+        self.assertEqual(list(smaller.keys()), [1, 2, 3, 6, 8, 9, 10])
+        self.assertEqual(len(tree), 9)
+        with self.assertRaises(KeyError):
+            smaller.delete(5)
+        with self.assertRaises(KeyError):
+            smaller[5]
+        check_version(self, smaller.root)
+        self.assertFalse(smaller.root.red)
+
+    def test_persistent_tree_versions_1(self):
+        print("\n")
+        print("persistent_tree_random_versions")
+        rng = random.Random(16)
+        tree = persistent_rb_tree()
+        reference = {}
+        versions = []
+        for _ in range(2000):
+            key = rng.randrange(300)
+            if rng.random() < 0.6:
+                tree = tree.insert(key, -key)
+                reference[key] = -key
+            elif key in reference:
+                tree = tree.delete(key)
+                del reference[key]
+            versions.append((tree, sorted(reference.items())))
+        for version, expected in versions[::50]:
+            check_version(self, version.root)
+            self.assertEqual(list(version.items()), expected)
+
+    def test_persistent_tree_versions_2(self):
+        print("\n")
+        print("persistent_tree_sharing")
+        tree = persistent_rb_tree.from_sorted(range(0, 2000, 2))
+        check_version(self, tree.root)
+        old = set(map(id, nodes(tree.root)))
+        for newer in (tree.insert(1001), tree.delete(1000)):
+            new = [node for node in nodes(newer.root) if id(node) not in old]
+            # Only the path to the change is copied, at most twice the height
+            self.assertLess(len(new), 2 * check_version(self, newer.root) + 4)
+        with self.assertRaises(ValueError):
+            persistent_rb_tree.from_sorted([1, 1])
+
+    def test_persistent_tree_versions_3(self):
+        print("\n")
+        print("persistent_tree_lock_free_reads")
+        base = persistent_rb_tree.from_sorted(range(1000))
+        errors = []
+
+        def reader():
+            for _ in range(20):
+                if list(base.keys()) != list(range(1000)):
+                    errors.append(True)
+
+        def writer():
+            tree = base
+            for i in range(1000, 3000):
+                tree = tree.insert(i)
+                if i % 2:
+                    tree = tree.delete(i - 1000)
+
+        threads = [threading.Thread(target=reader) for _ in range(3)] + [threading.Thread(target=writer)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+
+
+if __name__ == "__main__":
+    unittest.main()
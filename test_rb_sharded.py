@@ -0,0 +1,58 @@
+from rb_sharded import sharded_rb_tree
+import random
+import unittest
+
+
+class T0_sharded_tree_ops(unittest.TestCase):
+    def test_sharded_tree_ops_0(self):
+        print("\n")
+        print("sharded_tree_ops")
+        with sharded_rb_tree(shards=3, min_rebalance=8) as tree:
+            tree.insert_many(range(0, 40, 2), [str(i) for i in range(0, 40, 2)])
+            # The first shard grew too big, so the keys were spread out
+            self.assertEqual(len(tree.boundaries), 2)
+            self.assertEqual(len(tree), 20)
+            self.assertEqual(tree.get_many([38, 3, 0, 20]), ['38', None, '0', '20'])
+            self.assertEqual(tree.get(5, 'missing'), 'missing')
+            self.assertTrue(10 in tree)
+            self.assertEqual(tree.contains_many([1, 2]), [False, True])
+            self.assertEqual(tree.irange(9, 17), [(10, '10'), (12, '12'), (14, '14'), (16, '16')])
+            self.assertEqual(tree.irange(9, 16, (True, True))[-1], (16, '16'))
+            self.assertEqual([item for item, value in tree.items()], list(range(0, 40, 2)))
+            self.assertEqual(tree.delete_many([0, 2, 3]), 2)
+            self.assertEqual(len(tree), 18)
+            tree.insert(3, 'three')
+            self.assertEqual(tree.items()[0], (3, 'three'))
+
+    def test_sharded_tree_ops_1(self):
+        print("\n")
+        print("sharded_tree_rebalance")
+        rng = random.Random(17)
+        with sharded_rb_tree(shards=4, min_rebalance=100) as tree:
+            keys = [rng.randrange(100000) for _ in range(4000)]
+            for i in range(0, 4000, 500):
+                tree.insert_many(keys[i:i + 500])
+            sizes = [len(tree.irange(lo, hi)) for lo, hi in zip([None] + tree.boundaries, tree.boundaries + [None])]
+            self.assertEqual(sum(sizes), 4000)
+            self.assertLessEqual(max(sizes) * 4, 2 * 4000)
+            # Skewed inserts past the last boundary move it again
+            tree.insert_many(range(200000, 210000))
+            self.assertGreater(tree.boundaries[-1], 100000)
+            self.assertEqual([item for item, value in tree.items()], sorted(keys) + list(range(200000, 210000)))
+
+    def test_sharded_tree_ops_2(self):
+        print("\n")
+        print("sharded_tree_duplicates_and_errors")
+        with sharded_rb_tree(shards=2, min_rebalance=10) as tree:
+            tree.insert_many([5] * 100)
+            tree.insert_many([5] * 100)
+            self.assertEqual(len(tree), 200)
+            self.assertEqual(len(tree.irange(5, 5, (True, True))), 200)
+            with self.assertRaises(ValueError):
+                tree.insert_many([1, 2], [1])
+            with self.assertRaises(TypeError):
+                tree.insert('a')
+
+
+if __name__ == "__main__":
+    unittest.main()
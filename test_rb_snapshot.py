@@ -0,0 +1,166 @@
+from rb_tree import rb_tree
+import os
+import random
+import tempfile
+import unittest
+
+try:
+    import numpy
+    from rb_snapshot import rb_snapshot
+except ImportError:
+    numpy = None
+
+
+@unittest.skipIf(numpy is None, "needs numpy")
+class T0_snapshot_queries(unittest.TestCase):
+    def test_snapshot_queries_0(self):
+        print("\n")
+        print("snapshot_freeze")
+        tree = rb_tree()
+        for i in [5, 1, 9, 3, 7, 3]:
+            tree[i] = i * 10
+        snapshot = tree.freeze()
+        self.assertIsInstance(snapshot, rb_snapshot)
+        self.assertEqual(len(snapshot), 5)
+        self.assertEqual(snapshot.keys.tolist(), [1, 3, 5, 7, 9])
+        self.assertIsNone(snapshot.values)
+        self.assertEqual(tree.freeze(values=True).values.tolist(), [10, 30, 50, 70, 90])
+        with self.assertRaises(ValueError):
+            snapshot.keys[0] = 2
+
+    def test_snapshot_queries_1(self):
+        print("\n")
+        print("snapshot_matches_tree")
+        rng = random.Random(12)
+        tree = rb_tree()
+        for _ in range(500):
+            tree.insert(rng.randrange(1000))
+        snapshot = tree.freeze()
+        probes = [rng.randrange(-10, 1010) for _ in range(300)]
+        self.assertEqual(snapshot.contains_many(probes).tolist(), [probe in tree for probe in probes])
+        self.assertEqual(snapshot.rank_many(probes).tolist(), [tree.rank(probe) for probe in probes])
+        his = [probe + rng.randrange(-50, 200) for probe in probes]
+        for inclusive in [(True, False), (False, True), (True, True), (False, False)]:
+            self.assertEqual(snapshot.range_count_many(probes, his, inclusive).tolist(),
+                             [tree.count_range(lo, hi, inclusive) for lo, hi in zip(probes, his)])
+
+    def test_snapshot_queries_3(self):
+        print("\n")
+        print("snapshot_reversed")
+        rng = random.Random(19)
+        tree = rb_tree(reverse=True)
+        for _ in range(300):
+            tree.insert(rng.randrange(500))
+        snapshot = tree.freeze()
+        self.assertTrue(snapshot.reverse)
+        self.assertEqual(snapshot.keys.tolist(), sorted(tree.keys()))
+        probes = [rng.randrange(-10, 510) for _ in range(200)]
+        self.assertEqual(snapshot.rank_many(probes).tolist(), [tree.rank(probe) for probe in probes])
+        los = [probe + rng.randrange(-50, 200) for probe in probes]
+        for inclusive in [(True, False), (False, True), (True, True), (False, False)]:
+            self.assertEqual(snapshot.range_count_many(los, probes, inclusive).tolist(),
+                             [tree.count_range(lo, hi, inclusive) for lo, hi in zip(los, probes)])
+        for reverse in (False, True):
+            self.assertEqual(snapshot.irange(400, 100, (False, True), reverse).tolist(),
+                             [node.data for node in tree.irange(400, 100, (False, True), reverse)])
+
+    def test_snapshot_queries_2(self):
+        print("\n")
+        print("snapshot_empty")
+        snapshot = rb_tree().freeze()
+        self.assertEqual(len(snapshot), 0)
+        self.assertEqual(snapshot.contains_many([1, 2]).tolist(), [False, False])
+        self.assertEqual(snapshot.rank_many([1]).tolist(), [0])
+
+
+@unittest.skipIf(numpy is None, "needs numpy")
+class T1_snapshot_file(unittest.TestCase):
+    def setUp(self):
+        handle, self.path = tempfile.mkstemp()
+        os.close(handle)
+
+    def tearDown(self):
+        os.remove(self.path)
+
+    def test_snapshot_file_0(self):
+        print("\n")
+        print("snapshot_save_load")
+        tree = rb_tree()
+        for i in [7, 5, 9, 3, 6, 8, 10, 1, 2]:
+            tree[i] = i * 1.5
+        tree.save(self.path)
+        for mmap in (True, False):
+            snapshot = rb_tree.load(self.path, mmap=mmap)
+            self.assertEqual(snapshot.keys.tolist(), [1, 2, 3, 5, 6, 7, 8, 9, 10])
+            self.assertEqual(snapshot.values.tolist(), [i * 1.5 for i in [1, 2, 3, 5, 6, 7, 8, 9, 10]])
+            self.assertEqual(snapshot.colors.tolist(), [node.red for node in tree])
+            self.assertTrue(6 in snapshot)
+            self.assertFalse(4 in snapshot)
+            self.assertEqual(snapshot.get(8), 12.0)
+            self.assertEqual(snapshot.get(4, 'missing'), 'missing')
+            self.assertEqual(snapshot.irange(3, 8).tolist(), [3, 5, 6, 7])
+            self.assertEqual(snapshot.irange(3, 8, (False, True), reverse=True).tolist(), [8, 7, 6, 5])
+            self.assertEqual(snapshot.irange(hi=1).tolist(), [])
+            with self.assertRaises(ValueError):
+                snapshot.keys[0] = 0
+
+    def test_snapshot_file_1(self):
+        print("\n")
+        print("snapshot_thaw")
+        tree = rb_tree.from_iterable(random.Random(13).sample(range(10000), 1000))
+        tree.save(self.path)
+        snapshot = rb_tree.load(self.path)
+        self.assertIsNone(snapshot.values)
+        thawed = snapshot.thaw()
+        self.assertEqual(list(thawed.keys()), list(tree.keys()))
+        self.assertEqual(type(next(iter(thawed)).data), int)
+        thawed.insert(-1)
+        self.assertEqual(thawed.find_min().data, -1)
+        # A COUNT tree comes back with its counts, not a node per count
+        counted = rb_tree(duplicates=rb_tree.COUNT)
+        counted.insert_many([1, 1, 2])
+        counted.save(self.path)
+        thawed = rb_tree.load(self.path).thaw()
+        self.assertEqual((thawed.duplicates, len(thawed), thawed.count(1), thawed.root.size), (rb_tree.COUNT, 3, 2, 3))
+        self.assertEqual([node.data for node in thawed], [1, 2])
+        # A reversed tree comes back reversed, with its values in the same order
+        descending = rb_tree.from_sorted([9, 7, 7, 2], [1.0, 2.0, 3.0, 4.0], reverse=True)
+        descending.save(self.path)
+        thawed = rb_tree.load(self.path).thaw()
+        self.assertTrue(thawed.reverse)
+        self.assertEqual(list(thawed.items()), list(descending.items()))
+        with self.assertRaises(ValueError):
+            rb_tree(key=abs).save(self.path)
+
+    def test_snapshot_file_2(self):
+        print("\n")
+        print("snapshot_file_errors")
+        tree = rb_tree.from_sorted(range(100))
+        tree.save(self.path)
+        with open(self.path, 'r+b') as file:
+            file.seek(-1, os.SEEK_END)
+            last = file.read(1)
+            file.seek(-1, os.SEEK_END)
+            file.write(bytes([last[0] ^ 1]))
+        with self.assertRaises(ValueError):
+            rb_tree.load(self.path)
+        self.assertEqual(len(rb_snapshot.load(self.path, verify=False)), 100)
+        # The header is checksummed too: the duplicates byte and the key type
+        for offset, byte in ((7, 1), (17, ord('u'))):
+            tree.save(self.path)
+            with open(self.path, 'r+b') as file:
+                file.seek(offset)
+                file.write(bytes([byte]))
+            with self.assertRaises(ValueError):
+                rb_tree.load(self.path)
+        with open(self.path, 'wb') as file:
+            file.write(b'not a snapshot at all, not even close to one, at all')
+        with self.assertRaises(ValueError):
+            rb_tree.load(self.path)
+        tree[1] = {'not': 'mappable'}
+        with self.assertRaises(ValueError):
+            tree.save(self.path)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,6 +1,41 @@
-from rb_tree import Node, rb_tree
+from rb_tree import Node, monoid, rb_tree, rb_cursor
+import copy
+import math
+import operator
+from operator import itemgetter
+import pickle
+import random
 import unittest
 
+
+def check_tree(test, tree):
+    # Asserts the red black properties, parent links and subtree sizes,
+    # and returns the black height of the tree
+    sentinel = tree.sentinel
+    test.assertFalse(tree.root.red)
+
+    def walk(node):
+        if node is sentinel:
+            return 1, 0
+        for child in (node.left, node.right):
+            if child is not sentinel:
+                test.assertIs(child.parent, node)
+                if node.red:
+                    test.assertFalse(child.red)
+        left_height, left_size = walk(node.left)
+        right_height, right_size = walk(node.right)
+        test.assertEqual(left_height, right_height)
+        # Only a tree that counts duplicates has nodes counted more than once
+        count = node.size - left_size - right_size
+        if tree.duplicates == tree.COUNT:
+            test.assertGreaterEqual(count, 1)
+        else:
+            test.assertEqual(count, 1)
+        return left_height + (0 if node.red else 1), node.size
+
+    return walk(tree.root)[0]
+
+
 class T0_tree_left_rotation(unittest.TestCase):
     def test_tree_left_rotation_1(self):
         print("\n")
@@ -370,5 +405,1000 @@ class T3_tree_delete(unittest.TestCase):
 
     
 
+
+class T4_node_layout(unittest.TestCase):
+    def test_node_layout_0(self):
+        print("\n")
+        print("node_layout")
+        node = Node(1)
+        self.assertFalse(hasattr(node, '__dict__'))
+        with self.assertRaises(AttributeError):
+            node.extra = 1
+        # A plain node keeps no key of its own, its key is its data
+        self.assertNotIn('key', Node.__slots__)
+        self.assertEqual(node.key, 1)
+        keyed = rb_tree(key=abs)
+        keyed.insert(-2)
+        self.assertEqual((keyed.root.data, keyed.root.key), (-2, 2))
+
+    def test_node_layout_1(self):
+        print("\n")
+        print("node_color_view")
+        node = Node(1)
+        self.assertTrue(node.red)
+        self.assertEqual(node.color, 'red')
+        node.color = 'black'
+        self.assertFalse(node.red)
+        self.assertEqual(node.color, 'black')
+        tree = rb_tree()
+        self.assertEqual(tree.sentinel.color, 'black')
+
+
+class T5_tree_traversal(unittest.TestCase):
+    def test_tree_traversal_0(self):
+        print("\n")
+        print("tree_traversal")
+        tree = rb_tree()
+        for i in range(1, 8):
+            tree.insert(i)
+        self.assertEqual([node.data for node in tree.inorder()], [1, 2, 3, 4, 5, 6, 7])
+        self.assertEqual([node.data for node in tree.preorder()], [2, 1, 4, 3, 6, 5, 7])
+        self.assertEqual([node.data for node in tree.postorder()], [1, 3, 5, 7, 6, 4, 2])
+        self.assertEqual([node.data for node in tree], [1, 2, 3, 4, 5, 6, 7])
+
+    def test_tree_traversal_1(self):
+        print("\n")
+        print("tree_traversal_empty")
+        tree = rb_tree()
+        self.assertEqual(list(tree.inorder()), [])
+        self.assertEqual(list(tree.preorder()), [])
+        self.assertEqual(list(tree.postorder()), [])
+
+    def test_tree_traversal_2(self):
+        print("\n")
+        print("tree_traversal_deep")
+        # An unbalanced chain deeper than the recursion limit
+        tree = rb_tree()
+        for i in range(2000):
+            tree.bst_insert(i)
+        self.assertEqual([node.data for node in tree.inorder()], list(range(2000)))
+        self.assertEqual([node.data for node in tree.postorder()], list(range(1999, -1, -1)))
+        self.assertEqual(tree.find_node(1999).data, 1999)
+
+
+class T6_tree_lookup(unittest.TestCase):
+    def test_tree_lookup_0(self):
+        print("\n")
+        print("tree_contains")
+        tree = rb_tree()
+        self.assertFalse(1 in tree)
+        for i in range(1, 8):
+            tree.insert(i)
+        self.assertTrue(4 in tree)
+        self.assertFalse(8 in tree)
+        self.assertFalse(0 in tree)
+
+    def test_tree_lookup_1(self):
+        print("\n")
+        print("tree_get")
+        tree = rb_tree()
+        self.assertIsNone(tree.get(1))
+        for i in range(1, 8):
+            tree.insert(i)
+        self.assertEqual(tree.get(3).data, 3)
+        self.assertIsNone(tree.get(9))
+        self.assertEqual(tree.get(9, 'missing'), 'missing')
+
+    def test_tree_lookup_2(self):
+        print("\n")
+        print("tree_find_node_default")
+        tree = rb_tree()
+        self.assertIsNone(tree.find_node(1, None))
+        tree.insert(1)
+        self.assertEqual(tree.find_node(1, None).data, 1)
+        self.assertIsNone(tree.find_node(2, default=None))
+        with self.assertRaises(KeyError):
+            tree.find_node(2)
+
+
+class T7_tree_map(unittest.TestCase):
+    def test_tree_map_0(self):
+        print("\n")
+        print("tree_map_set_get")
+        tree = rb_tree()
+        for i in range(1, 8):
+            tree[i] = str(i)
+        self.assertEqual(tree[3], '3')
+        tree[3] = 'three'
+        self.assertEqual(tree[3], 'three')
+        self.assertEqual([node.data for node in tree.inorder()], [1, 2, 3, 4, 5, 6, 7])
+        with self.assertRaises(KeyError):
+            tree[8]
+
+    def test_tree_map_1(self):
+        print("\n")
+        print("tree_map_delete_pop")
+        tree = rb_tree()
+        for i in range(1, 8):
+            tree[i] = i * 10
+        del tree[4]
+        self.assertFalse(4 in tree)
+        self.assertEqual(tree.pop(5), 50)
+        self.assertEqual(tree.pop(5, None), None)
+        with self.assertRaises(KeyError):
+            tree.pop(5)
+        with self.assertRaises(KeyError):
+            del tree[5]
+        self.assertEqual(list(tree.items()), [(1, 10), (2, 20), (3, 30), (6, 60), (7, 70)])
+        self.assertEqual(list(tree.keys()), [1, 2, 3, 6, 7])
+        self.assertEqual(list(tree.values()), [10, 20, 30, 60, 70])
+
+    def test_tree_map_2(self):
+        print("\n")
+        print("tree_map_setdefault")
+        tree = rb_tree()
+        self.assertEqual(tree.setdefault(1, []), [])
+        tree.setdefault(1, []).append('a')
+        self.assertEqual(tree[1], ['a'])
+        tree.insert(2, 'b')
+        self.assertEqual(tree.find_node(2).value, 'b')
+
+
+class T8_tree_order_statistics(unittest.TestCase):
+    def test_tree_order_statistics_0(self):
+        print("\n")
+        print("tree_len_select_rank")
+        tree = rb_tree()
+        self.assertEqual(len(tree), 0)
+        for i in range(1, 8):
+            tree.insert(i * 10)
+        self.assertEqual(len(tree), 7)
+        self.assertEqual([tree.select(k).data for k in range(7)], [10, 20, 30, 40, 50, 60, 70])
+        self.assertEqual(tree.select(-1).data, 70)
+        with self.assertRaises(IndexError):
+            tree.select(7)
+        self.assertEqual(tree.rank(40), 3)
+        self.assertEqual(tree.rank(45), 4)
+        self.assertEqual(tree.rank(0), 0)
+        self.assertEqual(tree.count_range(20, 50), 3)
+        self.assertEqual(tree.count_range(20, 50, inclusive=(False, True)), 3)
+        self.assertEqual(tree.count_range(20, 50, inclusive=(True, True)), 4)
+        self.assertEqual(tree.count_range(50, 20), 0)
+
+    def test_tree_order_statistics_1(self):
+        print("\n")
+        print("tree_sizes_random")
+        rng = random.Random(5)
+        tree = rb_tree()
+        keys = []
+        for _ in range(300):
+            key = rng.randrange(100)
+            tree.insert(key)
+            keys.append(key)
+        check_tree(self, tree)
+        for key in keys[:150]:
+            tree.delete(key)
+        check_tree(self, tree)
+        remaining = sorted(keys[150:])
+        self.assertEqual(len(tree), len(remaining))
+        self.assertEqual([tree.select(k).data for k in range(len(tree))], remaining)
+        for key in range(100):
+            self.assertEqual(tree.rank(key), sum(1 for k in remaining if k < key))
+
+    def test_tree_order_statistics_2(self):
+        print("\n")
+        print("tree_sizes_rotation")
+        tree = rb_tree()
+        for i in [7, 5, 9, 3, 6, 8, 10, 1, 2]:
+            tree.bst_insert(i)
+        tree.left_rotate(tree.root)
+        tree.right_rotate(tree.find_node(5))
+        self.assertEqual(tree.root.size, 9)
+        self.assertEqual([tree.select(k).data for k in range(9)], [1, 2, 3, 5, 6, 7, 8, 9, 10])
+
+
+class T9_tree_irange(unittest.TestCase):
+    def test_tree_irange_0(self):
+        print("\n")
+        print("tree_irange")
+        tree = rb_tree()
+        self.assertEqual(list(tree.irange(1, 5)), [])
+        for i in range(0, 20, 2):
+            tree.insert(i)
+        self.assertEqual([n.data for n in tree.irange(4, 10)], [4, 6, 8])
+        self.assertEqual([n.data for n in tree.irange(3, 11)], [4, 6, 8, 10])
+        self.assertEqual([n.data for n in tree.irange(4, 10, inclusive=(False, True))], [6, 8, 10])
+        self.assertEqual([n.data for n in tree.irange(hi=5)], [0, 2, 4])
+        self.assertEqual([n.data for n in tree.irange(15)], [16, 18])
+        self.assertEqual([n.data for n in tree.irange()], list(range(0, 20, 2)))
+        self.assertEqual([n.data for n in tree.irange(10, 4)], [])
+
+    def test_tree_irange_1(self):
+        print("\n")
+        print("tree_irange_reverse")
+        tree = rb_tree()
+        for i in range(0, 20, 2):
+            tree.insert(i)
+        self.assertEqual([n.data for n in tree.irange(4, 10, reverse=True)], [8, 6, 4])
+        self.assertEqual([n.data for n in tree.irange(4, 10, (False, True), True)], [10, 8, 6])
+        self.assertEqual([n.data for n in tree.irange(reverse=True)], list(range(18, -1, -2)))
+
+    def test_tree_irange_2(self):
+        print("\n")
+        print("tree_irange_random")
+        rng = random.Random(6)
+        tree = rb_tree()
+        keys = [rng.randrange(50) for _ in range(200)]
+        for key in keys:
+            tree.insert(key)
+        keys.sort()
+        for lo, hi in [(0, 50), (10, 20), (25, 25), (-5, 3), (49, 100)]:
+            self.assertEqual([n.data for n in tree.irange(lo, hi)], [k for k in keys if lo <= k < hi])
+            self.assertEqual([n.data for n in tree.irange(lo, hi, (True, True), True)],
+                             [k for k in reversed(keys) if lo <= k <= hi])
+
+    def test_tree_find_successor(self):
+        print("\n")
+        print("tree_find_successor")
+        tree = rb_tree()
+        for i in range(1, 8):
+            tree.insert(i)
+        self.assertEqual(tree.find_successor(3).data, 4)
+        self.assertEqual(tree.find_successor(4).data, 5)
+        self.assertIsNone(tree.find_successor(7))
+
+
+class T10_tree_cursor(unittest.TestCase):
+    def test_tree_cursor_0(self):
+        print("\n")
+        print("tree_cursor")
+        tree = rb_tree()
+        for i in range(0, 10, 2):
+            tree.insert(i)
+        cursor = tree.cursor()
+        self.assertIsInstance(cursor, rb_cursor)
+        self.assertEqual(cursor.peek().data, 0)
+        self.assertEqual([cursor.next().data for _ in range(4)], [2, 4, 6, 8])
+        self.assertIsNone(cursor.next())
+        self.assertIsNone(cursor.peek())
+        self.assertEqual(cursor.prev().data, 8)
+        self.assertEqual(cursor.prev().data, 6)
+        self.assertEqual(cursor.seek(3).data, 4)
+        self.assertEqual(cursor.prev().data, 2)
+        self.assertEqual(cursor.prev().data, 0)
+        self.assertIsNone(cursor.prev())
+        self.assertEqual(cursor.next().data, 0)
+        self.assertIsNone(cursor.seek(9))
+        self.assertEqual(cursor.prev().data, 8)
+
+    def test_tree_cursor_1(self):
+        print("\n")
+        print("tree_cursor_empty")
+        tree = rb_tree()
+        cursor = tree.cursor()
+        self.assertIsNone(cursor.peek())
+        self.assertIsNone(cursor.next())
+        self.assertIsNone(cursor.prev())
+        self.assertIsNone(tree.cursor(5).peek())
+
+    def test_tree_cursor_2(self):
+        print("\n")
+        print("tree_floor_ceiling")
+        tree = rb_tree()
+        self.assertIsNone(tree.floor(1))
+        for i in range(0, 10, 2):
+            tree.insert(i)
+        self.assertEqual(tree.floor(4).data, 4)
+        self.assertEqual(tree.floor(5).data, 4)
+        self.assertIsNone(tree.floor(-1))
+        self.assertEqual(tree.ceiling(4).data, 4)
+        self.assertEqual(tree.ceiling(5).data, 6)
+        self.assertIsNone(tree.ceiling(9))
+        self.assertEqual(tree.lower(4).data, 2)
+        self.assertIsNone(tree.lower(0))
+        self.assertEqual(tree.higher(4).data, 6)
+        self.assertIsNone(tree.higher(8))
+
+    def test_tree_cursor_3(self):
+        print("\n")
+        print("tree_successor_predecessor")
+        tree = rb_tree()
+        for i in range(100):
+            tree.insert(i)
+        node = tree.find_min()
+        seen = []
+        while node is not None:
+            seen.append(node.data)
+            node = tree.successor(node)
+        self.assertEqual(seen, list(range(100)))
+        self.assertEqual(tree.predecessor(tree.find_node(50)).data, 49)
+        self.assertIsNone(tree.predecessor(tree.find_min()))
+
+
+class T11_tree_bulk_load(unittest.TestCase):
+    def test_tree_bulk_load_0(self):
+        print("\n")
+        print("tree_from_sorted")
+        for n in range(0, 130):
+            tree = rb_tree.from_sorted(range(n))
+            check_tree(self, tree)
+            self.assertEqual([node.data for node in tree.inorder()], list(range(n)))
+            self.assertEqual(len(tree), n)
+
+    def test_tree_bulk_load_1(self):
+        print("\n")
+        print("tree_from_sorted_values")
+        tree = rb_tree.from_sorted([1, 2, 2, 3], values='abcd')
+        self.assertEqual(list(tree.items()), [(1, 'a'), (2, 'b'), (2, 'c'), (3, 'd')])
+        tree.insert(0)
+        tree.delete(2)
+        check_tree(self, tree)
+        with self.assertRaises(ValueError):
+            rb_tree.from_sorted([2, 1])
+        with self.assertRaises(ValueError):
+            rb_tree.from_sorted([1, 2], values=[1])
+
+    def test_tree_bulk_load_2(self):
+        print("\n")
+        print("tree_from_iterable")
+        rng = random.Random(8)
+        keys = [rng.randrange(1000) for _ in range(500)]
+        tree = rb_tree.from_iterable(keys)
+        check_tree(self, tree)
+        self.assertEqual([node.data for node in tree.inorder()], sorted(keys))
+
+
+class T12_tree_batch(unittest.TestCase):
+    def test_tree_batch_0(self):
+        print("\n")
+        print("tree_insert_many_finger")
+        rng = random.Random(12)
+        tree = rb_tree.from_sorted(range(0, 2000, 2))
+        batch = [rng.randrange(2000) for _ in range(100)]
+        tree.insert_many(batch)
+        check_tree(self, tree)
+        self.assertEqual([node.data for node in tree], sorted(list(range(0, 2000, 2)) + batch))
+        # Appending past the largest data, with some smaller data mixed in
+        tree.insert_many(list(range(2000, 2100)) + [1, 1999])
+        check_tree(self, tree)
+        self.assertEqual([node.data for node in tree],
+                         sorted(list(range(0, 2000, 2)) + batch + list(range(2000, 2100)) + [1, 1999]))
+        tree = rb_tree.from_sorted([10])
+        tree.insert(20)
+        tree.insert_many([0, 1, 2, 3, 4, 5, 6, 7, 8, 9, 10])
+        check_tree(self, tree)
+        self.assertEqual([node.data for node in tree], [0, 1, 2, 3, 4, 5, 6, 7, 8, 9, 10, 10, 20])
+
+    def test_tree_batch_1(self):
+        print("\n")
+        print("tree_insert_many_rebuild")
+        tree = rb_tree()
+        tree.insert_many([5, 3, 9, 3])
+        check_tree(self, tree)
+        tree.insert_many([1, 7, 3, 4, 8], values='abcde')
+        check_tree(self, tree)
+        self.assertEqual([node.data for node in tree], [1, 3, 3, 3, 4, 5, 7, 8, 9])
+        self.assertEqual(tree[8], 'e')
+        tree.insert_many([])
+        self.assertEqual(len(tree), 9)
+        with self.assertRaises(ValueError):
+            tree.insert_many([1, 2], values=[1])
+
+    def test_tree_batch_2(self):
+        print("\n")
+        print("tree_delete_many")
+        tree = rb_tree.from_sorted(range(1000))
+        self.assertEqual(tree.delete_many([10, 20, 20, 5000]), 2)
+        check_tree(self, tree)
+        self.assertFalse(10 in tree)
+        self.assertEqual(len(tree), 998)
+        self.assertEqual(tree.delete_many(range(0, 1000, 2)), 498)
+        check_tree(self, tree)
+        self.assertEqual([node.data for node in tree], list(range(1, 1000, 2)))
+        self.assertEqual(rb_tree().delete_many([1]), 0)
+
+
+class T13_tree_join_split(unittest.TestCase):
+    def test_tree_join_split_0(self):
+        print("\n")
+        print("tree_split")
+        rng = random.Random(13)
+        keys = sorted(rng.randrange(200) for _ in range(150))
+        for pivot in [-1, 0, 50, 100, 101, 199, 250]:
+            tree = rb_tree()
+            for key in keys:
+                tree.insert(key)
+            left, right = tree.split(pivot)
+            check_tree(self, left)
+            check_tree(self, right)
+            self.assertEqual(len(tree), 0)
+            self.assertEqual([node.data for node in left], [k for k in keys if k < pivot])
+            self.assertEqual([node.data for node in right], [k for k in keys if k >= pivot])
+
+    def test_tree_join_split_1(self):
+        print("\n")
+        print("tree_join")
+        for left_size, right_size in [(0, 0), (0, 5), (5, 0), (1, 100), (100, 1), (37, 60), (200, 3)]:
+            left = rb_tree.from_sorted(range(left_size))
+            right = rb_tree.from_sorted(range(left_size + 1, left_size + 1 + right_size))
+            tree = rb_tree.join(left, left_size, right, value='middle')
+            check_tree(self, tree)
+            self.assertEqual([node.data for node in tree], list(range(left_size + right_size + 1)))
+            self.assertEqual(tree[left_size], 'middle')
+            self.assertEqual(len(left), 0)
+            self.assertEqual(len(right), 0)
+        with self.assertRaises(ValueError):
+            rb_tree.join(rb_tree.from_sorted([5]), 3, rb_tree())
+        with self.assertRaises(ValueError):
+            rb_tree.join(rb_tree(), 3, rb_tree.from_sorted([1]))
+
+    def test_tree_join_split_2(self):
+        print("\n")
+        print("tree_split_join_roundtrip")
+        rng = random.Random(14)
+        tree = rb_tree()
+        for _ in range(300):
+            tree.insert(rng.randrange(1000))
+        expected = [node.data for node in tree]
+        left, right = tree.split(500)
+        middle = right.find_min().data
+        right.delete(middle)
+        tree = rb_tree.join(left, middle, right)
+        check_tree(self, tree)
+        self.assertEqual([node.data for node in tree], expected)
+
+    def test_tree_join_split_3(self):
+        print("\n")
+        print("tree_copies_share_sentinel")
+        tree = rb_tree.from_sorted(range(10))
+        for clone in (copy.deepcopy(tree), pickle.loads(pickle.dumps(tree))):
+            self.assertIs(clone.sentinel, tree.sentinel)
+            check_tree(self, clone)
+            joined = rb_tree.join(clone, 10, rb_tree.from_sorted(range(11, 20)))
+            check_tree(self, joined)
+            self.assertEqual([node.data for node in joined], list(range(20)))
+
+    def test_tree_set_algebra_0(self):
+        print("\n")
+        print("tree_union")
+        rng = random.Random(15)
+        for n, m in [(0, 10), (10, 0), (200, 20), (20, 200), (100, 100)]:
+            a = [rng.randrange(300) for _ in range(n)]
+            b = [rng.randrange(300) for _ in range(m)]
+            tree = rb_tree()
+            for key in a:
+                tree.insert(key)
+            other = rb_tree()
+            for key in b:
+                other[key] = -key
+            self.assertIs(tree.union(other), tree)
+            check_tree(self, tree)
+            self.assertEqual([node.data for node in tree], sorted(a + sorted(set(b) - set(a))))
+            for key in set(b) - set(a):
+                self.assertEqual(tree[key], -key)
+            self.assertEqual(len(other), len(set(b)))
+
+    def test_tree_set_algebra_1(self):
+        print("\n")
+        print("tree_intersection_difference")
+        rng = random.Random(16)
+        for n, m in [(0, 10), (10, 0), (200, 20), (20, 200), (100, 100)]:
+            a = [rng.randrange(300) for _ in range(n)]
+            b = [rng.randrange(300) for _ in range(m)]
+            tree = rb_tree()
+            for key in a:
+                tree.insert(key)
+            tree.intersection(b)
+            check_tree(self, tree)
+            self.assertEqual([node.data for node in tree], sorted(k for k in a if k in set(b)))
+            tree = rb_tree()
+            for key in a:
+                tree.insert(key)
+            tree.difference(rb_tree.from_iterable(b))
+            check_tree(self, tree)
+            self.assertEqual([node.data for node in tree], sorted(k for k in a if k not in set(b)))
+
+
+class T14_tree_key(unittest.TestCase):
+    def test_tree_key_0(self):
+        print("\n")
+        print("tree_key_function")
+        records = [('carol', 35), ('alice', 30), ('bob', 25), ('dave', 30)]
+        tree = rb_tree(key=lambda record: record[1])
+        for record in records:
+            tree.insert(record, record[0])
+        check_tree(self, tree)
+        # Equal keys keep their insertion order, like sorted
+        self.assertEqual([node.data for node in tree], sorted(records, key=lambda record: record[1]))
+        self.assertEqual(tree.find_key(30).data, ('alice', 30))
+        self.assertIsNone(tree.find_key(31))
+        self.assertEqual([node.value for node in tree.irange_key(26, 35)], ['alice', 'dave'])
+        # Everything else takes data and keys it, like insert
+        self.assertEqual(tree[('x', 35)], 'carol')
+        self.assertTrue(('x', 25) in tree)
+        self.assertEqual(tree.ceiling(('x', 26)).data, ('alice', 30))
+        self.assertEqual([node.value for node in tree.irange(('x', 26), ('x', 35))], ['alice', 'dave'])
+        self.assertEqual((tree.rank(('x', 30)), tree.count_range(('x', 25), ('x', 30), (True, True))), (1, 3))
+        tree[('erin', 25)] = 'erin'
+        self.assertEqual(tree[('erin', 25)], 'erin')
+        self.assertEqual(tree.pop(('carol', 35)), 'carol')
+        tree.delete(('erin', 25))
+        self.assertEqual(tree.delete_many([('alice', 30), ('zed', 99)]), 1)
+        self.assertEqual([node.data for node in tree], [('dave', 30)])
+        # A map keyed case-insensitively reads back what it writes
+        names = rb_tree(key=str.lower)
+        names['Bob'] = 2
+        names.insert('Apple', 1)
+        self.assertEqual((names['Bob'], names['BOB'], 'Apple' in names, names.get('apple').data), (2, 2, True, 'Apple'))
+        self.assertEqual(names.setdefault('bob'), 2)
+        names.delete('Bob')
+        self.assertEqual(list(names.keys()), ['Apple'])
+
+    def test_tree_key_1(self):
+        print("\n")
+        print("tree_key_reverse")
+        tree = rb_tree(reverse=True)
+        for i in [7, 5, 9, 3, 6, 8, 10, 1, 2]:
+            tree.insert(i)
+        check_tree(self, tree)
+        # The nodes are kept from the smallest key up, and only shown the other way round
+        self.assertIs(type(tree.root), Node)
+        leftmost = tree.root
+        while leftmost.left is not tree.sentinel:
+            leftmost = leftmost.left
+        self.assertEqual(leftmost.data, 1)
+        self.assertEqual([node.data for node in tree], [10, 9, 8, 7, 6, 5, 3, 2, 1])
+        self.assertEqual(tree.find_min().data, 10)
+        self.assertEqual((tree.floor(4).data, tree.ceiling(4).data, tree.higher(5).data), (5, 3, 3))
+        self.assertEqual([node.data for node in tree.irange(8, 3)], [8, 7, 6, 5])
+        self.assertEqual((tree.select(0).data, tree.rank(6)), (10, 4))
+        left, right = tree.split(6)
+        self.assertEqual(([node.data for node in left], [node.data for node in right]), ([10, 9, 8, 7], [6, 5, 3, 2, 1]))
+        joined = rb_tree.join(left, 6.5, right)
+        self.assertEqual(joined.select(4).data, 6.5)
+        with self.assertRaises(ValueError):
+            rb_tree.join(rb_tree.from_sorted([3, 1], reverse=True), 2, rb_tree(reverse=True))
+        joined.difference([6.5, 1])
+        joined.union([4, 11])
+        self.assertEqual([node.data for node in joined], [11, 10, 9, 8, 7, 6, 5, 4, 3, 2])
+        joined.delete_many(range(2, 9))
+        self.assertEqual(list(joined.keys()), [11, 10, 9])
+        check_tree(self, joined)
+
+    def test_tree_key_2(self):
+        print("\n")
+        print("tree_key_bulk")
+        rng = random.Random(19)
+        words = [''.join(rng.choice('abcdef') for _ in range(rng.randrange(1, 6))) for _ in range(400)]
+        for key, reverse in [(len, False), (len, True), (None, True), (str.upper, False)]:
+            expected = sorted(words, key=key, reverse=reverse)
+            built = rb_tree.from_iterable(words, key=key, reverse=reverse)
+            self.assertEqual([node.data for node in built], expected)
+            inserted = rb_tree(key=key, reverse=reverse)
+            for word in words:
+                inserted.insert(word)
+            self.assertEqual([node.data for node in inserted], expected)
+            batched = rb_tree(key=key, reverse=reverse)
+            batched.insert_many(words[:300])
+            batched.insert_many(words[300:])
+            check_tree(self, batched)
+            self.assertEqual([node.data for node in batched], expected)
+        with self.assertRaises(ValueError):
+            rb_tree.from_sorted(['bb', 'a'], key=len)
+
+
+class T15_tree_duplicates(unittest.TestCase):
+    def test_tree_duplicates_0(self):
+        print("\n")
+        print("tree_duplicates_count")
+        rng = random.Random(20)
+        tree = rb_tree(duplicates=rb_tree.COUNT)
+        expected = []
+        for step in range(60):
+            choice = rng.random()
+            if choice < 0.4:
+                batch = [rng.randrange(30) for _ in range(rng.choice([1, 5, 200]))]
+                tree.insert_many(batch)
+                expected.extend(batch)
+            elif choice < 0.6:
+                item = rng.randrange(30)
+                tree.insert(item)
+                expected.append(item)
+            elif choice < 0.8:
+                batch = [rng.randrange(30) for _ in range(rng.choice([3, 150]))]
+                removed = 0
+                for item in batch:
+                    if item in expected:
+                        expected.remove(item)
+                        removed += 1
+                self.assertEqual(tree.delete_many(batch), removed)
+            elif expected:
+                item = rng.choice(expected)
+                expected.remove(item)
+                if step % 2:
+                    tree.delete(item)
+                else:
+                    tree.pop(item)
+            expected.sort()
+            check_tree(self, tree)
+            self.assertEqual(list(tree.keys()), expected)
+            self.assertEqual(len(tree), len(expected))
+            self.assertEqual(sum(1 for _ in tree), len(set(expected)))
+        for k in range(len(expected)):
+            self.assertEqual(tree.select(k).data, expected[k])
+        self.assertEqual(tree.select(-1).data, expected[-1])
+        for item in range(31):
+            self.assertEqual(tree.rank(item), sum(1 for other in expected if other < item))
+            self.assertEqual(tree.count(item), expected.count(item))
+
+    def test_tree_duplicates_1(self):
+        print("\n")
+        print("tree_duplicates_set")
+        ignored = rb_tree(duplicates=rb_tree.IGNORE)
+        for i in [3, 1, 3, 2, 1]:
+            ignored.insert(i, str(i))
+        ignored.insert_many([2, 4, 4, 0])
+        self.assertEqual(list(ignored.items()), [(0, None), (1, '1'), (2, '2'), (3, '3'), (4, None)])
+        ignored[3] = 'three'
+        self.assertEqual((ignored[3], ignored.count(3), len(ignored)), ('three', 1, 5))
+        check_tree(self, ignored)
+        rejected = rb_tree.from_sorted([1, 2, 3], duplicates=rb_tree.REJECT)
+        with self.assertRaises(ValueError):
+            rejected.insert(2)
+        for batch in ([4, 5, 3], [7, 6, 7], [0] * 10):
+            with self.assertRaises(ValueError):
+                rejected.insert_many(batch)
+        self.assertEqual(list(rejected.keys()), [1, 2, 3])
+        rejected.insert_many([0, 4])
+        self.assertEqual(list(rejected.keys()), [0, 1, 2, 3, 4])
+        with self.assertRaises(ValueError):
+            rb_tree.from_sorted([1, 1], duplicates=rb_tree.REJECT)
+        with self.assertRaises(ValueError):
+            rb_tree(duplicates=4)
+        with self.assertRaises(ValueError):
+            rb_tree.join(rejected, 4, rb_tree(duplicates=rb_tree.REJECT))
+        check_tree(self, rejected)
+
+    def test_tree_duplicates_2(self):
+        print("\n")
+        print("tree_duplicates_count_bulk")
+        stamps = [i // 100 for i in range(10000)]
+        tree = rb_tree.from_sorted(stamps, duplicates=rb_tree.COUNT)
+        check_tree(self, tree)
+        self.assertEqual((len(tree), sum(1 for _ in tree), tree.count(42)), (10000, 100, 100))
+        self.assertLessEqual(check_tree(self, tree), 8)
+        left, right = tree.split(50)
+        self.assertEqual((len(left), len(right), right.duplicates), (5000, 5000, rb_tree.COUNT))
+        joined = rb_tree.join(left, 49.5, right)
+        check_tree(self, joined)
+        self.assertEqual((len(joined), joined.select(5000).data, joined.select(5001).data), (10001, 49.5, 50))
+        joined.union([49.5, 100, 100])
+        joined.difference([0])
+        joined.intersection(range(90, 101))
+        check_tree(self, joined)
+        self.assertEqual(list(joined.items())[::100], [(i, None) for i in range(90, 100)] + [(100, None)])
+        self.assertEqual(len(joined), 1001)
+        self.assertEqual(rb_tree.from_iterable('abracadabra', duplicates=rb_tree.COUNT).count('a'), 5)
+
+
+def check_aggregates(test, tree):
+    # Asserts that every node keeps the fold of its subtree, in order, which on a
+    # reversed tree runs from the right child to the left one
+    monoid = tree.monoid
+
+    def walk(node):
+        if node is tree.sentinel:
+            return monoid.identity
+        item = node.value if monoid.measure is None else monoid.measure(node.data, node.value)
+        first, last = (node.right, node.left) if tree.reverse else (node.left, node.right)
+        aggregate = walk(first)
+        for _ in range(node.count):
+            aggregate = monoid.combine(aggregate, item)
+        aggregate = monoid.combine(aggregate, walk(last))
+        test.assertEqual(node.aggregate, aggregate)
+        return aggregate
+
+    walk(tree.root)
+    check_tree(test, tree)
+
+
+class T16_tree_aggregate(unittest.TestCase):
+    def test_tree_aggregate_0(self):
+        print("\n")
+        print("tree_aggregate_sum")
+        rng = random.Random(22)
+        tree = rb_tree(monoid=monoid(operator.add, 0))
+        expected = {}
+        for step in range(60):
+            choice = rng.random()
+            if choice < 0.3:
+                batch = rng.sample(range(500), rng.choice([1, 10, 200]))
+                batch = [key for key in batch if key not in expected]
+                tree.insert_many(batch, [key * 3 for key in batch])
+                expected.update((key, key * 3) for key in batch)
+            elif choice < 0.5:
+                key = rng.randrange(500)
+                tree[key] = step
+                expected[key] = step
+            elif choice < 0.7 and expected:
+                batch = rng.sample(sorted(expected), min(len(expected), rng.choice([1, 5, 150])))
+                tree.delete_many(batch)
+                for key in batch:
+                    del expected[key]
+            elif expected:
+                key = rng.choice(sorted(expected))
+                self.assertEqual(tree.pop(key), expected.pop(key))
+            check_aggregates(self, tree)
+            for _ in range(10):
+                lo, hi = sorted(rng.randrange(-10, 510) for _ in range(2))
+                inclusive = (rng.random() < 0.5, rng.random() < 0.5)
+                total = sum(value for key, value in expected.items()
+                            if (lo < key or inclusive[0] and lo == key) and (key < hi or inclusive[1] and key == hi))
+                self.assertEqual(tree.reduce_range(lo, hi, inclusive), total)
+            self.assertEqual(tree.reduce_range(), sum(expected.values()))
+            self.assertEqual(tree.reduce_range(None, 250), sum(value for key, value in expected.items() if key < 250))
+
+    def test_tree_aggregate_1(self):
+        print("\n")
+        print("tree_aggregate_monoids")
+        words = ['pear', 'fig', 'apple', 'kiwi', 'date', 'plum', 'lime']
+        joined = rb_tree(reverse=True, monoid=monoid(operator.add, '', lambda data, value: data[0]))
+        for word in words:
+            joined.insert(word)
+        check_aggregates(self, joined)
+        self.assertEqual(joined.reduce_range(), 'pplkfda')
+        self.assertEqual(joined.reduce_range('pear', 'date'), 'plkf')
+        self.assertEqual(joined.reduce_range('zebra', 'pineapple'), 'p')
+        lowest = rb_tree.from_sorted(range(10), [5, 3, 8, 1, 9, 2, 7, 6, 4, 0], monoid=monoid(min, math.inf))
+        self.assertEqual((lowest.reduce_range(0, 3), lowest.reduce_range(4, 9), lowest.reduce_range(10, 20)), (3, 2, math.inf))
+        counted = rb_tree(duplicates=rb_tree.COUNT, monoid=monoid(operator.add, 0, lambda data, value: data))
+        counted.insert_many([5] * 7 + [2, 9])
+        counted.insert(5)
+        counted.delete(9)
+        self.assertEqual((counted.reduce_range(), counted.reduce_range(5, 5, (True, True))), (42, 40))
+        counted.delete_many([5] * 3)
+        check_aggregates(self, counted)
+        self.assertEqual(counted.reduce_range(3), 25)
+        with self.assertRaises(ValueError):
+            rb_tree().reduce_range(0, 1)
+
+    def test_tree_aggregate_2(self):
+        print("\n")
+        print("tree_aggregate_split_join")
+        sums = monoid(operator.add, 0, lambda data, value: data)
+        tree = rb_tree.from_iterable(range(1000), monoid=sums)
+        check_aggregates(self, tree)
+        left, right = tree.split(400)
+        self.assertEqual((left.reduce_range(), right.reduce_range()), (sum(range(400)), sum(range(400, 1000))))
+        joined = rb_tree.join(left, 400, right)
+        joined.difference(range(0, 1000, 2))
+        joined.union(range(1000, 1100))
+        joined.intersection(range(500, 1050))
+        check_aggregates(self, joined)
+        self.assertEqual(joined.reduce_range(), sum(range(501, 1000, 2)) + sum(range(1000, 1050)))
+
+
+class T17_tree_priority_queue(unittest.TestCase):
+    def check_ends(self, tree):
+        # The cached ends must be the nodes a walk from the root finds
+        if len(tree):
+            self.assertIs(tree.peek_min(), tree.select(0))
+            self.assertIs(tree.peek_max(), tree.select(-1))
+        else:
+            self.assertIsNone(tree.peek_min())
+            self.assertIsNone(tree.peek_max())
+
+    def test_tree_priority_queue_0(self):
+        print("\n")
+        print("tree_priority_queue_random")
+        rng = random.Random(23)
+        tree = rb_tree()
+        expected = []
+        for step in range(300):
+            choice = rng.random()
+            if choice < 0.3:
+                item = rng.randrange(100)
+                tree.insert(item)
+                expected.append(item)
+            elif choice < 0.4:
+                batch = [rng.randrange(100) for _ in range(rng.choice([2, 50]))]
+                tree.insert_many(batch)
+                expected.extend(batch)
+            elif choice < 0.5 and expected:
+                item = rng.choice(expected)
+                tree.delete(item)
+                expected.remove(item)
+            elif choice < 0.6 and expected:
+                self.assertEqual(tree.pop_min(), (min(expected), None))
+                expected.remove(min(expected))
+            elif choice < 0.7 and expected:
+                self.assertEqual(tree.pop_max(), (max(expected), None))
+                expected.remove(max(expected))
+            elif choice < 0.8:
+                k = rng.choice([1, 3, 40])
+                expected.sort()
+                self.assertEqual(tree.pop_n_smallest(k), [(item, None) for item in expected[:k]])
+                del expected[:k]
+            elif choice < 0.9:
+                batch = [rng.randrange(100) for _ in range(rng.choice([2, 30]))]
+                tree.delete_many(batch)
+                for item in batch:
+                    if item in expected:
+                        expected.remove(item)
+            else:
+                left, right = tree.split(50)
+                self.check_ends(left)
+                self.check_ends(right)
+                tree = rb_tree.join(left, 50, right)
+                expected.append(50)
+                if expected:
+                    item = rng.choice([min(expected), max(expected)])
+                    tree.difference([item])
+                    expected = [other for other in expected if other != item]
+            self.check_ends(tree)
+            self.assertEqual(len(tree), len(expected))
+        check_tree(self, tree)
+
+    def test_tree_priority_queue_1(self):
+        print("\n")
+        print("tree_priority_queue_order_book")
+        # Bids best first, with equal prices served in the order they came in
+        bids = rb_tree(key=itemgetter(0), reverse=True)
+        for order in [(100, 'a'), (101, 'b'), (100, 'c'), (99, 'd'), (101, 'e')]:
+            bids.insert(order)
+        self.assertEqual(bids.peek_min().data, (101, 'b'))
+        self.assertEqual(bids.peek_max().data, (99, 'd'))
+        bids.delete((101, 'b'))
+        self.assertEqual([bids.pop_min()[0] for _ in range(3)], [(101, 'e'), (100, 'a'), (100, 'c')])
+        self.assertEqual(bids.pop_max(), ((99, 'd'), None))
+        with self.assertRaises(KeyError):
+            bids.pop_min()
+        with self.assertRaises(KeyError):
+            bids.pop_max()
+        self.assertEqual((bids.pop_n_smallest(3), bids.find_min(), bids.find_max()), ([], bids.sentinel, bids.sentinel))
+
+    def test_tree_priority_queue_2(self):
+        print("\n")
+        print("tree_priority_queue_counts")
+        tree = rb_tree.from_sorted([1, 1, 1, 2, 3, 3], list('abcdef'), duplicates=rb_tree.COUNT)
+        self.assertEqual(tree.pop_min(), (1, 'a'))
+        self.assertEqual(tree.pop_n_smallest(3), [(1, 'a'), (1, 'a'), (2, 'd')])
+        self.assertEqual((tree.count(3), tree.peek_min().data), (2, 3))
+        self.assertEqual(tree.pop_max(), (3, 'e'))
+        tree.insert_many([0] * 5 + [4])
+        self.check_ends(tree)
+        self.assertEqual(tree.pop_n_smallest(5), [(0, None)] * 5)
+        self.assertEqual(list(tree.keys()), [3, 4])
+        check_tree(self, tree)
+
+
+class T18_tree_handles(unittest.TestCase):
+    def test_tree_handles_0(self):
+        print("\n")
+        print("tree_handles_random")
+        rng = random.Random(24)
+        tree = rb_tree()
+        handles = []
+        for step in range(400):
+            choice = rng.random()
+            if choice < 0.4 or not handles:
+                node = tree.insert(rng.randrange(200), step)
+                self.assertEqual(node.value, step)
+                handles.append(node)
+            elif choice < 0.6:
+                node = handles.pop(rng.randrange(len(handles)))
+                tree.delete_node(node)
+            else:
+                node = rng.choice(handles)
+                # Small moves mostly stay in place, large ones relink the node
+                data = node.data + rng.choice([-1, 0, 1, -150, 150])
+                self.assertIs(tree.update_key(node, data), node)
+                self.assertEqual(node.data, data)
+            self.assertEqual(len(tree), len(handles))
+            if step % 20 == 0:
+                check_tree(self, tree)
+                self.assertEqual(list(tree.keys()), sorted(node.data for node in handles))
+                self.assertIs(tree.peek_min(), tree.select(0))
+                self.assertIs(tree.peek_max(), tree.select(-1))
+        self.assertEqual(sorted(map(id, tree)), sorted(map(id, handles)))
+
+    def test_tree_handles_1(self):
+        print("\n")
+        print("tree_handles_scheduler")
+        # Jobs by deadline, a waiting job moved up through its handle
+        jobs = rb_tree(key=itemgetter(0))
+        handles = {}
+        for deadline, name in [(30, 'c'), (10, 'a'), (20, 'b'), (40, 'd')]:
+            handles[name] = jobs.insert((deadline, name))
+        jobs.update_key(handles['d'], (5, 'd'))
+        jobs.update_key(handles['a'], (12, 'a'))
+        jobs.delete_node(handles['b'])
+        check_tree(self, jobs)
+        self.assertEqual(list(jobs.keys()), [(5, 'd'), (12, 'a'), (30, 'c')])
+        self.assertIs(jobs.peek_min(), handles['d'])
+        self.assertEqual(jobs.pop_min(), ((5, 'd'), None))
+        self.assertIs(jobs.find_key(30), handles['c'])
+
+    def test_tree_handles_2(self):
+        print("\n")
+        print("tree_handles_modes")
+        counted = rb_tree(duplicates=rb_tree.COUNT, monoid=monoid(operator.add, 0, lambda data, value: data))
+        first = counted.insert(4)
+        self.assertIs(counted.insert(4), first)
+        counted.insert_many([1, 9, 9])
+        counted.update_key(first, 10)
+        check_aggregates(self, counted)
+        self.assertEqual((list(counted.keys()), counted.reduce_range()), ([1, 9, 9, 10, 10], 39))
+        with self.assertRaises(ValueError):
+            counted.update_key(first, 9)
+        counted.delete_node(first)
+        self.assertEqual((counted.count(10), counted.reduce_range()), (1, 29))
+        ignored = rb_tree(duplicates=rb_tree.IGNORE)
+        self.assertIs(ignored.insert(3, 'a'), ignored.insert(3, 'b'))
+        self.assertEqual(ignored[3], 'a')
+        # Finding the node already holding the key takes no second search
+        calls = []
+        keyed = rb_tree(key=lambda data: calls.append(data) or data, duplicates=rb_tree.COUNT)
+        self.assertIs(keyed.insert(5), keyed.insert(5))
+        self.assertEqual(calls, [5, 5])
+
+
+
+class T19_tree_pool(unittest.TestCase):
+    def test_tree_pool_0(self):
+        print("\n")
+        print("tree_pool_churn")
+        rng = random.Random(25)
+        tree = rb_tree(pool_size=8)
+        plain = rb_tree()
+        inserts = 0
+        for step in range(2000):
+            if rng.random() < 0.5 or not len(tree):
+                data = rng.randrange(300)
+                tree.insert(data, step)
+                plain.insert(data, step)
+                inserts += 1
+            else:
+                data = tree.select(rng.randrange(len(tree))).data
+                self.assertEqual(tree.pop(data), plain.pop(data))
+            self.assertLessEqual(tree.pool_stats()['pooled'], 8)
+            if step % 100 == 0:
+                check_tree(self, tree)
+        self.assertEqual(list(tree.items()), list(plain.items()))
+        stats = tree.pool_stats()
+        self.assertEqual(stats['reused'] + stats['allocated'], inserts)
+        self.assertGreater(stats['reuse_rate'], 0.5)
+        self.assertEqual(plain.pool_stats(), {'reused': 0, 'allocated': 0, 'pooled': 0, 'capacity': 0, 'reuse_rate': 0.0})
+
+    def test_tree_pool_1(self):
+        print("\n")
+        print("tree_pool_paths")
+        tree = rb_tree.from_sorted(range(100), pool_size=50)
+        self.assertEqual(tree.pop_min(), (0, None))
+        self.assertEqual(tree.pop_max(), (99, None))
+        self.assertEqual(tree.delete_many(range(1, 61)), 60)
+        self.assertEqual(tree.pool_stats()['pooled'], 50)
+        recycled = tree._pool[-1]
+        self.assertIsNone(recycled.data)
+        self.assertIs(tree.insert(200), recycled)
+        check_tree(self, tree)
+        self.assertEqual(tree.pop_n_smallest(30), [(item, None) for item in range(61, 91)])
+        self.assertEqual(list(tree.keys()), list(range(91, 99)) + [200])
+        self.assertEqual(tree.pool_stats()['reused'], 1)
+        left, right = tree.split(95)
+        self.assertEqual((left.pool_size, right.pool_size), (50, 50))
+        counted = rb_tree(duplicates=rb_tree.COUNT, pool_size=4)
+        counted.insert_many([1, 1, 2])
+        counted.delete(1)
+        self.assertEqual(counted.pool_stats()['pooled'], 0)
+        counted.delete(1)
+        self.assertEqual(counted.pool_stats()['pooled'], 1)
+        counted.insert(3)
+        check_tree(self, counted)
+        self.assertEqual(counted.pool_stats()['reused'], 1)
+        with self.assertRaises(ValueError):
+            rb_tree(pool_size=-1)
+
+
 if __name__ == "__main__":
     unittest.main()